@@ -1,4 +1,4 @@
-function scan_voltages(x_start, y_start, x_end, y_end, steps, dwell)
+function scan_voltages(x_start, y_start, x_end, y_end, steps, dwell, first_row, progressive, target)
     -- Validate input parameters
     local count = 0
     local modbus_read = MB.R
@@ -20,11 +20,14 @@ function scan_voltages(x_start, y_start, x_end, y_end, steps, dwell)
     -- Calculate ticks per millisecond.
     local ticksPerMs = coreTicksPerSecond / 1000  -- 40000 ticks per ms
 
-    for y = 0, steps - 1 do
+    -- One row; lines start with a 0, or with the row index in progressive order
+    local function scan_row(y)
+        local tag = 0
+        if progressive then tag = y end
         local current_y = y_start + (y_step * y)
         current_y = math.max(-5, math.min(current_y, 5))
         modbus_write(30000, 3, current_y)
-        local row_counts = {0}
+        local row_counts = {tag}
         for x = 0, steps - 1 do
             local current_x = x_start + (x_step * x)
             current_x = math.max(-5, math.min(current_x, 5))
@@ -37,18 +40,31 @@ function scan_voltages(x_start, y_start, x_end, y_end, steps, dwell)
             -- Start dwell timing using core ticks
             local start_tick = LJ.Tick()
             local dwell_ticks = dwell * ticksPerMs   -- dwell is now in ms
-            -- modbus_read(3136, 1)  -- Optional flush read before timing dwell
-            while (LJ.Tick() - start_tick) < dwell_ticks do
-                -- Waiting for the dwell period in ms to pass
+            if target > 0 then
+                -- Adaptive dwell: integrate until target counts or the maximum dwell,
+                -- then report the count and the dwell actually spent (ms) as a pair
+                count = 0
+                local elapsed = 0
+                repeat
+                    count = count + modbus_read(3136, 1)
+                    elapsed = LJ.Tick() - start_tick
+                until count >= target or elapsed >= dwell_ticks
+                table.insert(row_counts, count)
+                table.insert(row_counts, elapsed / ticksPerMs)
+            else
+                -- modbus_read(3136, 1)  -- Optional flush read before timing dwell
+                while (LJ.Tick() - start_tick) < dwell_ticks do
+                    -- Waiting for the dwell period in ms to pass
+                end
+                
+                -- After the dwell period, read the counter value
+                count = modbus_read(3136, 1)
+                table.insert(row_counts, count)
             end
             
-            -- After the dwell period, read the counter value
-            count = modbus_read(3136, 1)
-            table.insert(row_counts, count)
-            
             if i == 25 then
                 print(table.concat(row_counts, " "))
-                row_counts = {0}
+                row_counts = {tag}
                 i = 0
             end
             -- -- Wait for the condition on reading 6022 to be met before continuing
@@ -56,13 +72,77 @@ function scan_voltages(x_start, y_start, x_end, y_end, steps, dwell)
                 -- Do nothing while condition holds
             end
         end
-        row_counts = {0}
+        -- A row that is not a multiple of 25 pixels ends on a shorter line, so lines never span rows
+        if i > 0 then
+            print(table.concat(row_counts, " "))
+            i = 0
+        end
+    end
+
+    -- Rows before first_row (in scan order) were already acquired (resumed scan).
+    -- The host ends a scan early by clearing the flag; it is checked between rows.
+    if progressive then
+        -- Every stride-th row, then the rows halfway between, down to stride 1
+        -- (same order as scan_io.row_order, computed on the fly to spare the Lua heap)
+        local stride = 1
+        while stride * 2 < steps do
+            stride = stride * 2
+        end
+        local k = 0
+        local first, every = 0, stride
+        while true do
+            for y = first, steps - 1, every do
+                if k >= first_row then
+                    if MB.readName("USER_RAM2_U16") ~= 1 then break end
+                    scan_row(y)
+                end
+                k = k + 1
+            end
+            if stride == 1 or MB.readName("USER_RAM2_U16") ~= 1 then break end
+            stride = math.floor(stride / 2)
+            first, every = stride, 2 * stride
+        end
+    else
+        for y = first_row, steps - 1 do
+            if MB.readName("USER_RAM2_U16") ~= 1 then break end
+            scan_row(y)
+        end
     end
     print("2D Voltage Scan Completed.")
     modbus_write(30002, 3, 0)
     modbus_write(30000, 3, 0)
 end
 
+function monitor_counts(x, y, dwell)
+    -- Park the galvos and report the counter every dwell period until the host clears the flag
+    local modbus_read = MB.R
+    local modbus_write = MB.W
+    local ticksPerMs = 40000000 / 1000
+    local dwell_ticks = dwell * ticksPerMs
+    -- Lines of about 100 ms of samples (at most 25), so slow rates still plot promptly
+    local per_line = math.max(1, math.min(25, math.floor(100 / dwell)))
+    modbus_write(30000, 3, math.max(-5, math.min(y, 5)))
+    modbus_write(30002, 3, math.max(-5, math.min(x, 5)))
+    local counts = {0}
+    local i = 0
+    while MB.readName("USER_RAM2_U16") == 2 do
+        modbus_read(3136, 1)
+        local start_tick = LJ.Tick()
+        while (LJ.Tick() - start_tick) < dwell_ticks do
+        end
+        table.insert(counts, modbus_read(3136, 1))
+        i = i + 1
+        if i == per_line then
+            print(table.concat(counts, " "))
+            counts = {0}
+            i = 0
+        end
+    end
+    print("Monitor Stopped.")
+    modbus_write(30002, 3, 0)
+    modbus_write(30000, 3, 0)
+end
+
 -- Throttle setting based on a rule of thumb: Throttle = (3 * NumLinesCode) + 20
 ThrottleSetting = 278
 
@@ -76,14 +156,17 @@ modbus_write(44136, 1, 7)
 -- Re-enable DIO16
 modbus_write(44036, 1, 1)
 
-local startx, starty, stopx, stopy, step, intT = 0, 0, 0, 0, 0, 0
+local startx, starty, stopx, stopy, step, intT, firstRow = 0, 0, 0, 0, 0, 0, 0
 MB.writeName("USER_RAM0_F32", 0.3)   -- Start amp x
 MB.writeName("USER_RAM1_F32", 0.3)   -- Start amp y
 MB.writeName("USER_RAM2_F32", -0.3)  -- End amp x
 MB.writeName("USER_RAM3_F32", -0.3)  -- End amp y
 MB.writeName("USER_RAM0_U16", 100)    -- Step count
 MB.writeName("USER_RAM4_F32", 1)      -- Dwell time in ms (set this value accordingly)
-MB.writeName("USER_RAM2_U16", 0)      -- Set Flag to trigger scan
+MB.writeName("USER_RAM5_F32", 0)      -- Target counts per pixel (0 = fixed dwell; else dwell is the maximum)
+MB.writeName("USER_RAM1_U16", 0)      -- First row to scan (0 = whole scan)
+MB.writeName("USER_RAM3_U16", 0)      -- Row order: 0 top to bottom, 1 progressive
+MB.writeName("USER_RAM2_U16", 0)      -- Set Flag to trigger scan (1), or monitor mode (2)
 
 while true do
     if MB.readName("USER_RAM2_U16") == 1 then
@@ -93,7 +176,13 @@ while true do
         stopy = MB.readName("USER_RAM3_F32")
         step = MB.readName("USER_RAM0_U16")
         intT = MB.readName("USER_RAM4_F32")
-        scan_voltages(startx, starty, stopx, stopy, step, intT)
+        firstRow = MB.readName("USER_RAM1_U16")
+        progressive = MB.readName("USER_RAM3_U16") == 1
+        targetCounts = MB.readName("USER_RAM5_F32")
+        scan_voltages(startx, starty, stopx, stopy, step, intT, firstRow, progressive, targetCounts)
         MB.writeName("USER_RAM2_U16", 0)  -- Reset trigger
+    elseif MB.readName("USER_RAM2_U16") == 2 then
+        -- Monitor mode: count at a fixed (X start, Y start) until the host writes 0
+        monitor_counts(MB.readName("USER_RAM0_F32"), MB.readName("USER_RAM1_F32"), MB.readName("USER_RAM4_F32"))
     end
 end
\ No newline at end of file
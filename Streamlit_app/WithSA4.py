@@ -1,24 +1,36 @@
 from datetime import datetime, timedelta
-import plotly.express as px
+from functools import partial
 import streamlit as st
-from PIL import Image
 import pandas as pd
 import numpy as np
-import subprocess
-import time
-import clr
 import os
-import wx
-import re
-clr.AddReference("C:\\Program Files\\Thorlabs\\Kinesis\\ThorLabs.MotionControl.KCube.InertialMotorCLI.dll")
-clr.AddReference("C:\\Program Files\\Thorlabs\\Kinesis\\Thorlabs.MotionControl.DeviceManagerCLI.dll")
-clr.AddReference("C:\\Program Files\\Thorlabs\\Kinesis\\Thorlabs.MotionControl.GenericMotorCLI.dll")
-from Thorlabs.MotionControl.KCube.InertialMotorCLI import *
-from Thorlabs.MotionControl.DeviceManagerCLI import *
-from Thorlabs.MotionControl.GenericMotorCLI import *
+# Hardware and GUI backends (Kinesis, wx) are loaded on first use through the driver registry
+import codec
+import drivers
+from scan_io import (parse_filename_2d, parse_filename_3d, filter_scans,
+                     spots_path, axes_from_meta, roi_from_box, as_counts,
+                     NO_ORIENTATION, compose_orientation, orient, orient_axes, ROW_ORDERS)
+from acquisition import make_job, parse_serials, estimate_seconds
+from adaptive import coarse_step
+from batch import iter_batch, load_scan_file
+from processing import run_pipeline, pipeline_axes, fingerprint
+from render import (array_key, array_stats, cached_figure, plot_heatmap_interactive, plot_heatmap_image,
+                    plot_count_rate, HOVER_SIZE, IMAGE_FORMATS)
+from localization import localize
+from registration import register
+from mosaic import MAX_MOSAIC_PIXELS, stitch, write_pyramid, load_pyramid, read_view, view_axes
+from export import submit_export, tiff_dtype, DTYPES as TIFF_DTYPES
+from station import STATION
+from monitor import MAX_SAMPLES, MONITOR
+from runner import acquisition_work, z_positions, STAGE_SERIAL
+from checkpoint import resume_point
+from watcher import watch
+from streamlit.runtime.scriptrunner import get_script_run_ctx
+from zstack import group_stacks, stack_label, open_volume, xy_slice, xz_slice, yz_slice, projections
 
 # --- Function to browse for an output directory using wxPython ---
 def browse_for_output_dir():
+    wx = drivers.load("wx")
     app = wx.App(False)
     dialog = wx.DirDialog(None, "Select Output Directory:", style=wx.DD_DEFAULT_STYLE | wx.DD_NEW_DIR_BUTTON)
     folder_path = ""
@@ -27,146 +39,235 @@ def browse_for_output_dir():
     dialog.Destroy()
     return folder_path
 
-# --- Function to load scan data from file ---
-def load_data_in_2x50_chunks(filename, step):
-    with open(filename, 'r') as f:
-        lines = [line.strip() for line in f if line.strip() and line.strip() != "2D Voltage Scan Completed."]
-
-    data_lines = []
-    for line in lines:
-        tokens = line.split()
-        if tokens and tokens[0] in ["0.000000", ".000000"]:
-            tokens = tokens[1:]
-        if not tokens:
-            continue
-        floats = [float(x) for x in tokens]
-        data_lines.append(floats)
-
-    if not data_lines:
-        raise ValueError("No valid data lines found in file.")
-
-    nums_per_line = len(data_lines[0])
-    for dl in data_lines:
-        if len(dl) != nums_per_line:
-            raise ValueError("Inconsistent number of floats per data line.")
-
-    if step % nums_per_line != 0:
-        raise ValueError("The step value must be an integer multiple of the number of floats per data line (after dummy removal).")
-    lines_per_chunk = step // nums_per_line
-    expected_lines = step * lines_per_chunk
-    if len(data_lines) < expected_lines:
-        raise ValueError(f"Expected at least {expected_lines} data lines, but got {len(data_lines)}.")
-
-    data_rows = []
-    for i in range(step):
-        start = i * lines_per_chunk
-        end = start + lines_per_chunk
-        row_values = []
-        for dl in data_lines[start:end]:
-            row_values.extend(dl)
-        data_rows.append(row_values)
-
-    data_array = np.array(data_rows, dtype=float)
-    return data_array
-
-# --- Function to create an interactive heatmap using Plotly Express ---
-def plot_heatmap_interactive(data_array, vmin=None, vmax=None, cmap="hot"):
-    fig = px.imshow(
-        data_array,
-        color_continuous_scale=cmap,
-        zmin=vmin,
-        zmax=vmax,
-        aspect="equal"
-    )
-    fig.update_xaxes(title_text="X Index")
-    fig.update_yaxes(title_text="Y Index")
-    fig.update_layout(autosize=True, width=800, height=800)
-    return fig
-
-# --- Function to parse file metadata from filename ---
-def parse_filename_2d(filename):
-    pattern = (r"^(.*?)_xs-([-+]?[0-9]*\.?[0-9]+)_ys-([-+]?[0-9]*\.?[0-9]+)_xe-([-+]?[0-9]*\.?[0-9]+)_"
-               r"ye-([-+]?[0-9]*\.?[0-9]+)_step-([0-9]+)_dw-([-+]?[0-9]*\.?[0-9]+)_"
-               r"([0-9]{8}_[0-9]{6})\.txt$")
-    match = re.match(pattern, filename)
-    if match:
-        try:
-            timestamp = datetime.strptime(match.group(8), "%Y%m%d_%H%M%S")
-        except Exception:
-            timestamp = None
-        return {
-            "prefix": match.group(1),
-            "xs": float(match.group(2)),
-            "ys": float(match.group(3)),
-            "xe": float(match.group(4)),
-            "ye": float(match.group(5)),
-            "step": int(match.group(6)),
-            "dw": float(match.group(7)),
-            "timestamp": timestamp,
-            "filename": filename
-        }
-    else:
-        return None
-
-def parse_filename_3d(fname):
-    # Remove extension
-    if fname.endswith('.txt'):
-        fname = fname[:-4]
-    # Match pattern (adjust as needed for your real pattern)
-    pattern = (r"^(?P<prefix>scan)"
-               r"_xs-(?P<xs>-?\d+\.?\d*)"
-               r"_ys-(?P<ys>-?\d+\.?\d*)"
-               r"_xe-(?P<xe>-?\d+\.?\d*)"
-               r"_ye-(?P<ye>-?\d+\.?\d*)"
-               r"_step-(?P<step>\d+)"
-               r"_dw-(?P<dwell>-?\d+\.?\d*)"
-               r"_z-(?P<z>-?\d+\.?\d*)"
-               r"_(?P<timestamp>\d{8}_\d{6})$")
-    m = re.match(pattern, fname)
-    if m:
-        meta = m.groupdict()
-        # Convert to correct types
-        meta['xs'] = float(meta['xs'])
-        meta['ys'] = float(meta['ys'])
-        meta['xe'] = float(meta['xe'])
-        meta['ye'] = float(meta['ye'])
-        meta['step'] = int(meta['step'])
-        meta['dwell'] = float(meta['dwell'])
-        meta['z'] = float(meta['z'])
-        meta['timestamp'] = datetime.strptime(meta['timestamp'], "%Y%m%d_%H%M%S")
-        meta['filename'] = fname + ".txt"
-        return meta
+# --- Function to build the preprocessing pipeline from sidebar/expander widgets ---
+def preprocessing_controls(key):
+    steps = []
+    with st.expander("Preprocessing"):
+        if st.checkbox("Hot-pixel removal", key=f"{key}_hot"):
+            threshold = st.number_input("Hot-pixel threshold (σ)", value=5.0, step=0.5, min_value=1.0, key=f"{key}_hot_t")
+            steps.append(("Hot-pixel removal", {"threshold": threshold}))
+        if st.checkbox("Background subtraction", key=f"{key}_bg"):
+            percentile = st.number_input("Background percentile", value=10.0, step=5.0, min_value=0.0,
+                                         max_value=100.0, key=f"{key}_bg_p")
+            steps.append(("Background subtraction", {"percentile": percentile}))
+        if st.checkbox("Gaussian smoothing", key=f"{key}_smooth"):
+            sigma = st.number_input("Sigma (pixels)", value=1.0, step=0.5, min_value=0.5, key=f"{key}_smooth_s")
+            steps.append(("Gaussian smoothing", {"sigma": sigma}))
+        if st.checkbox("Binning", key=f"{key}_bin"):
+            factor = st.selectbox("Bin factor", [2, 3, 4, 5, 8], key=f"{key}_bin_f")
+            steps.append(("Binning", {"factor": factor}))
+        if st.checkbox("Normalization", key=f"{key}_norm"):
+            mode = st.selectbox("Normalize to", ["max", "minmax", "zscore"], key=f"{key}_norm_m")
+            steps.append(("Normalization", {"mode": mode}))
+    return steps
+
+# --- Orthogonal-slice viewer for a Z-stack (reruns on its own when a slider moves) ---
+@st.fragment
+def zstack_viewer(folder, stack):
+    vol = open_volume(folder, stack)
+    z_vals = np.array([m["z"] for m in stack])
+    xy_axes = axes_from_meta(stack[0], vol.shape[1:])
+    l_ctrl, m_ctrl, r_ctrl = st.columns([1, 1, 1])
+    with l_ctrl:
+        z_idx = st.select_slider("Z", options=list(range(len(z_vals))), format_func=lambda i: f"{z_vals[i]}")
+    with m_ctrl:
+        y_idx = st.slider("Y row", 0, vol.shape[1] - 1, vol.shape[1] // 2)
+    with r_ctrl:
+        x_idx = st.slider("X column", 0, vol.shape[2] - 1, vol.shape[2] // 2)
+    if st.button("Export Stack as OME-TIFF"):
+        path = os.path.join(folder, os.path.splitext(stack[0]["filename"])[0] + "_stack.ome.tiff")
+        # Pages are read from the memmap one at a time inside the export worker
+        future = submit_export(path, lambda: (np.asarray(vol[i]) for i in range(vol.shape[0])),
+                               dtype=str(tiff_dtype(projections(vol)["xy"])),
+                               ome=(stack_label(stack), vol.shape[1:], vol.shape[0]))
+        st.session_state.setdefault("tiff_exports", []).append((path, future))
+        st.rerun()
+    if st.toggle("Maximum-intensity projection"):
+        mips = projections(vol)
+        xy, xz, yz = mips["xy"], mips["xz"], mips["yz"]
     else:
-        return None
-
-def init_stage(serial_no: str):
-    DeviceManagerCLI.BuildDeviceList()
-    device = KCubeInertialMotor.CreateKCubeInertialMotor(serial_no)
-    device.Connect(serial_no)
-    time.sleep(0.25)
-    if not device.IsSettingsInitialized():
-        device.WaitForSettingsInitialized(10000)
-    device.StartPolling(250)
-    time.sleep(0.25)
-    device.EnableDevice()
-    time.sleep(0.25)
-    cfg = device.GetInertialMotorConfiguration(serial_no)
-    settings = ThorlabsInertialMotorSettings.GetSettings(cfg)
-    chan = InertialMotorStatus.MotorChannels.Channel1
-    settings.Drive.Channel(chan).StepRate = 500
-    settings.Drive.Channel(chan).StepAcceleration = 100000
-    device.SetSettings(settings, True, True)
-    device.SetPositionAs(chan, 0)
-    st.write(f"Moving stage to Z = {100}")
-    device.MoveTo(chan, int(100), 60000)
-    st.write("Stage move complete.")
-    return device, chan
+        xy, xz, yz = xy_slice(vol, z_idx), xz_slice(vol, y_idx), yz_slice(vol, x_idx)
+    c_xy, c_xz, c_yz = st.columns([1, 1, 1])
+    with c_xy:
+        st.write("**XY**")
+        st.plotly_chart(plot_heatmap_interactive(xy, axes=xy_axes), use_container_width=True)
+    with c_xz:
+        st.write("**XZ**")
+        xz_axes = {"x": xy_axes["x"], "y": z_vals, "xlabel": "X (V)", "ylabel": "Z"}
+        st.plotly_chart(plot_heatmap_interactive(xz, axes=xz_axes, aspect="auto"), use_container_width=True)
+    with c_yz:
+        st.write("**YZ**")
+        yz_axes = {"x": xy_axes["y"], "y": z_vals, "xlabel": "Y (V)", "ylabel": "Z"}
+        st.plotly_chart(plot_heatmap_interactive(yz, axes=yz_axes, aspect="auto"), use_container_width=True)
+
+# --- Pannable mosaic overview that only loads the pyramid tiles in view ---
+@st.fragment
+def mosaic_viewer(out_dir, view_pixels=600):
+    info = load_pyramid(out_dir)
+    height, width = info["shapes"][0]
+    x_end = info["x0"] + info["dx"] * (width - 1)
+    y_end = info["y0"] + info["dy"] * (height - 1)
+    zooms = [2 ** k for k in range(info["levels"])]
+    # Controls with a single possible value are left out (st.slider refuses min == max)
+    zoom, cx, cy = 1, (info["x0"] + x_end) / 2, (info["y0"] + y_end) / 2
+    l_ctrl, m_ctrl, r_ctrl = st.columns([1, 2, 2])
+    with l_ctrl:
+        if len(zooms) > 1:
+            zoom = st.select_slider("Zoom", options=zooms, format_func=lambda z: f"{z}x")
+    with m_ctrl:
+        if x_end != info["x0"]:
+            cx = st.slider("X centre (V)", min(info["x0"], x_end), max(info["x0"], x_end), cx)
+    with r_ctrl:
+        if y_end != info["y0"]:
+            cy = st.slider("Y centre (V)", min(info["y0"], y_end), max(info["y0"], y_end), cy)
+    # View window in full-resolution pixels, then the coarsest level that still fills the view
+    half_h, half_w = height / zoom / 2, width / zoom / 2
+    row, col = (cy - info["y0"]) / info["dy"], (cx - info["x0"]) / info["dx"]
+    level = int(np.clip(np.floor(np.log2(max(2 * half_h, 2 * half_w) / view_pixels)), 0, info["levels"] - 1))
+    scale = 2 ** level
+    view, bounds = read_view(out_dir, info, level, int((row - half_h) // scale), int(np.ceil((row + half_h) / scale)),
+                             int((col - half_w) // scale), int(np.ceil((col + half_w) / scale)))
+    if view.size:
+        fig = plot_heatmap_interactive(view, vmin=info["vmin"], vmax=info["vmax"], axes=view_axes(info, level, bounds))
+        st.plotly_chart(fig, use_container_width=True)
+        st.caption(f"Pyramid level {level} ({view.shape[1]}x{view.shape[0]} px shown)")
+
+# --- Scan heatmap with box-select rescans ---
+# Box selections and the region inputs rerun only this fragment. A full rerun still
+# passes the (cached) figure through st.plotly_chart, which re-validates and
+# re-serializes it: about 6 ms for an 800 px image, 9 ms with hover. The browser
+# is not sent the unchanged figure again; Streamlit replaces it by a hash reference.
+@st.fragment
+def heatmap_view(fig, axes, meta, scanning, dw):
+    if axes is None:
+        st.plotly_chart(fig, use_container_width=True)
+        return
+    # Box-select a feature on the heatmap to rescan just that region
+    event = st.plotly_chart(fig, use_container_width=True, on_select="rerun",
+                            selection_mode="box", key="scan_heatmap")
+    boxes = event.selection.box if event else []
+    if boxes:
+        roi = roi_from_box(boxes[-1]["x"], boxes[-1]["y"], axes, meta)
+        st.markdown(f"**Selected region:** X {roi['xs']} → {roi['xe']} V, Y {roi['ys']} → {roi['ye']} V")
+        l_roi, r_roi = st.columns([1, 1], vertical_alignment="bottom")
+        with l_roi:
+            roi_step = st.number_input("Region Step (No. of Pixel)", value=100, step=25, min_value=25,
+                                       key="roi_step", disabled=scanning)
+            roi_time = timedelta(seconds=estimate_seconds(roi_step, dw))
+            st.markdown(f"**Estimated Region Scan Time:** {str(roi_time)}")
+        with r_roi:
+            if st.button("Rescan Region", disabled=scanning):
+                st.session_state["roi_job"] = {**roi, "step": int(roi_step)}
+                st.rerun()
+
+# --- Status of background TIFF exports (polls only while one is still writing) ---
+def export_status():
+    exports = st.session_state.setdefault("tiff_exports", [])
+    pending = any(not future.done() for _, future in exports)
+
+    def show():
+        for path, future in exports[-5:]:
+            name = os.path.basename(path)
+            if not future.done():
+                st.write(f"Writing {name}...")
+            elif future.exception() is not None:
+                st.error(f"Failed to save TIFF {name}: {future.exception()}")
+            else:
+                st.success(f"Saved TIFF to {path} ({future.result()[1]} pages)")
+                with open(path, "rb") as f:
+                    st.download_button(label=f"Download {name}", data=f, file_name=name,
+                                       mime="image/tiff", key=f"download_{path}")
+        # Once everything is written, rerun the page so the polling stops
+        if pending and all(future.done() for _, future in exports):
+            st.rerun()
+
+    st.fragment(show, run_every=1.0 if pending else None)()
+
+# --- Live acquisition status, the same in every browser session ---
+def acquisition_status():
+    running = STATION.snapshot()["running"]
+
+    def show():
+        snap = STATION.snapshot()
+        if snap["running"]:
+            who = "this session" if snap["owner"] == get_script_run_ctx().session_id else "another session"
+            st.markdown(f"**Scanning** ({who}): {snap['label']}")
+            st.progress(snap["fraction"])
+            st.text(snap["message"])
+        for level, message in snap["log"][-5:]:
+            (st.success if level == "success" else st.error)(message)
+        # Show each newly finished frame, from whichever session started the scan
+        frame = STATION.latest_frame()
+        if frame is not None and frame["version"] != st.session_state.get("frame_version"):
+            st.session_state["frame_version"] = frame["version"]
+            st.session_state['heatmap_data'] = frame["data"]
+            st.session_state['heatmap_meta'] = frame["meta"]
+            st.session_state['heatmap_path'] = frame["path"]
+            st.session_state.pop('spots', None)
+            st.rerun()
+        # Re-enable (or disable) the controls when a scan ends (or starts)
+        if snap["running"] != running:
+            st.rerun()
+
+    st.fragment(show, run_every=0.5 if running else 2.0)()
+
+# --- Preview of the scan in progress, missing rows filled from the acquired ones ---
+def scan_preview():
+    def show():
+        preview = STATION.live_preview()
+        if preview is None:
+            st.info("Waiting for the first rows...")
+            return
+        meta, image, rows = preview
+        fig = plot_heatmap_image(image, float(image.min()), max(float(image.max()), float(image.min()) + 1.0),
+                                 cmap="Gray", axes=axes_from_meta(meta, image.shape), size=500, hover=False)
+        st.plotly_chart(fig, use_container_width=True, key="scan_preview")
+        st.caption(f"{rows}/{meta['step']} rows ({meta.get('order', 'raster')} order)")
+
+    st.fragment(show, run_every=1.0)()
+
+# --- Rolling count-rate plot, redrawn at a bounded frame rate while the monitor runs ---
+MONITOR_FPS = 4
+
+def monitor_view():
+    def show():
+        view = MONITOR.snapshot()
+        if view is None:
+            st.info("Waiting for the first samples...")
+            return
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Current", f"{view['current']:,.0f} /s")
+        c2.metric("Mean", f"{view['mean']:,.0f} /s")
+        c3.metric("Max", f"{view['max']:,.0f} /s")
+        st.plotly_chart(plot_count_rate(view["t"], view["rate"], view["history"]), use_container_width=True,
+                        key="count_rate")
+        st.caption(f"X {view['x']} V, Y {view['y']} V, {1000 / view['dwell']:,.0f} samples/s, "
+                   f"{view['samples']:,} samples")
+        if view["tracks"]:
+            drift = f"{(view['x'] - view['x0']) * 1000:+.1f} mV X, {(view['y'] - view['y0']) * 1000:+.1f} mV Y"
+            z = f", Z {view['z']}" if view.get("z") is not None else ""
+            st.caption(f"Tracked {view['tracks']} times, drift {drift}{z}; last fit "
+                       f"{'ok' if view['track_ok'] else 'failed (position kept)'} in {view['track_seconds']:.2f} s")
+
+    st.fragment(show, run_every=1 / MONITOR_FPS if MONITOR.running else None)()
+
+# --- Reruns the page when scans appear in, change in or leave the Analysis folder ---
+def file_watch(index, version):
+    def check():
+        if index.poll() != version:
+            st.rerun()
+
+    st.fragment(check, run_every=2.0)()
+
 # --- Streamlit App Setup ---
 st.set_page_config(layout="wide", page_title="Qscope App", page_icon="qscopes.png")
 st.logo("New.png")
-if "scanning" not in st.session_state:
-    st.session_state["scanning"] = False
-scanning = st.session_state["scanning"]
+# The scanner is shared: controls are disabled in every session while any of them is scanning
+scanning = STATION.snapshot()["running"]
+# Optional local API (api_server.py) on the same station, so remote clients see the app's scans
+if os.environ.get("QSCOPE_API_PORT"):
+    import api_server
+    api_server.start_background(STATION, port=int(os.environ["QSCOPE_API_PORT"]))
 
 page = st.sidebar.selectbox("Select Page", ["Scan", "Analysis", "Single plot"])
 
@@ -209,6 +310,8 @@ if page == "Scan":
             start_z = st.number_input("Start Z Step", value=0.0, step=0.1, disabled=scanning)
             inc_z = st.number_input("Increment Z Step", value=0.1, step=0.1, disabled=scanning)
             stop_z = st.number_input("Stop Z Step", value=1.0, step=0.1, disabled=scanning)
+            if not drivers.available("kinesis"):
+                st.warning("The Thorlabs Kinesis software is not installed here, so the Z stage cannot be moved.")
 
         # Other scan parameters
         l_ctrl, r_ctrl = st.columns([1, 1], vertical_alignment="bottom")
@@ -219,10 +322,36 @@ if page == "Scan":
         with r_ctrl:
             dw = st.number_input("Dwell/P", value=1.0, step=0.5, min_value=1.0,
                                  help="Integration time per pixel", disabled=scanning)
-        dw_seconds = dw / 1000
-        total_seconds = (step_val ** 2) * dw_seconds * 1.65
+        scan_order = st.selectbox("Row Order", ROW_ORDERS, key="scan_order", disabled=scanning,
+                                  help="progressive scans a few rows spread over the field first, then the rows between them, and so on: "
+                                       "the whole field shows up coarsely within seconds and refines as the "
+                                       "scan goes on, so it can be stopped early.")
+        # Adaptive dwell: each pixel stops at a target count, so dim and empty pixels cost the most
+        adaptive_dwell = st.checkbox("Adaptive Dwell", key="adaptive_dwell", disabled=scanning,
+                                     help="Each pixel integrates until it has the target counts, with Dwell/P as the "
+                                          "maximum. The scan is saved in counts/s with the dwell spent per pixel "
+                                          "beside it (_dwell.txt).")
+        target = None
+        if adaptive_dwell:
+            target = st.number_input("Target Counts", value=100, step=10, min_value=1, disabled=scanning,
+                                     help="Counts per pixel; bright pixels reach it well before Dwell/P")
+        total_seconds = estimate_seconds(step_val, dw)
         estimated_time = timedelta(seconds=total_seconds)
-        st.markdown(f"**Estimated Scan Time:** {str(estimated_time)}")
+        st.markdown(f"**{'Maximum' if adaptive_dwell else 'Estimated'} Scan Time:** {str(estimated_time)}")
+
+        # Adaptive sampling: coarse pass, then full resolution only where there is signal
+        adaptive = st.checkbox("Adaptive Sampling", key="adaptive_scan", disabled=scanning or adaptive_dwell,
+                               help="Scan a coarse grid first, then rescan only the 25x25 pixel tiles "
+                                    "with bright or structured signal at full resolution.")
+        if adaptive and not adaptive_dwell:
+            l_ctrl, r_ctrl = st.columns([1, 1], vertical_alignment="bottom")
+            with l_ctrl:
+                coarse_factor = st.selectbox("Coarse Factor", [2, 4, 8], index=1, disabled=scanning)
+            with r_ctrl:
+                sensitivity = st.number_input("Threshold (σ)", value=3.0, step=0.5, min_value=0.5, disabled=scanning,
+                                              help="Tiles above background + threshold × noise are refined")
+            coarse_time = timedelta(seconds=estimate_seconds(coarse_step(step_val, coarse_factor), dw))
+            st.markdown(f"**Coarse Pass Time:** {str(coarse_time)} + refinement tiles")
 
         # Output settings
         st.markdown("**Output Settings**")
@@ -231,92 +360,147 @@ if page == "Scan":
             output_dir = st.text_input("Output Directory", value="data", disabled=scanning)
         with r_ctrl:
             if st.button("Browse", disabled=scanning):
-                selected_folder = browse_for_output_dir()
-                if selected_folder:
-                    st.session_state['output_dir'] = selected_folder
-                    st.success(f"Selected folder: {selected_folder}")
+                try:
+                    selected_folder = browse_for_output_dir()
+                except drivers.DriverUnavailable as e:
+                    st.error(f"{e} Type the output directory instead.")
                 else:
-                    st.warning("No folder selected.")
+                    if selected_folder:
+                        st.session_state['output_dir'] = selected_folder
+                        st.success(f"Selected folder: {selected_folder}")
+                    else:
+                        st.warning("No folder selected.")
         if 'output_dir' in st.session_state:
             output_dir = st.session_state['output_dir']
         filename_prefix = st.text_input("Filename Prefix", value="scan", disabled=scanning)
-
-        if st.button("Scan", disabled=scanning):
-            st.session_state["scanning"] = True
-            scanning = True
-            time.sleep(0.1)
+        device_serials = st.text_input("Device Serials", value="", disabled=scanning,
+                                       help="Comma-separated LabJack serial numbers. Leave empty to use the first "
+                                            "device found. With several devices a 2D scan is split into tiles "
+                                            "that are acquired in parallel.")
+        serials = parse_serials(device_serials)
+        if adaptive_dwell and len(serials) > 1:
+            st.warning(f"Adaptive dwell scans on one device; only {serials[0]} will be used.")
+            serials = serials[:1]
+
+        # An interrupted scan with the same parameters continues from its checkpoint
+        zs = z_positions(start_z, stop_z, inc_z) if scan_3d else [None]
+        slices_done, rows_done = resume_point(output_dir, [make_job(xs, ys, xe, ye, step_val, dw, filename_prefix, z,
+                                                                    scan_order, target) for z in zs])
+        resume = False
+        if slices_done or rows_done:
+            done = [f"{slices_done}/{len(zs)} slices"] * bool(slices_done) + [f"{rows_done}/{step_val} rows"] * bool(rows_done)
+            resume = st.checkbox(f"Resume interrupted scan ({', '.join(done)} done)", value=True, disabled=scanning,
+                                 help="Skip what is already on disk. Untick to scan everything again.")
+
+        start_scan = st.button("Scan", disabled=scanning)
+        # A region picked on the heatmap arrives as a pending job from the last rerun
+        roi_job = st.session_state.pop("roi_job", None)
+        if start_scan or roi_job:
+            if roi_job:
+                xs, ys, xe, ye, step_val = roi_job["xs"], roi_job["ys"], roi_job["xe"], roi_job["ye"], roi_job["step"]
+                st.info(f"Rescanning region X {xs}..{xe} V, Y {ys}..{ye} V at {step_val} px")
+                resume = False
             # Prepare Z positions and stage
-            z_positions = np.arange(start_z, stop_z+inc_z, inc_z) if scan_3d else [None]
-            if scan_3d:
-                device, chan = init_stage("97251223")
-                time.sleep(1)
-                
-
-            for z in z_positions:
-                if scan_3d:
-                    st.write(f"Moving stage to Z = {z}")
-                    device.MoveTo(chan, int(z), 60000)
-                    st.write("Stage move complete.")
-
-                args = ["-xs",str(xs),"-ys",str(ys),"-xe",str(xe),"-ye",str(ye),"-st",str(step_val),"-dw",str(dw)]
-                proc = subprocess.Popen([r"scanwitharg.exe"]+args, stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
-                pbar = st.progress(0); ptext = st.empty(); exp=None
-                while proc.poll() is None:
-                    try: lines=[ln.strip() for ln in open("lua_output.txt") if ln.strip() and ln.strip()!="2D Voltage Scan Completed."]
-                    except: lines=[]
-                    if lines and exp is None:
-                        toks = lines[0].split();
-                        if toks[0] in ["0.000000",".000000"]: toks=toks[1:]
-                        nppl=len(toks); lpC=step_val//nppl; exp=step_val*lpC
-                    if exp:
-                        cur=len(lines); frac=min(cur/exp,1.0)
-                        pbar.progress(frac); ptext.text(f"Z={z} {cur}/{exp} lines")
-                    time.sleep(0.2)
-                pbar.progress(1.0); ptext.text(f"Z={z} completed.")
-                proc.communicate()
-
-                # Load and autosave
-                try:
-                    data = load_data_in_2x50_chunks("lua_output.txt", step_val)
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    z_tag = f"_z-{z}" if scan_3d else ""
-                    filename = f"{filename_prefix}_xs-{xs}_ys-{ys}_xe-{xe}_ye-{ye}_step-{step_val}_dw-{dw}{z_tag}_{timestamp}.txt"
-                    save_dir = output_dir if os.path.isabs(output_dir) else os.path.join(os.getcwd(), output_dir)
-                    os.makedirs(save_dir, exist_ok=True)
-                    save_path = os.path.join(save_dir, filename)
-                    np.savetxt(save_path, data, fmt="%.6f")
-                    st.success(f"Data autosaved to {save_path}")
-                    st.session_state['heatmap_data'] = data
-                except Exception as e:
-                    st.error(f"Error during scan or autosave at Z={z}: {e}")
-
-            if scan_3d:
-                device.StopPolling(); device.Disconnect()
-
-            st.session_state["scanning"] = False
-            scanning = False
-            st.rerun()
+            jobs = [make_job(xs, ys, xe, ye, step_val, dw, filename_prefix, z, scan_order, target) for z in zs]
+            work = partial(acquisition_work, jobs=jobs, output_dir=output_dir, serials=serials,
+                           adaptive=(coarse_factor, sensitivity) if adaptive and not adaptive_dwell else None,
+                           stage_serial=STAGE_SERIAL if scan_3d else None, resume=resume)
+            label = f"{step_val}x{step_val} px, X {xs}..{xe} V, Y {ys}..{ye} V" + (f", {len(jobs)} slices" if scan_3d else "")
+            if STATION.start(get_script_run_ctx().session_id, label, work):
+                st.rerun()
+            else:
+                st.warning("The scanner is busy with another scan.")
+        if scanning and not MONITOR.running:
+            # The firmware finishes its current row; the checkpoint keeps the rest for a resume
+            if st.button("Stop Scan"):
+                STATION.request_stop()
+                st.info("Stopping after the current row...")
+        acquisition_status()
+
+        # Count-rate monitor: park the galvos on one spot and read the counter continuously
+        with st.expander("Count-Rate Monitor", expanded=MONITOR.running):
+            l_ctrl, r_ctrl = st.columns([1, 1])
+            with l_ctrl:
+                mon_x = st.number_input("Park X (V)", value=0.0, format="%.3f", key="mon_x", disabled=scanning)
+                mon_rate = st.number_input("Sample Rate (Hz)", value=100.0, min_value=1.0, max_value=1000.0,
+                                           step=10.0, key="mon_rate", disabled=scanning,
+                                           help="Counter reads per second; each sample integrates 1/rate s")
+            # The sample buffer is capped, so a fast rate keeps less history
+            max_history = min(3600, int(MAX_SAMPLES / mon_rate))
+            if st.session_state.get("mon_history", 0) > max_history:
+                st.session_state["mon_history"] = max_history
+            with r_ctrl:
+                mon_y = st.number_input("Park Y (V)", value=0.0, format="%.3f", key="mon_y", disabled=scanning)
+                mon_history = st.number_input("History (s)", value=60, min_value=5, max_value=max_history, step=10,
+                                              key="mon_history", disabled=scanning,
+                                              help=f"Seconds kept and plotted (at most {max_history:,} s at this "
+                                                   "sample rate); older samples are dropped")
+            # Drift correction: a small local scan and Gaussian fit between blocks of monitoring
+            track = st.checkbox("Track Emitter", key="mon_track", disabled=scanning,
+                                help="Every interval, scan a small window around the spot, fit the emitter "
+                                     "and resume monitoring on its new position.")
+            tracking = None
+            if track:
+                l_ctrl, r_ctrl = st.columns([1, 1])
+                with l_ctrl:
+                    track_span = st.number_input("Window (V)", value=0.1, min_value=0.005, step=0.01, format="%.3f",
+                                                 key="track_span", disabled=scanning)
+                    track_size = st.selectbox("Window (px)", [5, 7, 9, 11], index=1, key="track_size", disabled=scanning)
+                with r_ctrl:
+                    track_interval = st.number_input("Interval (s)", value=30.0, min_value=1.0, step=5.0,
+                                                     key="track_interval", disabled=scanning)
+                    track_dw = st.number_input("Track Dwell/P", value=1.0, min_value=1.0, step=0.5,
+                                               key="track_dw", disabled=scanning)
+                track_z = st.checkbox("Refocus Z Stage", key="track_z", disabled=scanning or not drivers.available("kinesis"),
+                                      help="Also scan the window one Z step below and above, and move the stage "
+                                           "to the brightest focus. Needs the Thorlabs Kinesis software.")
+                track_dz = st.number_input("Z Step", value=10, min_value=1, key="track_dz",
+                                           disabled=scanning) if track_z else None
+                tracking = {"span": track_span, "size": track_size, "dw": track_dw, "interval": track_interval,
+                            "stage_serial": STAGE_SERIAL if track_z else None, "dz": track_dz}
+                st.markdown(f"**Tracking Scan Time:** {estimate_seconds(track_size, track_dw) * (3 if track_z else 1):.2f} s "
+                            f"every {track_interval:g} s")
+            if MONITOR.running:
+                if st.button("Stop Monitor", use_container_width=True):
+                    STATION.request_stop()
+            elif st.button("Start Monitor", use_container_width=True, disabled=scanning):
+                work = partial(MONITOR.work, x=mon_x, y=mon_y, dwell=1000 / mon_rate, history=float(mon_history),
+                               tracking=tracking)
+                if STATION.start(get_script_run_ctx().session_id, f"Count-rate monitor at X {mon_x} V, Y {mon_y} V",
+                                 work):
+                    st.rerun()
+                else:
+                    st.warning("The scanner is busy with another scan.")
 
     with col_right:
         st.subheader("Transforms & Settings")
         if 'heatmap_data' in st.session_state:
-            orig = st.session_state['heatmap_data']
-            st.session_state["active_scan"] = orig.copy()
+            steps = preprocessing_controls("scan")
+            raw = st.session_state['heatmap_data']
+            orig = run_pipeline(raw, steps, input_key=array_key(raw)) if steps else raw
+            data_key = array_key(orig)
+            meta = st.session_state.get('heatmap_meta')
+            base_axes = pipeline_axes(axes_from_meta(meta, raw.shape), steps) if meta else None
+            # Only the orientation is stored; the displayed array is a view of the scan
+            orientation = st.session_state.setdefault("scan_orientation", NO_ORIENTATION)
                 
             spacer_left, btn_col, spacer_right = st.columns([1, 2, 1])
             with btn_col:
                 if st.button("Flip H",use_container_width=True):
-                    st.session_state["active_scan"] = np.fliplr(st.session_state["active_scan"])
+                    orientation = compose_orientation(orientation, "fliplr")
                 if st.button("Flip V",use_container_width=True):
-                    st.session_state["active_scan"] = np.flipud(st.session_state["active_scan"])
+                    orientation = compose_orientation(orientation, "flipud")
                 if st.button("↻ Rotate CW",use_container_width=True):
-                    st.session_state["active_scan"] = np.rot90(st.session_state["active_scan"], k=-1)
+                    orientation = compose_orientation(orientation, "rot_cw")
                 if st.button("↺ Rotate CCW",use_container_width=True):
-                    st.session_state["active_scan"] = np.rot90(st.session_state["active_scan"], k=1)
+                    orientation = compose_orientation(orientation, "rot_ccw")
                 if st.button("Reset Orientation",use_container_width=True):
-                    st.session_state["active_scan"] = orig.copy()
-            plot_data = st.session_state["active_scan"]
-            dmin, dmax = float(plot_data.min()), float(plot_data.max())
+                    orientation = NO_ORIENTATION
+            st.session_state["scan_orientation"] = orientation
+            plot_data = orient(orig, orientation)
+            plot_axes = orient_axes(base_axes, orientation) if base_axes else None
+            stats = array_stats(orig, data_key)
+            dmin, dmax = stats["min"], max(stats["max"], stats["min"] + 1.0)  # a blank scan still gets a range
             vmin, vmax = st.slider(
                 "Intensity range",
                 dmin, dmax,
@@ -332,56 +516,76 @@ if page == "Scan":
                 "Turbo" , "greys","Gray" # etc, pick any from https://plotly.com/python/builtin-colorscales/
             ]
             cmap = st.selectbox("Color Scheme", color_scales, index=color_scales.index("Gray"), key="scan_cmap")
+            render_fmt = st.selectbox("Heatmap Rendering", list(IMAGE_FORMATS), key="scan_render",
+                                      help="Colored on the server and sent as an 8-bit image at display size")
+            hover_values = st.checkbox("Show counts on hover", value=False, key="scan_hover",
+                                       help=f"Adds a value grid of at most {HOVER_SIZE}x{HOVER_SIZE} block means "
+                                            "to the figure for the readback")
+
+            with st.expander("Emitter Localization"):
+                loc_window = st.selectbox("ROI size (px)", [5, 7, 9, 11], index=1, key="loc_window")
+                loc_sens = st.number_input("Detection threshold (σ)", value=5.0, step=0.5, min_value=1.0, key="loc_sens")
+                if st.button("Find Emitters", use_container_width=True):
+                    spots = pd.DataFrame(localize(orig, base_axes, loc_window, loc_sens))
+                    st.session_state["spots"] = spots
+                    if "heatmap_path" in st.session_state:
+                        spots.to_csv(spots_path(st.session_state["heatmap_path"]), index=False)
+                        st.success(f"Saved {len(spots)} emitters to {spots_path(st.session_state['heatmap_path'])}")
+                if "spots" in st.session_state:
+                    st.write(f"**{len(st.session_state['spots'])} emitters**")
+                    st.dataframe(st.session_state["spots"], height=200)
         else:
             st.info("Run a scan to display transforms & settings.")
             # set defaults so col_mid won't error
             vmin = vmax = None
             cmap = "hot"
+            render_fmt, hover_values = "PNG", False
+        if 'heatmap_data' in st.session_state:
+            tiff_type = st.selectbox("TIFF Sample Type", TIFF_DTYPES, key="tiff_dtype",
+                                     help="auto picks the smallest lossless type (uint16, int32 or float32)")
         if st.button("Save as TIFF"):
-            try:
-                # 1) reload raw scan data
-                data_array = load_data_in_2x50_chunks("lua_output.txt", step_val)
-
-                # 2) normalize to 0–255
-                arr = data_array.astype(np.float32)
-                arr -= arr.min()
-                if arr.max() != 0:
-                    arr /= arr.max()
-                arr8 = (arr * 255).astype(np.uint8)
-
-                # 3) build PIL image
-                img = Image.fromarray(arr8, mode="L")
-
-                # 4) ensure output_dir exists
-                out_dir = st.session_state.get("output_dir", "data")
-                os.makedirs(out_dir, exist_ok=True)
-
-                # 5) save with timestamped name
+            if 'heatmap_data' not in st.session_state:
+                st.warning("Run a scan to export it.")
+            else:
+                # Export the raw counts as held in memory, with the scan parameters in the TIFF tags
                 ts = datetime.now().strftime("%Y%m%d_%H%M%S")
-                name = f"{filename_prefix}_raw_heatmap_{ts}.tiff"
-                path = os.path.join(out_dir, name)
-                img.save(path, format="TIFF")
-
-                st.success(f"Saved TIFF to {path}")
-
-                # 6) provide download link
-                with open(path, "rb") as f:
-                    st.download_button(
-                        label="Download Raw TIFF",
-                        data=f,
-                        file_name=name,
-                        mime="image/tiff"
-                    )
-            except Exception as e:
-                st.error(f"Failed to save TIFF: {e}")
+                path = os.path.join(st.session_state.get("output_dir", "data"), f"{filename_prefix}_raw_heatmap_{ts}.tiff")
+                meta = st.session_state.get('heatmap_meta')
+                future = submit_export(path, [st.session_state['heatmap_data']], metas=[meta], dtype=tiff_type)
+                st.session_state.setdefault("tiff_exports", []).append((path, future))
+        export_status()
     
     # --- MIDDLE: Interactive Heatmap using chosen cmap ---
     with col_mid:
+        if scanning and not MONITOR.running:
+            st.subheader("Live Preview")
+            scan_preview()
+        if MONITOR.running or MONITOR.params is not None:
+            st.subheader("Count Rate")
+            monitor_view()
         st.subheader("Interactive Heatmap")
         if 'heatmap_data' in st.session_state:
-            plot_data = st.session_state["active_scan"]
-            fig = plot_heatmap_interactive(plot_data, vmin=vmin, vmax=vmax, cmap=cmap)
-            st.plotly_chart(fig, use_container_width=True)
+            axes = plot_axes
+            spots = st.session_state.get("spots")
+            show_spots = axes is not None and spots is not None and "x_V" in spots
+
+            def build_heatmap():
+                fig = plot_heatmap_image(plot_data, vmin, vmax, cmap=cmap, axes=axes, fmt=render_fmt, hover=hover_values)
+                if show_spots:
+                    # Volts travel with the axes, so markers stay put through flips/rotations
+                    sx, sy = (spots["y_V"], spots["x_V"]) if axes["xlabel"].startswith("Y") else (spots["x_V"], spots["y_V"])
+                    fig.add_scatter(x=sx, y=sy, mode="markers", name="emitters",
+                                    marker=dict(symbol="circle-open", size=10, color="cyan"))
+                if axes is not None:
+                    fig.update_layout(dragmode="select")
+                return fig
+
+            # Reruns that change none of these (other buttons, widgets) reuse the built figure
+            view_key = (data_key, orientation, vmin, vmax, cmap, 800, render_fmt, hover_values,
+                        None if axes is None else (axes["x"][0], axes["x"][-1], axes["y"][0], axes["y"][-1]),
+                        fingerprint(spots[["x_V", "y_V"]].to_numpy()) if show_spots else None)
+            heatmap_view(cached_figure(view_key, build_heatmap), axes, st.session_state.get("heatmap_meta"),
+                         scanning, dw)
         else:
             st.info("Run a scan to display the heatmap.")
 
@@ -396,31 +600,35 @@ elif page == "Analysis":
     
     z_mode = st.radio("Filename mode", ["2D (no z in filename)", "3D (z in filename)"], index=1)
     
-    if st.button("Refresh File List"):
+    refresh = st.button("Refresh File List")
+    if refresh:
         if os.path.isdir(folder):
             st.success(f"Folder found: {folder}")
         else:
             st.error("Folder does not exist. Please enter a valid folder path.")
     
     if os.path.isdir(folder):
-        if z_mode == "3D (z in filename)":
-            txt_files = [f for f in os.listdir(folder) if f.endswith('.txt') and "_z-" in f]
-            parser = parse_filename_3d
-        else:
-            txt_files = [f for f in os.listdir(folder) if f.endswith('.txt') and "_z-" not in f]
-            parser = parse_filename_2d
-        
-        files_data = []
-        for f in txt_files:
-            meta = parse_filename(f)
-            if meta:
-                files_data.append(meta)
-                
+        three_d = z_mode == "3D (z in filename)"
+        parser = parse_filename_3d if three_d else parse_filename_2d
+        # The folder's index is shared by all sessions and only re-parses the files that changed
+        index = watch(folder)
+        version = index.poll(force=refresh)
+        # Off by default: each update reruns the page, which clears plotted files and resets the selection
+        if st.toggle("Live file list", value=False, key="analysis_live",
+                     help="Show new, changed and removed scans as they happen. Plotted files are cleared "
+                          "whenever the list updates, so leave this off while looking at an analysis."):
+            file_watch(index, version)
+        files_data = index.scans(three_d)
+
         if files_data:
             df_files = pd.DataFrame(files_data)
             st.write("### Found Scan Files", df_files)
             
             # --- Sidebar Filters ---
+            with st.sidebar:
+                analysis_steps = preprocessing_controls("analysis")
+                localize_files = st.checkbox("Localize emitters", key="analysis_localize",
+                                             help="Fit every emitter in the plotted files and save <file>_spots.csv next to each")
             st.sidebar.header("Filter Options")
             unique_prefixes = sorted(df_files["prefix"].unique().tolist())
             selected_prefix = st.sidebar.multiselect("Select Prefix", options=unique_prefixes, default=unique_prefixes)
@@ -444,17 +652,7 @@ elif page == "Analysis":
                 date_range = None
             
             # --- Apply Filters ---
-            filtered_df = df_files[
-                (df_files["prefix"].isin(selected_prefix)) &
-                (df_files["xs"] >= x_range[0]) & (df_files["xs"] <= x_range[1]) &
-                (df_files["ys"] >= y_range[0]) & (df_files["ys"] <= y_range[1])
-            ]
-            if date_range and isinstance(date_range, list) and len(date_range) == 2:
-                start_date, end_date = date_range
-                filtered_df = filtered_df[
-                    (filtered_df["timestamp"].dt.date >= start_date) & 
-                    (filtered_df["timestamp"].dt.date <= end_date)
-                ]
+            filtered_df = filter_scans(df_files, selected_prefix, x_range, y_range, date_range)
             
             st.write("### Filtered Files", filtered_df)
             
@@ -470,15 +668,149 @@ elif page == "Analysis":
                 if not selected_files:
                     st.warning("No files selected for plotting.")
                 else:
-                    for file in selected_files:
-                        file_path = os.path.join(folder, file)
+                    # Files are parsed in a process pool and plotted in the order they finish.
+                    # Any click (e.g. Cancel) reruns the script, which closes the batch and
+                    # cancels the files that haven't started loading yet.
+                    st.button("Cancel Loading")
+                    pbar = st.progress(0.0); ptext = st.empty(); stats_table = st.empty()
+                    stats_rows = []
+                    batch = iter_batch([os.path.join(folder, f) for f in selected_files])
+                    try:
+                        for n, (file_path, result, error) in enumerate(batch, start=1):
+                            file = os.path.basename(file_path)
+                            pbar.progress(n / len(selected_files)); ptext.text(f"Loaded {n}/{len(selected_files)} files")
+                            if error is not None:
+                                st.error(f"Failed to load or plot {file}: {error}")
+                                continue
+                            data, stats = result
+                            if analysis_steps:
+                                data = run_pipeline(data, analysis_steps)
+                            stats_rows.append(stats)
+                            stats_table.dataframe(pd.DataFrame(stats_rows))
+                            try:
+                                meta = parser(file)
+                                axes = pipeline_axes(axes_from_meta(meta, result[0].shape), analysis_steps)
+                                fig = plot_heatmap_interactive(data, axes=axes)
+                                if localize_files:
+                                    spots = pd.DataFrame(localize(data, axes))
+                                    spots.to_csv(spots_path(file_path), index=False)
+                                    fig.add_scatter(x=spots["x_V"], y=spots["y_V"], mode="markers", name="emitters",
+                                                    marker=dict(symbol="circle-open", size=10, color="cyan"))
+                                st.plotly_chart(fig, use_container_width=True)
+                                st.write(f"**Plotted file:** {file}")
+                                if localize_files:
+                                    st.write(f"{len(spots)} emitters saved to {spots_path(file_path)}")
+                            except Exception as e:
+                                st.error(f"Failed to load or plot {file}: {e}")
+                    finally:
+                        batch.close()
+
+            if z_mode == "3D (z in filename)":
+                with st.expander("Z-Stack Viewer"):
+                    stacks = group_stacks(filtered_df.to_dict("records"))
+                    if stacks:
+                        stack_idx = st.selectbox("Stack", range(len(stacks)), format_func=lambda i: stack_label(stacks[i]))
+                        # An expander's body runs even when collapsed, so the volume is only opened on request
+                        if st.toggle("Open viewer", value=False, key="zstack_open",
+                                     help="Converts the stack to a cached volume the first time it is opened"):
+                            zstack_viewer(folder, stacks[stack_idx])
+                    else:
+                        st.info("No Z-stacks in the filtered files.")
+
+            # Multi-page TIFF of the selected files, loaded and written page by page in the background
+            l_exp, r_exp = st.columns([1, 2], vertical_alignment="bottom")
+            with l_exp:
+                batch_type = st.selectbox("TIFF Sample Type", TIFF_DTYPES, key="batch_tiff_dtype")
+            with r_exp:
+                if st.button("Export Selected Files as Multi-page TIFF") and selected_files:
+                    paths = [os.path.join(folder, f) for f in selected_files]
+                    path = os.path.join(folder, "exports", f"batch_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tiff")
+                    future = submit_export(path, lambda: (load_scan_file(p) for p in paths),
+                                           metas=[parser(f) for f in selected_files], dtype=batch_type)
+                    st.session_state.setdefault("tiff_exports", []).append((path, future))
+            export_status()
+
+            # Mosaic: stitch the selected scans by their voltage windows
+            with st.expander("Mosaic"):
+                mosaic_root = os.path.join(folder, "mosaics")
+                if st.button("Build Mosaic from Selected Files"):
+                    scans = []
+                    batch = iter_batch([os.path.join(folder, f) for f in selected_files])
+                    try:
+                        for file_path, result, error in batch:
+                            if error is None:
+                                scans.append((parser(os.path.basename(file_path)), result[0]))
+                            else:
+                                st.error(f"Failed to load {os.path.basename(file_path)}: {error}")
+                    finally:
+                        batch.close()
+                    if scans:
                         try:
-                            data = np.loadtxt(file_path)
-                            fig = plot_heatmap_interactive(data)
-                            st.plotly_chart(fig, use_container_width=True)
-                            st.write(f"**Plotted file:** {file}")
-                        except Exception as e:
-                            st.error(f"Failed to load or plot {file}: {e}")
+                            with st.spinner("Stitching and writing tile pyramid..."):
+                                mosaic, grid = stitch(scans)
+                                out_dir = os.path.join(mosaic_root, datetime.now().strftime("%Y%m%d_%H%M%S"))
+                                info = write_pyramid(mosaic, grid, out_dir)
+                        except ValueError as e:
+                            st.error(f"Cannot build the mosaic: {e}")
+                        else:
+                            st.success(f"Mosaic of {len(scans)} scans ({grid['width']}x{grid['height']} px, "
+                                       f"{info['levels']} levels) written to {out_dir}")
+                            if grid["coarsened"] > 1.01:
+                                st.info(f"The finest scan's pitch would need more than {MAX_MOSAIC_PIXELS:,} pixels, "
+                                        f"so the mosaic was stitched {grid['coarsened']:.1f}x coarser.")
+                mosaics = sorted(os.listdir(mosaic_root), reverse=True) if os.path.isdir(mosaic_root) else []
+                if mosaics:
+                    chosen = st.selectbox("Open Mosaic", mosaics)
+                    # The expander's body runs even when collapsed, so tiles are only read on request
+                    if st.toggle("Open viewer", value=False, key="mosaic_open"):
+                        mosaic_viewer(os.path.join(mosaic_root, chosen))
+
+            # Drift registration: align the selected scans (or Z slices) to the first one
+            with st.expander("Drift Registration"):
+                whitening = st.slider("Spectral whitening", 0.0, 1.0, 0.25, 0.05,
+                                      help="1 = pure phase correlation; lower values are more robust on noisy scans")
+                if st.button("Register Selected Files"):
+                    order = "z" if "z" in filtered_df else "timestamp"
+                    reg_df = filtered_df[filtered_df["filename"].isin(selected_files)].sort_values(order)
+                    if len(reg_df) < 2:
+                        st.warning("Select at least two files to register.")
+                    else:
+                        paths = [os.path.join(folder, f) for f in reg_df["filename"]]
+                        loaded = {}
+                        batch = iter_batch(paths)
+                        try:
+                            for file_path, result, error in batch:
+                                if error is not None:
+                                    st.error(f"Failed to load {os.path.basename(file_path)}: {error}")
+                                else:
+                                    loaded[file_path] = result[0]
+                        finally:
+                            batch.close()
+                        paths = [p for p in paths if p in loaded]
+                        shapes = {loaded[p].shape for p in paths}
+                        if len(shapes) != 1:
+                            st.error(f"Scans must all have the same size to register, found {sorted(shapes)}.")
+                        elif len(paths) >= 2:
+                            shifts, aligned, average = register(np.stack([loaded[p] for p in paths]),
+                                                                key=(paths[0], shapes.pop()), whitening=whitening)
+                            meta = parser(os.path.basename(paths[0]))
+                            axes = axes_from_meta(meta, average.shape)
+                            px_x = abs(axes["x"][1] - axes["x"][0])
+                            px_y = abs(axes["y"][1] - axes["y"][0])
+                            reg_df = reg_df[reg_df["filename"].isin([os.path.basename(p) for p in paths])]
+                            drift = pd.DataFrame({
+                                "filename": reg_df["filename"].values,
+                                order: reg_df[order].values,
+                                "dx (px)": shifts[:, 1], "dy (px)": shifts[:, 0],
+                                "dx (V)": shifts[:, 1] * px_x, "dy (V)": shifts[:, 0] * px_y,
+                            })
+                            st.write("### Drift Over Time" if order == "timestamp" else "### Drift Through Stack")
+                            st.dataframe(drift)
+                            st.line_chart(drift.set_index(order)[["dx (px)", "dy (px)"]])
+                            st.download_button("Download Drift Table", drift.to_csv(index=False),
+                                               file_name="drift.csv", mime="text/csv")
+                            st.write(f"### Drift-Corrected Average of {len(paths)} Scans")
+                            st.plotly_chart(plot_heatmap_interactive(average, axes=axes), use_container_width=True)
         else:
             st.info("No scan files found with the expected naming pattern in the specified folder.")
     else:
@@ -489,16 +821,20 @@ elif page == "Analysis":
 # ============================
 elif page == "Single plot":
     st.title("Single Plot")
-    st.info("Upload a scan file (txt format) to display its heatmap plot.")
+    st.info("Upload a scan file (txt or compressed qsz) to display its heatmap plot.")
     
-    uploaded_file = st.file_uploader("Choose a scan file", type="txt")
+    uploaded_file = st.file_uploader("Choose a scan file", type=["txt", "qsz"])
     
     if uploaded_file is not None:
         try:
             # Ensure the pointer is at the beginning of the file
             uploaded_file.seek(0)
-            data = np.loadtxt(uploaded_file)
-            fig = plot_heatmap_interactive(data)
+            if uploaded_file.name.endswith(".qsz"):
+                data = codec.decode(uploaded_file.getvalue(), uploaded_file.name)
+            else:
+                data = as_counts(np.loadtxt(uploaded_file))
+            meta = parse_filename_2d(uploaded_file.name) or parse_filename_3d(uploaded_file.name)
+            fig = plot_heatmap_interactive(data, axes=axes_from_meta(meta, data.shape) if meta else None)
             st.plotly_chart(fig, use_container_width=True)
             st.success("Plot generated successfully.")
         except Exception as e:
@@ -0,0 +1,261 @@
+import os
+import queue
+import subprocess
+import sys
+import threading
+import time
+
+import numpy as np
+
+import drivers
+from scan_io import (DUMMY_TOKENS, END_MARKER, PROGRESSIVE, RASTER, as_counts, load_data_in_2x50_chunks,
+                     row_order, to_raster)
+
+SCANNER_EXE = r"scanwitharg.exe"
+SIMULATOR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "simulator.py")
+LUA_OUTPUT = "lua_output.txt"
+# Scanner backend: "scanwitharg" drives the LabJack, "simulator" a synthetic sample
+SCANNER = os.environ.get("QSCOPE_SCANNER", "scanwitharg")
+
+# --- Scanner backends: the command line that runs one scan ---
+drivers.register("scanwitharg", lambda: [SCANNER_EXE])
+drivers.register("simulator", lambda: [sys.executable, SIMULATOR])
+
+# --- Function to build a scan job from the scan parameters ---
+def make_job(xs, ys, xe, ye, step, dw, prefix="scan", z=None, order=RASTER, target=None):
+    # With ``target`` (counts) each pixel integrates until it has that many counts, ``dw`` at most
+    return {"xs": xs, "ys": ys, "xe": xe, "ye": ye, "step": int(step), "dw": dw,
+            "prefix": prefix, "z": z, "order": order, "target": target}
+
+# --- Function to cut a full-resolution tile out of a scan job ---
+def tile_job(job, r0, c0, tile):
+    # Tile voltages come from the parent's pixel grid, so tiles line up exactly
+    x = np.linspace(job["xs"], job["xe"], job["step"])
+    y = np.linspace(job["ys"], job["ye"], job["step"])
+    return {**job, "xs": round(float(x[c0]), 6), "xe": round(float(x[c0 + tile - 1]), 6),
+            "ys": round(float(y[r0]), 6), "ye": round(float(y[r0 + tile - 1]), 6), "step": tile}
+
+def scan_args(job, first_row=0):
+    # -y0 only when resuming, -po only for progressive order and -tc only with adaptive dwell.
+    # The app also passes -stop, so scanwitharg.exe must be built from this tree's src/scanwitharg.c
+    return ["-xs", str(job["xs"]), "-ys", str(job["ys"]), "-xe", str(job["xe"]),
+            "-ye", str(job["ye"]), "-st", str(job["step"]), "-dw", str(job["dw"])] + (
+            ["-y0", str(first_row)] if first_row else []) + (["-po"] if is_progressive(job) else []) + (
+            ["-tc", str(job["target"])] if is_adaptive_dwell(job) else [])
+
+def is_progressive(job):
+    return job.get("order") == PROGRESSIVE
+
+def is_adaptive_dwell(job):
+    return bool(job.get("target"))
+
+def row_width(job):
+    # Values per row in the firmware's output: a count per pixel, or (count, dwell ms) pairs
+    return job["step"] * (2 if is_adaptive_dwell(job) else 1)
+
+# --- Adaptive dwell: rows of interleaved (count, dwell ms) pairs ---
+def split_dwell(data):
+    """(counts, dwell in ms) of interleaved adaptive-dwell rows."""
+    data = np.asarray(data)
+    return as_counts(data[:, 0::2]), data[:, 1::2].astype(np.float32)
+
+def count_rate(data):
+    """Counts/s per pixel of interleaved adaptive-dwell rows (0 where no time was spent)."""
+    counts, dwell = split_dwell(data)
+    rate = np.zeros(dwell.shape, dtype=np.float32)
+    np.divide(counts * np.float32(1000), dwell, out=rate, where=dwell > 0)
+    return rate
+
+def estimate_seconds(step, dw):
+    # 1.65 is the measured per-pixel overhead factor of the firmware loop
+    return (step ** 2) * (dw / 1000) * 1.65
+
+# --- Function to count the data lines the firmware has written so far ---
+def read_progress(path, step, width=None):
+    try:
+        with open(path) as f:
+            lines = [ln.strip() for ln in f if ln.strip() and ln.strip() != END_MARKER]
+    except OSError:
+        return 0, None
+    if not lines:
+        return 0, None
+    toks = lines[0].split()
+    if toks[0] in DUMMY_TOKENS:
+        toks = toks[1:]
+    nppl = len(toks)
+    # A row is ceil(width / nppl) lines: full ones, then a shorter last one when it is not a multiple
+    expected = step * -(-(width or step) // nppl) if nppl else None
+    return len(lines), expected
+
+# --- Incremental reader: the completed rows of a scan that is still running ---
+class RowReader:
+    """Reads only what the firmware appended since the last call.
+
+    ``read()`` returns ``(first_row, rows)`` with every scan row completed
+    since the previous call (``rows`` is (n, width) float, n may be 0;
+    ``width`` is the job's ``row_width``).
+    Rows are counted in acquisition order; with ``tagged`` (progressive
+    order) every line starts with its row index, which is skipped.
+    """
+
+    def __init__(self, path, width, first_row=0, tagged=False):
+        self.path, self.width, self.tagged = path, width, tagged
+        self.offset, self.tail, self.values, self.row = 0, "", [], first_row
+
+    def read(self):
+        try:
+            with open(self.path, "rb") as f:
+                f.seek(self.offset)
+                chunk = f.read()
+        except OSError:
+            chunk = b""
+        self.offset += len(chunk)
+        lines = (self.tail + chunk.decode(errors="replace")).split("\n")
+        self.tail = lines.pop()  # a line still being written
+        for line in lines:
+            tokens = line.split()
+            if not tokens or line.strip() == END_MARKER:
+                continue
+            self.values.extend(tokens[1:] if self.tagged or tokens[0] in DUMMY_TOKENS else tokens)
+        n = len(self.values) // self.width
+        rows = np.array(self.values[:n * self.width], dtype=float).reshape(n, self.width)
+        del self.values[:n * self.width]
+        first, self.row = self.row, self.row + n
+        return first, rows
+
+# --- Devices are addressed by serial number; None means the first one LJM finds ---
+def parse_serials(text):
+    return [sn.strip() for sn in text.replace(";", ",").split(",") if sn.strip()]
+
+def device_output(serial):
+    # Each device streams into its own file so parallel scans don't clobber each other
+    return LUA_OUTPUT if serial is None else f"lua_output_{serial}.txt"
+
+# --- Function to run one scan job through scanwitharg.exe ---
+def run_scan(job, on_progress=None, poll_interval=0.2, serial=None, scanner=None, on_rows=None, first_row=0,
+             stop=None):
+    """Run ``job`` on the device and return the scan as a 2D array.
+
+    ``on_progress(done, expected)`` is called while the firmware streams
+    lines into the device's output file, and ``on_rows(first_row, rows)``
+    with each batch of newly completed rows. ``scanner`` names the
+    backend (default ``SCANNER``). With ``first_row`` the firmware starts
+    at that row and only rows ``first_row`` on are returned. Rows and
+    ``first_row`` count in acquisition order (``scan_io.row_order``); only
+    a whole scan comes back rearranged into the image. With adaptive
+    dwell rows hold (count, dwell ms) pairs (``split_dwell``). When ``stop()``
+    turns true the firmware ends the scan after its current row, and the
+    short output raises ``scan_io.IncompleteScan`` like any other incomplete scan.
+    """
+    output = device_output(serial)
+    # A previous scan's output would otherwise pass for progress until the firmware truncates it
+    try:
+        os.remove(output)
+    except FileNotFoundError:
+        pass
+    stop_path = os.path.abspath(output + ".stop")
+    args = scan_args(job, first_row) + ([] if serial is None else ["-sn", serial, "-o", output]) + (
+        [] if stop is None else ["-stop", stop_path])
+    width = row_width(job)
+    reader = RowReader(output, width, first_row, is_progressive(job)) if on_rows else None
+    proc = subprocess.Popen(drivers.load(scanner or SCANNER) + args, stdout=subprocess.PIPE,
+                            stderr=subprocess.PIPE, text=True)
+    stopping = False
+    while True:
+        running = proc.poll() is None
+        if running and stop is not None and not stopping and stop():
+            open(stop_path, "w").close()
+            stopping = True
+        done, expected = read_progress(output, job["step"], width)
+        if on_progress and expected:
+            # Rows before first_row count as done
+            on_progress(done + first_row * (expected // job["step"]), expected)
+        if reader:
+            first, rows = reader.read()
+            if len(rows):
+                on_rows(first, rows)
+        if not running:
+            break
+        time.sleep(poll_interval)
+    _, err = proc.communicate()
+    if os.path.exists(stop_path):
+        os.remove(stop_path)
+    if proc.returncode and "Unknown option" in err:
+        raise RuntimeError(f"{err.strip()}: scanwitharg.exe is older than the app; rebuild it from "
+                           "src/scanwitharg.c")
+    data = load_data_in_2x50_chunks(output, job["step"], job["step"] - first_row, job.get("order"), width)
+    return to_raster(data, row_order(job["step"], job["order"])) if is_progressive(job) and not first_row else data
+
+# --- Multi-device: one worker thread per device, all pulling from one job queue ---
+def device_worker(serial, jobs, results, run, stop):
+    while not stop.is_set():
+        try:
+            index, job = jobs.get_nowait()
+        except queue.Empty:
+            return
+        try:
+            results.put((index, serial, run(job, serial=serial), None))
+        except Exception as e:
+            results.put((index, serial, None, e))
+            return  # a device that failed takes no more jobs
+
+def run_parallel(jobs, serials, run=run_scan):
+    """Run independent ``jobs`` on all ``serials`` at once.
+
+    Yields ``(index, serial, data, error)`` as each job finishes, on
+    whichever device picked it up first, so faster devices take more jobs.
+    Closing the generator early (e.g. after a failed job) lets the running
+    jobs finish, starts no new ones and returns once every device is idle.
+    """
+    pending = queue.Queue()
+    for item in enumerate(jobs):
+        pending.put(item)
+    results = queue.Queue()
+    stop = threading.Event()
+    workers = [threading.Thread(target=device_worker, args=(serial, pending, results, run, stop), daemon=True)
+               for serial in serials]
+    for worker in workers:
+        worker.start()
+    try:
+        for _ in range(len(jobs)):
+            yield results.get()
+    finally:
+        # No device may still be scanning once the caller has given the station back
+        stop.set()
+        for worker in workers:
+            worker.join()
+
+def split_tiles(job, n_devices, min_side=25):
+    """Split a square scan into k x k square tiles, k*k >= ``n_devices``.
+
+    The firmware only scans squares, so k must divide the step for the
+    tiles to cover every pixel; tiles are at least ``min_side`` pixels.
+    When no such k exists the scan stays one tile (one device).
+    Returns ``[(r0, c0, tile_job), ...]``.
+    """
+    step = job["step"]
+    k = next((k for k in range(1, step // min_side + 1) if k * k >= n_devices and step % k == 0), 1)
+    side = step // k
+    return [(r * side, c * side, tile_job(job, r * side, c * side, side)) for r in range(k) for c in range(k)]
+
+def run_tiled(job, serials, on_tile=None, run=run_scan):
+    """Acquire ``job`` as tiles spread over several devices and merge them.
+
+    A step that cannot be split evenly is scanned whole on the first device.
+    """
+    tiles = split_tiles(job, len(serials))
+    image = None
+    results = run_parallel([t[2] for t in tiles], serials if len(tiles) > 1 else serials[:1], run)
+    try:
+        for n, (index, serial, data, error) in enumerate(results):
+            if error is not None:
+                raise RuntimeError(f"Tile {index} on device {serial} failed: {error}") from error
+            r0, c0, tile = tiles[index]
+            if image is None:
+                image = np.zeros((job["step"], job["step"]), dtype=np.uint32 if data.dtype.kind == "u" else np.float32)
+            image[r0:r0 + tile["step"], c0:c0 + tile["step"]] = data
+            if on_tile:
+                on_tile(n + 1, len(tiles), serial)
+    finally:
+        results.close()  # waits for the other devices to finish their current tile
+    return as_counts(image)
@@ -0,0 +1,75 @@
+import numpy as np
+from scipy import ndimage
+
+from acquisition import tile_job
+
+# The firmware prints counts in lines of 25, so refinement happens in 25x25 tiles
+# scanned as regular (smaller) jobs at the full-resolution pixel pitch.
+TILE = 25
+
+# --- Function to pick the coarse grid for the first pass ---
+def coarse_step(step, factor):
+    coarse = int(round(step / factor / TILE)) * TILE
+    return max(TILE, min(coarse, step - TILE))
+
+# --- Function to interpolate a coarse pass onto the fine grid ---
+def upsample(coarse, step, order=1):
+    # Both grids span the same start/end voltages, so fine pixel i sits at a
+    # fractional coarse index of i * (m - 1) / (n - 1).
+    m = coarse.shape[0]
+    frac = np.linspace(0, m - 1, step)
+    rows, cols = np.meshgrid(frac, frac, indexing="ij")
+    return ndimage.map_coordinates(coarse.astype(float), [rows, cols], order=order, mode="nearest")
+
+def robust_threshold(values, sensitivity):
+    med = np.median(values)
+    mad = 1.4826 * np.median(np.abs(values - med))
+    # Poisson noise floor so empty backgrounds don't flag every pixel
+    return med + sensitivity * max(mad, np.sqrt(max(med, 1.0)))
+
+# --- Function to decide which tiles are worth acquiring at full resolution ---
+def refinement_map(estimate, sensitivity=3.0, grow=1):
+    """Return a boolean (tiles x tiles) map of tiles to rescan.
+
+    A tile is refined when any pixel of the interpolated coarse image is
+    bright (count threshold) or sits on a strong edge (gradient threshold).
+    """
+    gy, gx = np.gradient(estimate)
+    grad = np.hypot(gx, gy)
+    flagged = (estimate > robust_threshold(estimate, sensitivity)) | (grad > robust_threshold(grad, sensitivity))
+    nt = estimate.shape[0] // TILE
+    tiles = flagged[:nt * TILE, :nt * TILE].reshape(nt, TILE, nt, TILE).any(axis=(1, 3))
+    if grow:
+        tiles = ndimage.binary_dilation(tiles, iterations=grow)
+    return tiles
+
+# --- Function to run a coarse pass plus full-resolution refinement tiles ---
+def run_adaptive_scan(job, run, coarse_factor=4, sensitivity=3.0, on_status=None):
+    """Acquire ``job`` adaptively with ``run(job) -> array``.
+
+    Returns the reconstructed image and a mask of the pixels that were
+    actually measured at full resolution.
+    """
+    step = job["step"]
+    if step <= TILE:
+        data = run(job)
+        return data, np.ones(data.shape, dtype=bool)
+
+    m = coarse_step(step, coarse_factor)
+    if on_status:
+        on_status(f"Coarse pass {m}x{m}", 0.0)
+    coarse = run({**job, "step": m})
+    image = upsample(coarse, step)
+
+    tiles = refinement_map(image, sensitivity)
+    todo = np.argwhere(tiles)
+    measured = np.zeros(image.shape, dtype=bool)
+    for n, (tr, tc) in enumerate(todo):
+        if on_status:
+            on_status(f"Refining tile {n + 1}/{len(todo)}", n / len(todo))
+        r0, c0 = tr * TILE, tc * TILE
+        image[r0:r0 + TILE, c0:c0 + TILE] = run(tile_job(job, r0, c0, TILE))
+        measured[r0:r0 + TILE, c0:c0 + TILE] = True
+    if on_status:
+        on_status(f"Sampled {measured.mean():.0%} of pixels at full resolution", 1.0)
+    return image.astype(np.float32), measured
@@ -0,0 +1,108 @@
+"""Test client for api_server.py: submit a scan and follow it live.
+
+    python api_client.py --status
+    python api_client.py --catalog
+    python api_client.py --submit job.json --save live.npy
+
+Without hardware, start the server with the simulator backend:
+
+    QSCOPE_SIMULATOR_SPEED=5 python api_server.py --scanner simulator
+"""
+import argparse
+import json
+import sys
+import urllib.error
+import urllib.request
+
+import numpy as np
+
+from api_server import KIND_FRAME, KIND_ROWS, decode
+from scan_io import row_order
+
+def request(base, path, body=None):
+    data = None if body is None else json.dumps(body).encode()
+    req = urllib.request.Request(base + path, data=data, headers={"Content-Type": "application/json"})
+    try:
+        with urllib.request.urlopen(req) as resp:
+            return resp.status, resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read()
+
+class LiveImage:
+    """Assembles the scan in progress from row messages."""
+
+    def __init__(self):
+        self.seq, self.image, self.rows, self.order = None, None, 0, None
+
+    def add(self, header, rows):
+        if header["seq"] != self.seq:
+            self.seq, self.rows = header["seq"], 0
+            self.image = np.zeros((header["height"], rows.shape[1]), dtype=rows.dtype)
+            self.order = row_order(header["height"], header["order"])
+        if rows.dtype.itemsize > self.image.dtype.itemsize or rows.dtype.kind != self.image.dtype.kind:
+            self.image = self.image.astype(np.promote_types(self.image.dtype, rows.dtype))
+        first = header["first_row"]
+        self.image[self.order[first:first + len(rows)]] = rows
+        self.rows = max(self.rows, first + len(rows))
+
+def follow(ws_url, on_status=None, on_rows=None, on_frame=None, until_idle=True):
+    """Read messages from the WebSocket; return once a run has finished (``until_idle``)."""
+    from websockets.sync.client import connect
+
+    seen_running = False
+    with connect(ws_url, max_size=None) as ws:
+        for message in ws:
+            if isinstance(message, str):
+                status = json.loads(message)
+                if on_status:
+                    on_status(status)
+                seen_running |= status["running"]
+                if until_idle and seen_running and not status["running"]:
+                    return
+                continue
+            header, rows = decode(message)
+            if header["kind"] == KIND_ROWS and on_rows:
+                on_rows(header, rows)
+            elif header["kind"] == KIND_FRAME and on_frame:
+                on_frame(header, rows)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", default="http://127.0.0.1:8765")
+    parser.add_argument("--status", action="store_true", help="print the acquisition status and exit")
+    parser.add_argument("--catalog", action="store_true", help="print the scan catalog and exit")
+    parser.add_argument("--submit", help="job file entry (JSON) to start")
+    parser.add_argument("--save", help="write the live-assembled image of the last scan to this .npy file")
+    args = parser.parse_args(argv)
+
+    if args.status or args.catalog:
+        code, body = request(args.url, "/api/status" if args.status else "/api/catalog")
+        print(json.dumps(json.loads(body), indent=2))
+        return 0 if code == 200 else 1
+    if args.submit:
+        with open(args.submit) as f:
+            code, body = request(args.url, "/api/scans", json.load(f))
+        print(f"{code} {body.decode()}")
+        if code != 202:
+            return 1
+
+    live = LiveImage()
+    last = {"message": None}
+
+    def show_status(status):
+        if status["message"] != last["message"]:
+            last["message"] = status["message"]
+            print(status["message"], flush=True)
+
+    def show_frame(header, rows):
+        print(f"Frame {header['seq']}: {rows.shape[1]} x {rows.shape[0]}, max {rows.max()}", flush=True)
+
+    follow(args.url.replace("http", "ws", 1) + "/ws", show_status, live.add, show_frame)
+    if live.image is not None:
+        print(f"Live image: {live.rows}/{live.image.shape[0]} rows")
+        if args.save:
+            np.save(args.save, live.image)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
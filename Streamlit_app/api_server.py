@@ -0,0 +1,240 @@
+"""Local HTTP + WebSocket API for remote clients.
+
+    python api_server.py [--port 8765] [--output-dir data] [--data-root DIR] [--scanner simulator]
+
+HTTP (JSON unless noted):
+    GET  /api/status    acquisition state (running, progress, messages, saved files)
+    GET  /api/catalog   rows of <output dir>/catalog.csv (``?folder=`` for another folder)
+    GET  /api/frame     last finished scan, as one binary message (below)
+    POST /api/scans     start a scan; the body is one job-file entry (see runner.py)
+
+Folders given by clients (``folder``, ``output_dir``) are taken relative to
+the data root (default: the output dir) and refused with 403 if they
+resolve outside it.
+
+WebSocket ``/ws``: binary messages for image data, text (JSON) for status.
+A binary message is a 28-byte little-endian header followed by the rows::
+
+    magic "QSCN" | kind u8 (1 rows, 2 frame) | dtype u8 (1 u8, 2 u16, 3 u32, 4 f32) | flags u16
+    seq u32 | first_row u32 | n_rows u32 | width u32 | height u32
+
+Counts are sent in the smallest unsigned type that holds them. Rows of
+the scan in progress arrive as the firmware completes them; a new
+``seq`` means a new scan. With flag 1 (progressive scan) ``first_row``
+counts in acquisition order: row k of the scan is image row
+``scan_io.row_order(height, "progressive")[k]``. Every client gets the same encoded bytes, so
+each extra viewer costs one socket write per message.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import struct
+import threading
+
+import numpy as np
+
+import runner
+from scan_io import PROGRESSIVE, RASTER, as_counts, read_catalog
+from station import Station
+
+MAGIC = b"QSCN"
+HEADER = struct.Struct("<4sBBHIIIII")
+KIND_ROWS, KIND_FRAME = 1, 2
+FLAG_PROGRESSIVE = 1
+DTYPE_CODES = {np.dtype("<u1"): 1, np.dtype("<u2"): 2, np.dtype("<u4"): 3, np.dtype("<f4"): 4}
+CODE_DTYPES = {code: dtype for dtype, code in DTYPE_CODES.items()}
+QUEUE_SIZE = 256  # messages a slow client may fall behind before it is dropped
+
+# --- Binary frame protocol ---
+def encode(kind, seq, first, rows, height, order=RASTER):
+    counts = as_counts(rows)
+    dtype = counts.dtype.newbyteorder("<") if counts.dtype.kind == "u" and counts.dtype.itemsize <= 4 \
+        else np.dtype("<f4")
+    body = np.ascontiguousarray(counts, dtype=dtype)
+    flags = FLAG_PROGRESSIVE if order == PROGRESSIVE else 0
+    return HEADER.pack(MAGIC, kind, DTYPE_CODES[dtype], flags, seq, first, body.shape[0], body.shape[1], height) + \
+        body.tobytes()
+
+def decode(message):
+    """Return (header dict, (n_rows, width) array) for one binary message."""
+    magic, kind, code, flags, seq, first, n, width, height = HEADER.unpack_from(message)
+    if magic != MAGIC:
+        raise ValueError("Not a frame message")
+    rows = np.frombuffer(message, dtype=CODE_DTYPES[code], offset=HEADER.size).reshape(n, width)
+    order = PROGRESSIVE if flags & FLAG_PROGRESSIVE else RASTER
+    return {"kind": kind, "seq": seq, "first_row": first, "height": height, "order": order}, rows
+
+def data_path(root, path):
+    """``path`` resolved under the directory ``root``; ValueError if it leads outside."""
+    root = os.path.realpath(root)
+    resolved = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, resolved]) != root:
+        raise ValueError(f"{path!r} is outside the data folder")
+    return resolved
+
+def status_message(snap):
+    keys = ["running", "owner", "label", "fraction", "message", "saved", "started", "finished"]
+    return json.dumps({"type": "status", **{k: snap[k] for k in keys}, "log": snap["log"][-10:]})
+
+def frame_message(frame):
+    data = frame["data"]
+    return encode(KIND_FRAME, frame["version"], 0, data, data.shape[0])
+
+# --- Fan-out: one pump per server turns station updates into messages for every client ---
+class Hub:
+    def __init__(self, station):
+        self.station = station
+        self.clients = set()
+
+    def catch_up(self):
+        # Everything a new client needs to show the current state
+        snap = self.station.snapshot()
+        messages = [status_message(snap)]
+        frame = self.station.latest_frame()
+        if frame is not None:
+            messages.append(frame_message(frame))
+        live = self.station.live_rows(0, 0)
+        if live is not None and len(live[3]):
+            seq, meta, first, rows = live
+            messages.append(encode(KIND_ROWS, seq, first, rows, meta["step"], meta.get("order")))
+        return messages
+
+    def broadcast(self, message):
+        for queue in list(self.clients):
+            try:
+                queue.put_nowait(message)
+            except asyncio.QueueFull:
+                self.clients.discard(queue)  # its handler closes the socket once the queue drains
+
+    async def pump(self):
+        snap = self.station.snapshot()
+        version, frame_version = snap["version"], snap["frame_version"]
+        live_seq, live_sent = snap["live_seq"], snap["live_rows"]
+        while True:
+            snap = await asyncio.to_thread(self.station.wait, version, 1.0)
+            if snap["version"] == version:
+                continue
+            version = snap["version"]
+            if snap["live_rows"] != live_sent or snap["live_seq"] != live_seq:
+                live = self.station.live_rows(live_seq, live_sent)
+                if live is not None:
+                    live_seq, meta, first, rows = live
+                    live_sent = first + len(rows)
+                    if len(rows):
+                        self.broadcast(encode(KIND_ROWS, live_seq, first, rows, meta["step"], meta.get("order")))
+            if snap["frame_version"] != frame_version:
+                frame = self.station.latest_frame()
+                frame_version = frame["version"]
+                self.broadcast(frame_message(frame))
+            self.broadcast(status_message(snap))
+
+# --- Starlette application ---
+def create_app(station, output_dir="data", scanner=None, data_root=None):
+    from starlette.applications import Starlette
+    from starlette.responses import JSONResponse, Response
+    from starlette.routing import Route, WebSocketRoute
+    from starlette.websockets import WebSocketDisconnect
+
+    hub = Hub(station)
+    data_root = os.path.realpath(data_root or output_dir)
+
+    async def status(request):
+        snap = station.snapshot()
+        return Response(status_message(snap), media_type="application/json")
+
+    async def catalog(request):
+        try:
+            folder = data_path(data_root, request.query_params.get("folder", output_dir))
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=403)
+        return JSONResponse(await asyncio.to_thread(read_catalog, folder))
+
+    async def frame(request):
+        latest = station.latest_frame()
+        if latest is None:
+            return JSONResponse({"error": "No scan yet"}, status_code=404)
+        return Response(frame_message(latest), media_type="application/octet-stream")
+
+    async def submit(request):
+        try:
+            scan = runner.scan_spec(await request.json(), {"output_dir": output_dir, "scanner": scanner})
+            runner.plan(scan)
+        except (ValueError, TypeError, KeyError) as e:
+            return JSONResponse({"error": f"Invalid scan: {e}"}, status_code=400)
+        try:
+            scan["output_dir"] = data_path(data_root, scan["output_dir"])
+        except ValueError as e:
+            return JSONResponse({"error": str(e)}, status_code=403)
+        if not runner.start(scan, station, owner="api"):
+            return JSONResponse({"error": "The scanner is busy with another scan."}, status_code=409)
+        return JSONResponse({"accepted": True, "jobs": len(runner.plan(scan))}, status_code=202)
+
+    async def stream(websocket):
+        await websocket.accept()
+        queue = asyncio.Queue(maxsize=QUEUE_SIZE)
+        for message in hub.catch_up():
+            queue.put_nowait(message)
+        hub.clients.add(queue)
+        receiver = asyncio.create_task(websocket.receive())  # completes when the client goes away
+        try:
+            while True:
+                getter = asyncio.create_task(queue.get())
+                done, _ = await asyncio.wait({getter, receiver}, return_when=asyncio.FIRST_COMPLETED)
+                if receiver in done:
+                    getter.cancel()
+                    break
+                message = getter.result()
+                if isinstance(message, bytes):
+                    await websocket.send_bytes(message)
+                else:
+                    await websocket.send_text(message)
+                if queue not in hub.clients and queue.empty():
+                    await websocket.close(code=1013)  # fell too far behind
+                    break
+        except WebSocketDisconnect:
+            pass
+        finally:
+            hub.clients.discard(queue)
+            receiver.cancel()
+
+    @contextlib.asynccontextmanager
+    async def lifespan(app):
+        pump = asyncio.create_task(hub.pump())
+        yield
+        pump.cancel()
+
+    return Starlette(routes=[Route("/api/status", status), Route("/api/catalog", catalog),
+                             Route("/api/frame", frame), Route("/api/scans", submit, methods=["POST"]),
+                             WebSocketRoute("/ws", stream)],
+                     lifespan=lifespan)
+
+def serve(station, host="127.0.0.1", port=8765, output_dir="data", scanner=None, data_root=None):
+    import uvicorn
+    uvicorn.run(create_app(station, output_dir, scanner, data_root), host=host, port=port, log_level="warning")
+
+_background = {}
+
+def start_background(station, host="127.0.0.1", port=8765, output_dir="data", scanner=None, data_root=None):
+    """Serve ``station`` from a daemon thread (once per port), e.g. next to the Streamlit app."""
+    if port in _background:
+        return _background[port]
+    import uvicorn
+    server = uvicorn.Server(uvicorn.Config(create_app(station, output_dir, scanner, data_root), host=host, port=port,
+                                           log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    _background[port] = server
+    return server
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local scan API server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--output-dir", default="data")
+    parser.add_argument("--data-root", default=None,
+                        help="folder clients may read and write under (default: the output dir)")
+    parser.add_argument("--scanner", default=None, help="scanner backend (default: QSCOPE_SCANNER or scanwitharg)")
+    args = parser.parse_args()
+    serve(Station(), args.host, args.port, os.path.abspath(args.output_dir), args.scanner, args.data_root)
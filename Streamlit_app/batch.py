@@ -0,0 +1,63 @@
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import codec
+from scan_io import as_counts
+
+_pool = None
+
+# --- Function to get the shared worker pool (started once per server process) ---
+def get_pool():
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=os.cpu_count())
+    return _pool
+
+# --- Function to parse a saved scan (.txt written by np.savetxt, or compressed .qsz) ---
+def load_scan_file(path):
+    if path.endswith(codec.EXTENSION):
+        return codec.read(path)
+    # One split over the whole file is much faster than np.loadtxt's per-line parsing
+    with open(path) as f:
+        text = f.read()
+    n_rows = sum(1 for line in text.splitlines() if line.strip())
+    values = np.array(text.split(), dtype=float)
+    if n_rows == 0 or values.size % n_rows:
+        raise ValueError(f"Ragged or empty scan file: {os.path.basename(path)}")
+    return as_counts(values.reshape(n_rows, -1))
+
+# --- Function run in the workers: load, decode and reduce one file ---
+def load_and_reduce(path):
+    data = load_scan_file(path)
+    stats = {
+        "file": os.path.basename(path),
+        "shape": f"{data.shape[0]}x{data.shape[1]}",
+        "dtype": str(data.dtype),
+        "min": float(data.min()),
+        "max": float(data.max()),
+        "mean": float(data.mean()),
+        "total counts": float(data.sum()),
+    }
+    return data, stats
+
+# --- Generator yielding results in completion order ---
+def iter_batch(paths, func=load_and_reduce):
+    """Run ``func`` over ``paths`` in the process pool.
+
+    Yields ``(path, result, error)`` as soon as each file is done. Closing
+    the generator (e.g. when Streamlit stops the script on a rerun)
+    cancels everything that has not started yet.
+    """
+    pool = get_pool()
+    futures = {pool.submit(func, p): p for p in paths}
+    try:
+        for fut in as_completed(futures):
+            try:
+                yield futures[fut], fut.result(), None
+            except Exception as e:
+                yield futures[fut], None, e
+    finally:
+        for fut in futures:
+            fut.cancel()
@@ -0,0 +1,78 @@
+"""Cold-start benchmark: module import times and the app's first render.
+
+Every measurement runs in a fresh interpreter, so nothing is already in
+``sys.modules``. Run from anywhere:
+
+    python benchmarks/startup.py --repeat 5 --output startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+APP = os.path.join(APP_DIR, "WithSA4.py")
+MODULES = ["numpy", "pandas", "plotly.express", "streamlit", "drivers", "scan_io", "acquisition",
+           "processing", "render", "localization", "registration", "mosaic", "export", "station", "zstack"]
+PAGES = ["Scan", "Analysis", "Single plot"]
+
+IMPORT_SNIPPET = """
+import time
+t = time.perf_counter()
+import {module}
+print(time.perf_counter() - t)
+"""
+
+RENDER_SNIPPET = """
+import time
+t = time.perf_counter()
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file({app!r}, default_timeout=120)
+at.run()
+first = time.perf_counter() - t
+if {page!r} != "Scan":
+    at.sidebar.selectbox[0].select({page!r})
+t = time.perf_counter()
+at.run()
+print(first, time.perf_counter() - t, len(at.exception))
+"""
+
+def _fresh(snippet):
+    out = subprocess.run([sys.executable, "-c", snippet], cwd=APP_DIR, capture_output=True, text=True, check=True)
+    return [float(v) for v in out.stdout.split()]
+
+def import_times(repeat=3):
+    # Median seconds to import each module in a new interpreter
+    return {m: statistics.median(_fresh(IMPORT_SNIPPET.format(module=m))[0] for _ in range(repeat))
+            for m in MODULES}
+
+def render_times(repeat=3):
+    """Per page: the first script run of a new session (imports included,
+    landing on the Scan page) and the rerun that shows the page."""
+    results = {}
+    for page in PAGES:
+        runs = [_fresh(RENDER_SNIPPET.format(app=APP, page=page)) for _ in range(repeat)]
+        if any(r[2] for r in runs):
+            raise RuntimeError(f"The {page} page raised while rendering")
+        results[page] = {"first_run": statistics.median(r[0] for r in runs),
+                         "rerun": statistics.median(r[1] for r in runs)}
+    return results
+
+def run(repeat=3):
+    return {"python": platform.python_version(), "platform": platform.platform(),
+            "imports": import_times(repeat), "render": render_times(repeat)}
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+    results = run(args.repeat)
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    print(text)
@@ -0,0 +1,75 @@
+"""Storage benchmark: size and decode speed of text vs compressed (.qsz) scans.
+
+    python benchmarks/storage.py
+    python benchmarks/storage.py --sizes 100 1000 --output storage.json
+
+Scans come from the simulator's synthetic sample. For each size it
+reports bytes per pixel in both formats and the best-of-``repeat`` times
+to write, to load whole, and to decode one row and one 100x100 tile.
+"""
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import codec
+import simulator
+from batch import load_scan_file
+from suite import synthetic_job, _timed
+from scan_io import save_scan
+
+SIZES = [100, 500, 1000, 2000, 4096]
+
+def run(sizes=SIZES, repeat=3):
+    workdir = tempfile.mkdtemp(prefix="qscope_storage_")
+    results = {}
+    try:
+        for n in sizes:
+            job = synthetic_job(n)
+            data = simulator.synthetic_scan(job, noise_seed=n)
+            runs = 1 if n >= 2000 else repeat
+            txt = save_scan(data, job, workdir, fmt="txt")
+            qsz = save_scan(data, job, workdir, fmt="qsz")
+            qfile = codec.QszFile(qsz)
+            mid, tile = n // 2, min(100, n)
+            results[n] = {
+                "txt_bytes_per_pixel": os.path.getsize(txt) / data.size,
+                "qsz_bytes_per_pixel": os.path.getsize(qsz) / data.size,
+                "ratio": os.path.getsize(txt) / os.path.getsize(qsz),
+                "txt_write": _timed(lambda: save_scan(data, job, workdir, fmt="txt"), runs),
+                "qsz_write": _timed(lambda: save_scan(data, job, workdir, fmt="qsz"), runs),
+                "txt_load": _timed(lambda: load_scan_file(txt), runs),
+                "qsz_load": _timed(lambda: load_scan_file(qsz), runs),
+                "qsz_row": _timed(lambda: qfile.rows(mid, mid + 1), repeat),
+                "qsz_tile": _timed(lambda: qfile.tile(mid - tile // 2, mid + tile // 2, 0, tile), repeat),
+            }
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="also write the results as JSON to this file")
+    args = parser.parse_args(argv)
+    results = run(args.sizes, args.repeat)
+    print(f"{'size':>6} {'txt B/px':>9} {'qsz B/px':>9} {'ratio':>6} {'txt load':>10} {'qsz load':>10} "
+          f"{'qsz row':>10} {'qsz tile':>10}")
+    for n, r in results.items():
+        print(f"{n:>6} {r['txt_bytes_per_pixel']:>9.2f} {r['qsz_bytes_per_pixel']:>9.2f} {r['ratio']:>6.1f} "
+              f"{r['txt_load'] * 1000:>8.1f}ms {r['qsz_load'] * 1000:>8.1f}ms "
+              f"{r['qsz_row'] * 1000:>8.2f}ms {r['qsz_tile'] * 1000:>8.2f}ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,215 @@
+"""Benchmarks on synthetic scans, compared against a stored baseline.
+
+    python benchmarks/suite.py                   # run and compare with this machine's baseline
+    python benchmarks/suite.py --save-baseline   # record the baseline for this machine
+    python benchmarks/suite.py --quick           # scans up to 500 px, small catalogs
+    python benchmarks/suite.py --startup         # also run the cold-start benchmark
+
+Scans come from the simulator's synthetic sample, so every run times the
+same data. Baselines are JSON files in ``benchmarks/baselines`` named
+after the machine; the run exits with status 1 when a case is slower
+than its baseline by more than the tolerance. Sizes on disk of the two
+scan formats are reported by ``benchmarks/storage.py``.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, APP_DIR)
+
+import numpy as np
+import pandas as pd
+import plotly.io as pio
+
+import acquisition
+import simulator
+from batch import load_scan_file
+from render import plot_heatmap_image, plot_heatmap_interactive
+from watcher import ScanIndex
+from scan_io import (append_catalog, axes_from_meta, filter_scans, list_scans, load_data_in_2x50_chunks,
+                     save_scan, scan_filename)
+
+SIZES = [25, 100, 500, 1000, 2000, 4000, 4096]
+QUICK_SIZES = [25, 100, 500]
+CATALOG_SIZES = [1000, 10000, 50000]
+QUICK_CATALOG_SIZES = [1000]
+SIMULATED_SCAN_MAX = 1000
+BASELINE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines")
+NOISE_FLOOR = 0.005  # seconds; smaller differences are never reported
+
+# --- Synthetic inputs ---
+def synthetic_job(step, prefix="bench"):
+    return acquisition.make_job(1.0, 1.0, -1.0, -1.0, step, 1.0, prefix)
+
+def make_catalog(folder, count, seed=0):
+    """``count`` empty files named like saved 2D scans, with varied
+    prefixes, windows, steps and timestamps, for the Analysis page filters."""
+    rng = np.random.default_rng(seed)
+    start = datetime(2025, 1, 1)
+    for i in range(count):
+        xs, ys = np.round(rng.uniform(-4, 4, size=2), 2)
+        half = rng.choice([0.1, 0.5, 1.0])
+        job = acquisition.make_job(xs, ys, round(xs - half, 2), round(ys - half, 2), int(rng.choice([50, 100, 200])),
+                                   1.0, f"sample{i % 7}")
+        stamp = (start + timedelta(seconds=int(i * 97))).strftime("%Y%m%d_%H%M%S")
+        open(os.path.join(folder, scan_filename(job, stamp)), "w").close()
+
+def _timed(func, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        t = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - t)
+    return best
+
+# --- Cases: each returns {name: best seconds} ---
+def bench_scan_paths(sizes, workdir, repeat):
+    results = {}
+    # First-use costs (Plotly validators, PIL codecs) are not part of any case
+    warm = np.ones((4, 4), dtype=np.uint8)
+    pio.to_json(plot_heatmap_interactive(warm), validate=False)
+    pio.to_json(plot_heatmap_image(warm, 0, 1), validate=False)
+    for n in sizes:
+        job = synthetic_job(n)
+        data = simulator.synthetic_scan(job, noise_seed=n)
+        runs = 1 if n >= 2000 else repeat
+        if n % simulator.LINE_LENGTH == 0:
+            stream = os.path.join(workdir, f"lua_output_{n}.txt")
+            simulator.write_lua_output(stream, data)
+            results[f"parse_lua_output/{n}"] = _timed(lambda: load_data_in_2x50_chunks(stream, n), runs)
+        out = os.path.join(workdir, f"saved_{n}")
+        os.makedirs(out, exist_ok=True)
+        path = save_scan(data, job, out)
+        results[f"save_scan/{n}"] = _timed(lambda: save_scan(data, job, out), runs)
+        results[f"load_scan/{n}"] = _timed(lambda: load_scan_file(path), runs)
+        packed = save_scan(data, job, out, fmt="qsz")
+        results[f"save_scan_qsz/{n}"] = _timed(lambda: save_scan(data, job, out, fmt="qsz"), runs)
+        results[f"load_scan_qsz/{n}"] = _timed(lambda: load_scan_file(packed), runs)
+        # What st.plotly_chart does per rerun: build the figure, then serialize it
+        axes = axes_from_meta(job, data.shape)
+        results[f"figure_interactive/{n}"] = _timed(
+            lambda: pio.to_json(plot_heatmap_interactive(data, axes=axes), validate=False), runs)
+        results[f"figure_image/{n}"] = _timed(
+            lambda: pio.to_json(plot_heatmap_image(data, 0, float(data.max()), axes=axes), validate=False), runs)
+    return results
+
+def bench_catalog(counts, workdir, repeat):
+    results = {}
+    for count in counts:
+        folder = os.path.join(workdir, f"catalog_{count}")
+        os.makedirs(folder)
+        make_catalog(folder, count)
+        results[f"catalog_list/{count}"] = _timed(lambda: list_scans(folder), repeat)
+        # The Analysis page's live file list, checked every 2 s while nothing changes
+        past = time.time_ns() - 60 * 10 ** 9  # an established folder, not one written a moment ago
+        os.utime(folder, ns=(past, past))
+        index = ScanIndex(folder)
+        index.poll(force=True)
+        results[f"catalog_watch_idle/{count}"] = _timed(lambda: (index.poll(), index.scans()), repeat)
+        index.close()
+        df = pd.DataFrame(list_scans(folder))
+        prefixes = ["sample1", "sample3", "sample4"]
+        dates = (datetime(2025, 1, 2).date(), datetime(2025, 1, 20).date())
+        results[f"catalog_filter/{count}"] = _timed(
+            lambda: filter_scans(df, prefixes, (-2.0, 3.0), (-3.0, 2.0), dates), repeat)
+    return results
+
+def bench_simulated_scan(sizes, workdir, repeat):
+    # Whole acquisition path: simulator process, progress polling, parse, autosave, catalog
+    results = {}
+    cwd = os.getcwd()
+    os.chdir(workdir)
+    try:
+        for n in sizes:
+            if n % simulator.LINE_LENGTH or n > SIMULATED_SCAN_MAX:
+                continue
+            job = synthetic_job(n)
+
+            def scan():
+                data = acquisition.run_scan(job, on_progress=lambda done, expected: None,
+                                            poll_interval=0.01, scanner="simulator")
+                append_catalog(save_scan(data, job, "scans"), job)
+
+            results[f"simulated_scan/{n}"] = _timed(scan, repeat)
+    finally:
+        os.chdir(cwd)
+    return results
+
+def run(sizes=SIZES, catalog_sizes=CATALOG_SIZES, repeat=3, startup=False):
+    workdir = tempfile.mkdtemp(prefix="qscope_bench_")
+    try:
+        results = {}
+        results.update(bench_scan_paths(sizes, workdir, repeat))
+        results.update(bench_catalog(catalog_sizes, workdir, repeat))
+        results.update(bench_simulated_scan(sizes, workdir, repeat))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if startup:
+        import startup as startup_bench
+        cold = startup_bench.run(repeat)
+        results.update({f"startup/import/{m}": t for m, t in cold["imports"].items()})
+        for page, times in cold["render"].items():
+            results.update({f"startup/render/{page}/{k}": t for k, t in times.items()})
+    return results
+
+# --- Baselines ---
+def machine():
+    return {"node": platform.node(), "platform": platform.platform(), "python": platform.python_version(),
+            "processor": platform.processor(), "cpus": os.cpu_count()}
+
+def baseline_path(node=None):
+    return os.path.join(BASELINE_DIR, f"{node or platform.node()}.json")
+
+def compare(results, baseline, tolerance):
+    """Cases slower than ``baseline * (1 + tolerance)``, as (name, baseline, now)."""
+    return [(name, baseline[name], now) for name, now in sorted(results.items())
+            if name in baseline and now > baseline[name] * (1 + tolerance) and now - baseline[name] > NOISE_FLOOR]
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--quick", action="store_true", help="small scans and catalogs only")
+    parser.add_argument("--repeat", type=int, default=3, help="runs per case; the fastest is kept")
+    parser.add_argument("--startup", action="store_true", help="include the cold-start benchmark")
+    parser.add_argument("--baseline", help="baseline file (default: baselines/<machine name>.json)")
+    parser.add_argument("--save-baseline", action="store_true", help="store this run as the baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown, 0.25 = 25%%")
+    parser.add_argument("--output", help="also write this run's results as JSON to this file")
+    args = parser.parse_args(argv)
+
+    results = run(QUICK_SIZES if args.quick else SIZES, QUICK_CATALOG_SIZES if args.quick else CATALOG_SIZES,
+                  args.repeat, args.startup)
+    report = {"machine": machine(), "date": datetime.now().isoformat(timespec="seconds"), "results": results}
+    for name, seconds in sorted(results.items()):
+        print(f"{name:45s} {seconds * 1000:10.2f} ms")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+
+    path = args.baseline or baseline_path()
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline saved to {path}")
+        return 0
+    if not os.path.exists(path):
+        print(f"No baseline at {path}; run with --save-baseline to record one.")
+        return 0
+    with open(path) as f:
+        baseline = json.load(f)["results"]
+    slower = compare(results, baseline, args.tolerance)
+    for name, before, now in slower:
+        print(f"REGRESSION {name}: {before * 1000:.2f} ms -> {now * 1000:.2f} ms ({now / before:.2f}x)")
+    if not slower:
+        print(f"No regressions against {path}")
+    return 1 if slower else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
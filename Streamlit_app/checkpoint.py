@@ -0,0 +1,187 @@
+import json
+import os
+
+import numpy as np
+
+from acquisition import is_adaptive_dwell, is_progressive, row_width, run_scan
+from scan_io import IncompleteScan, as_counts, row_order, scan_filename, to_raster
+
+# Checkpoints live next to the scans, one file per job (same parameters, same file)
+CHECKPOINT_DIR = ".checkpoints"
+HEADER = "# qscope checkpoint "
+SAVED = "# saved "
+RETRIES = 2  # automatic restarts from the last row when the scanner stops early
+
+def checkpoint_path(output_dir, job):
+    return os.path.join(output_dir, CHECKPOINT_DIR, scan_filename(job, "checkpoint")[:-4] + ".ckpt")
+
+def _job_header(job):
+    # Raster, fixed-dwell checkpoints keep the header they had before progressive order existed
+    header = {k: job[k] for k in ("xs", "ys", "xe", "ye", "step", "dw", "z")}
+    if is_progressive(job):
+        header["order"] = job["order"]
+    if is_adaptive_dwell(job):
+        header["target"] = job["target"]
+    return header
+
+# --- An append-only record of a scan's completed rows ---
+def read_checkpoint(path, job):
+    """(image, rows, saved path, valid bytes) of the checkpoint at ``path``.
+
+    ``rows`` counts the leading rows on disk in full; a line cut short by a
+    crash is ignored. A missing file, or one written for other parameters,
+    reads as empty (``valid`` 0).
+    """
+    width = row_width(job)
+    image, rows, saved, valid = np.zeros((job["step"], width), dtype=float), 0, None, 0
+    try:
+        with open(path, "rb") as f:
+            text = f.read().decode(errors="replace")
+    except FileNotFoundError:
+        return image, rows, saved, valid
+    lines = text.split("\n")
+    if not lines[0].startswith(HEADER) or json.loads(lines[0][len(HEADER):]) != _job_header(job):
+        return image, rows, saved, valid
+    valid = len(lines[0]) + 1
+    for line in lines[1:-1]:  # the last element is never a complete line
+        if line.startswith(SAVED):
+            saved = line[len(SAVED):]
+        else:
+            tokens = line.split()
+            if len(tokens) != width + 1 or int(tokens[0]) != rows:
+                break
+            image[rows] = np.array(tokens[1:], dtype=float)
+            rows += 1
+        valid += len(line.encode()) + 1
+    return image, rows, saved, valid
+
+class Checkpoint:
+    """Completed rows of one job, appended and fsynced as they arrive.
+
+    Each line is ``<row> <count> ... <count>`` (count, dwell pairs with
+    adaptive dwell), so the checkpoint resumes at
+    the first row that is not on disk in full. With ``resume=False`` an
+    existing checkpoint for the same job is started over. Rows are numbered
+    in acquisition order, which for a progressive scan is not top to bottom.
+    """
+
+    def __init__(self, path, job, resume=True):
+        self.path, self.job = path, job
+        self.image, self.rows, self.saved, valid = read_checkpoint(path if resume else os.devnull, job)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if valid:
+            # Drop a half-written last line so new rows start on a line of their own
+            with open(path, "r+b") as f:
+                f.truncate(valid)
+        else:
+            with open(path, "w") as f:
+                f.write(HEADER + json.dumps(_job_header(job)) + "\n")
+        self._file = None
+
+    def append(self, first, rows):
+        if first != self.rows:
+            raise ValueError(f"Checkpoint of {self.path} is at row {self.rows}, got row {first}")
+        if self._file is None:
+            self._file = open(self.path, "a")
+        fmt = "%d" + " %.15g" * row_width(self.job) + "\n"
+        self._file.write("".join(fmt % (first + i, *row) for i, row in enumerate(rows.tolist())))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self.image[first:first + len(rows)] = rows
+        self.rows += len(rows)
+
+    def mark_saved(self, save_path):
+        self.close()
+        with open(self.path, "a") as f:
+            f.write(SAVED + save_path + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.saved = save_path
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def complete(self):
+        return self.rows == self.job["step"]
+
+def peek_checkpoint(path, job):
+    """(rows, saved path) from the header and the last lines only, cheap enough for every rerun."""
+    try:
+        with open(path, "rb") as f:
+            header = f.readline().decode(errors="replace")
+            if not header.startswith(HEADER) or json.loads(header[len(HEADER):]) != _job_header(job):
+                return 0, None
+            start = f.tell()
+            tail = 2 * 17 * (row_width(job) + 1) + 4096  # two rows of counts and a saved line
+            f.seek(max(start, os.fstat(f.fileno()).st_size - tail))
+            clipped = f.tell() > start
+            lines = f.read().decode(errors="replace").split("\n")[1 if clipped else 0:-1]
+    except FileNotFoundError:
+        return 0, None
+    saved = None
+    for line in reversed(lines):
+        if line.startswith(SAVED):
+            saved = line[len(SAVED):]
+        elif len(line.split()) == row_width(job) + 1:
+            return int(line.split(maxsplit=1)[0]) + 1, saved
+    return 0, saved
+
+def remove_checkpoints(output_dir, jobs):
+    for job in jobs:
+        try:
+            os.remove(checkpoint_path(output_dir, job))
+        except FileNotFoundError:
+            pass
+
+def resume_point(output_dir, jobs):
+    """What a resume of ``jobs`` would skip: (slices already saved, rows of the next slice on disk)."""
+    saved = rows = 0
+    for job in jobs:
+        rows, path = peek_checkpoint(checkpoint_path(output_dir, job), job)
+        if path is None or not os.path.exists(path):
+            break
+        saved, rows = saved + 1, 0
+    return saved, rows
+
+# --- Scanning through a checkpoint ---
+def run_checkpointed(ckpt, on_progress=None, on_rows=None, on_status=None, retries=RETRIES, run=run_scan,
+                     stop=None, **kwargs):
+    """Acquire the rows ``ckpt`` is missing and return the whole scan.
+
+    When the scanner stops early (the 10 s no-data timeout, a USB hiccup)
+    the scan restarts from the last row on disk, up to ``retries`` times;
+    after that, or when ``stop()`` ended it, the checkpoint stays for a
+    later resume. Adaptive-dwell scans come back as interleaved
+    (count, dwell) rows, see ``acquisition.split_dwell``.
+    """
+    job, step = ckpt.job, ckpt.job["step"]
+    if ckpt.rows and on_rows:
+        on_rows(0, ckpt.image[:ckpt.rows])
+
+    def add_rows(first, rows):
+        ckpt.append(first, rows)
+        if on_rows:
+            on_rows(first, rows)
+
+    try:
+        for attempt in range(retries + 1):
+            if ckpt.complete:
+                break
+            if ckpt.rows and on_status:
+                on_status(f"resuming at row {ckpt.rows}/{step}", ckpt.rows / step)
+            try:
+                run(job, on_progress=on_progress, on_rows=add_rows, first_row=ckpt.rows,
+                    **kwargs, **({} if stop is None else {"stop": stop}))
+            except IncompleteScan:
+                pass  # the output ended early; the rows that did arrive are in the checkpoint
+            if stop is not None and stop():
+                break
+    finally:
+        ckpt.close()
+    if not ckpt.complete:
+        raise RuntimeError(f"Scan stopped at row {ckpt.rows} of {step}; resume to continue from there")
+    data = as_counts(ckpt.image)
+    return to_raster(data, row_order(step, job["order"])) if is_progressive(job) else data
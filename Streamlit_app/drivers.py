@@ -0,0 +1,73 @@
+import importlib
+import os
+from types import SimpleNamespace
+
+KINESIS_DIR = r"C:\Program Files\Thorlabs\Kinesis"
+KINESIS_DLLS = ["ThorLabs.MotionControl.KCube.InertialMotorCLI.dll",
+                "Thorlabs.MotionControl.DeviceManagerCLI.dll",
+                "Thorlabs.MotionControl.GenericMotorCLI.dll"]
+KINESIS_NAMESPACES = ["Thorlabs.MotionControl.KCube.InertialMotorCLI",
+                      "Thorlabs.MotionControl.DeviceManagerCLI",
+                      "Thorlabs.MotionControl.GenericMotorCLI"]
+KINESIS_NAMES = ["DeviceManagerCLI", "KCubeInertialMotor", "ThorlabsInertialMotorSettings", "InertialMotorStatus"]
+
+class DriverUnavailable(RuntimeError):
+    pass
+
+# --- Registry of optional backends, each loaded on first use ---
+_loaders = {}
+_loaded = {}
+_failed = {}  # name -> why it did not load; not retried until the name is registered again
+
+def register(name, loader):
+    """Register ``loader()``, which imports a backend and returns it.
+
+    Nothing is imported until ``load(name)``, so the app starts (and the
+    Analysis page works) on machines without the hardware software.
+    """
+    _loaders[name] = loader
+    _loaded.pop(name, None)
+    _failed.pop(name, None)
+
+def load(name):
+    if name in _loaded:
+        return _loaded[name]
+    if name not in _loaders:
+        raise DriverUnavailable(f"No driver named {name!r}")
+    if name in _failed:
+        raise DriverUnavailable(_failed[name])
+    try:
+        driver = _loaders[name]()
+    except Exception as e:
+        # Not only ImportError: pythonnet raises .NET exceptions for missing DLLs, RuntimeError without a runtime
+        _failed[name] = f"The {name} driver is not available on this machine: {e}"
+        raise DriverUnavailable(_failed[name]) from e
+    _loaded[name] = driver
+    return driver
+
+def available(name):
+    try:
+        load(name)
+    except DriverUnavailable:
+        return False
+    return True
+
+# --- Built-in backends ---
+def _load_kinesis():
+    # Thorlabs Kinesis .NET assemblies through pythonnet (Windows only)
+    import clr
+    for dll in KINESIS_DLLS:
+        clr.AddReference(os.path.join(KINESIS_DIR, dll))
+    modules = [importlib.import_module(ns) for ns in KINESIS_NAMESPACES]
+    try:
+        return SimpleNamespace(**{name: next(getattr(m, name) for m in modules if hasattr(m, name))
+                                  for name in KINESIS_NAMES})
+    except StopIteration:
+        raise ImportError("Kinesis assemblies are missing the inertial motor classes") from None
+
+def _load_wx():
+    import wx
+    return wx
+
+register("kinesis", _load_kinesis)
+register("wx", _load_wx)
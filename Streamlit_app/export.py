@@ -0,0 +1,85 @@
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from xml.sax.saxutils import quoteattr
+
+import numpy as np
+from PIL import Image, TiffImagePlugin
+
+IMAGE_DESCRIPTION = 270
+SOFTWARE = 305
+DTYPES = ["auto", "uint16", "int32", "float32"]
+# OME PixelType of each TIFF sample type (OME calls 32-bit floats "float")
+OME_PIXEL_TYPES = {np.dtype(np.uint16): "uint16", np.dtype(np.int32): "int32", np.dtype(np.float32): "float"}
+
+_executor = ThreadPoolExecutor(max_workers=1)
+
+# --- Function to pick a lossless TIFF sample type for a page ---
+def tiff_dtype(arr, dtype="auto"):
+    """Smallest type that holds ``arr`` without loss (Pillow writes 32-bit ints as signed)."""
+    if dtype != "auto":
+        return np.dtype(dtype)
+    integral = np.issubdtype(arr.dtype, np.integer) or bool(np.all(np.mod(arr, 1) == 0))
+    if integral and arr.min() >= 0:
+        return np.dtype(np.uint16) if arr.max() <= np.iinfo(np.uint16).max else np.dtype(np.int32)
+    if integral and arr.min() >= np.iinfo(np.int32).min and arr.max() <= np.iinfo(np.int32).max:
+        return np.dtype(np.int32)
+    return np.dtype(np.float32)
+
+def to_tiff_array(arr, dtype="auto"):
+    target = tiff_dtype(arr, dtype)
+    if np.issubdtype(target, np.integer):
+        info = np.iinfo(target)
+        if arr.min() < info.min or arr.max() > info.max:
+            raise ValueError(f"Values {arr.min()}..{arr.max()} don't fit in {target}")
+    return np.ascontiguousarray(arr, dtype=target)
+
+def ome_xml(name, shape, n_pages, dtype):
+    return ('<?xml version="1.0" encoding="UTF-8"?>'
+            '<OME xmlns="http://www.openmicroscopy.org/Schemas/OME/2016-06">'
+            f'<Image ID="Image:0" Name={quoteattr(str(name))}>'
+            f'<Pixels ID="Pixels:0" DimensionOrder="XYZCT" Type="{OME_PIXEL_TYPES[np.dtype(dtype)]}" '
+            f'SizeX="{shape[1]}" SizeY="{shape[0]}" SizeZ="{n_pages}" SizeC="1" SizeT="1">'
+            '<Channel ID="Channel:0:0" SamplesPerPixel="1"/>'
+            f'<TiffData IFD="0" PlaneCount="{n_pages}"/>'
+            '</Pixels></Image></OME>')
+
+def _describe(meta):
+    # Scan metadata as JSON in the ImageDescription tag
+    return json.dumps({k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in (meta or {}).items()},
+                      default=str)
+
+# --- Function to write one or many pages, streamed one page at a time ---
+def write_tiff(path, pages, metas=None, dtype="auto", ome=None):
+    """Write ``pages`` (any iterable of 2D arrays, e.g. a generator) to ``path``.
+
+    Each page is converted and written before the next one is pulled, so a
+    stack never has to sit in memory. ``metas`` (iterable, one dict per
+    page) go into each page's ImageDescription. With ``ome=(name, shape,
+    n_pages)`` the first page carries OME-XML instead, and every page must
+    share that shape and the explicit ``dtype``.
+    """
+    metas = iter(metas) if metas is not None else None
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    count = 0
+    with TiffImagePlugin.AppendingTiffWriter(path, new=True) as tf:
+        for page in pages:
+            arr = to_tiff_array(np.asarray(page), dtype)
+            info = TiffImagePlugin.ImageFileDirectory_v2()
+            info[SOFTWARE] = "Qscopes"
+            meta = next(metas, None) if metas is not None else None
+            if ome is not None and count == 0:
+                info[IMAGE_DESCRIPTION] = ome_xml(ome[0], ome[1], ome[2], arr.dtype)
+            elif meta is not None:
+                info[IMAGE_DESCRIPTION] = _describe(meta)
+            Image.fromarray(arr).save(tf, format="TIFF", tiffinfo=info)
+            tf.newFrame()
+            count += 1
+    return path, count
+
+# --- Background export: the UI thread only submits and polls ---
+def submit_export(path, pages, **kwargs):
+    """Run ``write_tiff`` in the export worker; ``pages`` may be a callable
+    returning the page iterable so that loading also happens off the UI thread."""
+    return _executor.submit(lambda: write_tiff(path, pages() if callable(pages) else pages, **kwargs))
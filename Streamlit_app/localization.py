@@ -0,0 +1,104 @@
+import numpy as np
+from scipy import ndimage
+
+from adaptive import robust_threshold
+
+PARAMS = ["amplitude", "x0", "y0", "sigma", "background"]
+
+# --- Function to find candidate emitters as local maxima above background ---
+def find_candidates(img, window=7, sensitivity=5.0):
+    """Return (rows, cols) of local maxima that can hold a full ROI."""
+    smooth = ndimage.gaussian_filter(img.astype(float), 1.0)
+    peaks = (smooth == ndimage.maximum_filter(smooth, size=window)) & (smooth > robust_threshold(smooth, sensitivity))
+    half = window // 2
+    peaks[:half, :] = peaks[-half:, :] = False
+    peaks[:, :half] = peaks[:, -half:] = False
+    return np.nonzero(peaks)
+
+# --- Function to cut all ROIs in one gather: (K, window, window) ---
+def extract_rois(img, rows, cols, window=7):
+    half = window // 2
+    d = np.arange(-half, half + 1)
+    return img[rows[:, None, None] + d[None, :, None], cols[:, None, None] + d[None, None, :]].astype(float)
+
+# --- Batched 2D Gaussian fit (Levenberg-Marquardt on all ROIs at once) ---
+def _model_and_jacobian(p, xx, yy):
+    a, x0, y0, s, b = (p[:, i, None, None] for i in range(5))
+    dx, dy = xx - x0, yy - y0
+    g = np.exp(-(dx ** 2 + dy ** 2) / (2 * s ** 2))
+    model = a * g + b
+    jac = np.stack([g, a * g * dx / s ** 2, a * g * dy / s ** 2,
+                    a * g * (dx ** 2 + dy ** 2) / s ** 3, np.ones_like(g)], axis=-1)
+    k = p.shape[0]
+    return model.reshape(k, -1), jac.reshape(k, -1, 5)
+
+def fit_gaussians(rois, iterations=30):
+    """Fit ``background + amplitude * exp(-r^2 / 2 sigma^2)`` to every ROI.
+
+    ``rois`` is (K, w, w). Each iteration solves all K 5x5 normal equations
+    with one batched ``np.linalg.solve`` instead of one curve_fit per spot.
+    Returns (K, 5) parameters in ``PARAMS`` order (positions relative to
+    the ROI centre) and the final RMS residual per spot.
+    """
+    k, w, _ = rois.shape
+    half = w // 2
+    yy, xx = np.mgrid[-half:half + 1, -half:half + 1].astype(float)
+    data = rois.reshape(k, -1)
+
+    # Initial guess: border median as background, intensity-weighted centroid
+    border = np.concatenate([rois[:, 0], rois[:, -1], rois[:, 1:-1, 0], rois[:, 1:-1, -1]], axis=1)
+    b0 = np.median(border, axis=1)
+    weights = np.clip(rois - b0[:, None, None], 0, None) + 1e-9
+    total = weights.sum(axis=(1, 2))
+    p = np.stack([rois.max(axis=(1, 2)) - b0,
+                  (weights * xx).sum(axis=(1, 2)) / total,
+                  (weights * yy).sum(axis=(1, 2)) / total,
+                  np.full(k, 1.5), b0], axis=1)
+
+    lam = np.full(k, 1e-2)
+    model, jac = _model_and_jacobian(p, xx, yy)
+    cost = ((data - model) ** 2).sum(axis=1)
+    for _ in range(iterations):
+        r = data - model
+        jtj = jac.transpose(0, 2, 1) @ jac
+        jtr = (jac.transpose(0, 2, 1) @ r[..., None])[..., 0]
+        damped = jtj + lam[:, None, None] * np.diagonal(jtj, axis1=1, axis2=2)[:, :, None] * np.eye(5)
+        step = np.linalg.solve(damped + 1e-12 * np.eye(5), jtr[..., None])[..., 0]
+        trial = p + step
+        trial[:, 3] = np.clip(np.abs(trial[:, 3]), 0.3, w)
+        t_model, t_jac = _model_and_jacobian(trial, xx, yy)
+        t_cost = ((data - t_model) ** 2).sum(axis=1)
+        better = t_cost < cost
+        p = np.where(better[:, None], trial, p)
+        model = np.where(better[:, None], t_model, model)
+        jac = np.where(better[:, None, None], t_jac, jac)
+        cost = np.where(better, t_cost, cost)
+        lam = np.where(better, lam / 3, lam * 3)
+    return p, np.sqrt(cost / data.shape[1])
+
+# --- Function to localize all emitters in a scan ---
+def localize(img, axes=None, window=7, sensitivity=5.0):
+    """Detect and fit every emitter in ``img``.
+
+    Returns a dict of equal-length columns (pixel positions, and volts when
+    ``axes`` from ``scan_io.axes_from_meta`` are given).
+    """
+    rows, cols = find_candidates(img, window, sensitivity)
+    columns = {"x_px": np.empty(0), "y_px": np.empty(0), "amplitude": np.empty(0),
+               "sigma_px": np.empty(0), "background": np.empty(0), "rms_residual": np.empty(0)}
+    if len(rows):
+        p, rms = fit_gaussians(extract_rois(img, rows, cols, window))
+        half = window // 2
+        # Drop fits that wandered out of their ROI or collapsed
+        ok = (np.abs(p[:, 1]) <= half) & (np.abs(p[:, 2]) <= half) & (p[:, 0] > 0)
+        columns = {"x_px": cols[ok] + p[ok, 1], "y_px": rows[ok] + p[ok, 2], "amplitude": p[ok, 0],
+                   "sigma_px": p[ok, 3], "background": p[ok, 4], "rms_residual": rms[ok]}
+    if axes is not None:
+        x, y = np.asarray(axes["x"]), np.asarray(axes["y"])
+        dx = (x[-1] - x[0]) / (len(x) - 1)
+        dy = (y[-1] - y[0]) / (len(y) - 1)
+        columns["x_V"] = x[0] + dx * columns["x_px"]
+        columns["y_V"] = y[0] + dy * columns["y_px"]
+        columns["sigma_x_V"] = abs(dx) * columns["sigma_px"]
+        columns["sigma_y_V"] = abs(dy) * columns["sigma_px"]
+    return columns
@@ -0,0 +1,102 @@
+"""Convert saved text scans to compressed ``.qsz`` files.
+
+    python migrate_scans.py data                 # every scan in data/
+    python migrate_scans.py archive --recursive  # and in all subfolders
+    python migrate_scans.py data --keep          # leave the .txt files in place
+    python migrate_scans.py data --dry-run       # only count what would be converted
+
+Files are converted in parallel, one per worker process. Counts are
+stored as unsigned ints, anything non-integral (counts/s scans) as
+float64. Each ``.qsz`` is read back and compared with the full-precision
+values of the text scan before the text file is deleted, and the
+folder's catalog.csv is pointed at the new files.
+Extra channels (``<scan>_mask.txt``) and other text files are left alone.
+"""
+import argparse
+import os
+import sys
+import time
+from functools import partial
+
+import numpy as np
+
+import codec
+from batch import iter_batch
+from scan_io import as_counts, list_scans, rename_in_catalog
+
+def find_scans(folder, recursive=False):
+    """Paths of the text scans under ``folder`` that have no ``.qsz`` yet."""
+    folders = [d for d, _, _ in os.walk(folder)] if recursive else [folder]
+    paths = []
+    for d in folders:
+        metas = list_scans(d) + list_scans(d, three_d=True)
+        paths += [os.path.join(d, m["filename"]) for m in metas if m["filename"].endswith(".txt")]
+    return sorted(paths)
+
+# --- Run in the workers: convert, verify, then drop the text ---
+def migrate_file(path, keep=False):
+    # Compared against the text as float64, not the float32 the viewers load it as
+    exact = np.loadtxt(path, dtype=np.float64, ndmin=2)
+    data = as_counts(exact)
+    if data.dtype.kind == "f":
+        data = exact
+    out = path[:-4] + codec.EXTENSION
+    codec.write(out + ".tmp", data)
+    back = codec.read(out + ".tmp")
+    if back.dtype != data.dtype or not np.array_equal(back.astype(np.float64), exact):
+        os.remove(out + ".tmp")
+        raise ValueError("compressed copy does not read back identically; text kept")
+    os.replace(out + ".tmp", out)
+    text_bytes = os.path.getsize(path)
+    if not keep:
+        os.remove(path)
+    return text_bytes, os.path.getsize(out)
+
+def migrate(paths, keep=False, on_file=None):
+    """Convert ``paths``; returns (converted count, text bytes, compressed bytes, errors)."""
+    renames, errors = {}, []
+    text_total = packed_total = 0
+    for n, (path, result, error) in enumerate(iter_batch(paths, partial(migrate_file, keep=keep))):
+        if error is None:
+            text_total += result[0]
+            packed_total += result[1]
+            folder, name = os.path.split(path)
+            renames.setdefault(folder, {})[name] = name[:-4] + codec.EXTENSION
+        else:
+            errors.append((path, error))
+        if on_file:
+            on_file(n + 1, len(paths), path, error)
+    for folder, names in renames.items():
+        rename_in_catalog(folder, names)
+    return sum(len(names) for names in renames.values()), text_total, packed_total, errors
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Convert text scans to compressed .qsz files.")
+    parser.add_argument("folders", nargs="+")
+    parser.add_argument("--recursive", action="store_true", help="include subfolders")
+    parser.add_argument("--keep", action="store_true", help="keep the .txt files after converting")
+    parser.add_argument("--dry-run", action="store_true", help="list what would be converted")
+    args = parser.parse_args(argv)
+
+    paths = [p for folder in args.folders for p in find_scans(folder, args.recursive)]
+    text_bytes = sum(os.path.getsize(p) for p in paths)
+    print(f"{len(paths)} text scan(s), {text_bytes / 1e6:.1f} MB")
+    if args.dry_run or not paths:
+        return 0
+
+    def show(done, total, path, error):
+        if error is not None:
+            print(f"ERROR {path}: {error}", flush=True)
+        elif done % 100 == 0 or done == total:
+            print(f"{done}/{total}", flush=True)
+
+    t = time.perf_counter()
+    count, before, after, errors = migrate(paths, args.keep, show)
+    seconds = time.perf_counter() - t
+    ratio = before / after if after else 0.0
+    print(f"Converted {count} scan(s) in {seconds:.1f} s: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+          f"({ratio:.1f}x)" + (f", {len(errors)} error(s)" if errors else ""))
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
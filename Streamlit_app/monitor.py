@@ -0,0 +1,181 @@
+"""Count-rate monitor: the galvos parked on one spot, the counter read continuously.
+
+The scanner backend runs in monitor mode (``-mon``) and streams lines of
+counts on stdout until a stop file appears. Samples go into a ring buffer
+allocated once, so a monitor left running for hours holds the last
+``history`` seconds and nothing more; the page plots a block-averaged copy.
+With tracking, the stream pauses between blocks to re-centre on the
+emitter (tracking.py).
+"""
+import os
+import subprocess
+import threading
+import time
+from functools import partial
+
+import numpy as np
+
+import drivers
+from acquisition import SCANNER, run_scan
+from scan_io import MONITOR_END
+from tracking import Tracker
+
+STOP_FILE = "monitor.stop"
+MAX_SAMPLES = 2_000_000  # ring buffer cap: 24 MB of times and counts
+MAX_POINTS = 2000        # points plotted, whatever the history
+STOP_TIMEOUT = 5.0       # seconds the backend gets to finish its line before it is terminated
+STATUS_INTERVAL = 1.0    # seconds between rate messages on the station
+
+def monitor_args(x, y, dwell, stop_path=STOP_FILE):
+    return ["-mon", "-xs", str(x), "-ys", str(y), "-dw", str(dwell), "-o", "-", "-stop", stop_path]
+
+# --- Fixed-size sample history ---
+class RingBuffer:
+    """The last ``capacity`` (time, count) samples, in arrays allocated once."""
+
+    def __init__(self, capacity):
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.values = np.zeros(capacity, dtype=np.float32)
+        self.total = 0  # samples ever added
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return min(self.total, len(self.values))
+
+    def extend(self, times, values):
+        capacity = len(self.values)
+        skip = max(0, len(values) - capacity)
+        index = (self.total + skip + np.arange(len(values) - skip)) % capacity
+        with self._lock:
+            self.times[index] = times[skip:]
+            self.values[index] = values[skip:]
+            self.total += len(values)
+
+    def ordered(self):
+        """Copies of the held (times, values), oldest first."""
+        with self._lock:
+            if self.total <= len(self.values):
+                return self.times[:self.total].copy(), self.values[:self.total].copy()
+            head = self.total % len(self.values)
+            return (np.concatenate([self.times[head:], self.times[:head]]),
+                    np.concatenate([self.values[head:], self.values[:head]]))
+
+def decimate(values, max_points):
+    """Block means of ``values``, at most ``max_points`` of them (a leading remainder is dropped)."""
+    factor = -(-len(values) // max_points)
+    if factor <= 1:
+        return values
+    n = len(values) // factor
+    return values[len(values) - n * factor:].reshape(n, factor).mean(axis=1)
+
+# --- The monitor shared by every browser session ---
+class CountMonitor:
+    """Runs on the station like a scan (``STATION.start(..., MONITOR.work)``)
+    and ends when ``STATION.request_stop()`` is called."""
+
+    def __init__(self):
+        self.running = False
+        self.params = None
+        self._buffer = None
+
+    def work(self, station, x, y, dwell, history=60.0, scanner=None, tracking=None):
+        """Monitor at (x, y) until the station is asked to stop.
+
+        With ``tracking`` (keyword arguments of ``tracking.Tracker``) the
+        stream pauses every ``interval`` seconds for a local scan, and
+        resumes on the re-fitted emitter position.
+        """
+        # The buffer cap wins over ``history``, so what is plotted is what is kept
+        history = min(history, MAX_SAMPLES * dwell / 1000)
+        buffer = RingBuffer(min(MAX_SAMPLES, max(1, int(history * 1000 / dwell))))
+        self.params = {"x": x, "y": y, "x0": x, "y0": y, "dwell": dwell, "history": history, "tracks": 0}
+        self._buffer, self.running = buffer, True
+        tracker = None
+        started = time.time()
+        try:
+            if tracking:
+                tracker = Tracker(**tracking, run=partial(run_scan, scanner=scanner), log=station.message)
+            while not station.stop_requested():
+                self._stream(station, buffer, x, y, dwell, scanner, started, tracker and tracker.interval)
+                if station.stop_requested():
+                    break
+                station.message(f"Tracking emitter near X {x:.4f} V, Y {y:.4f} V")
+                result = tracker.update(x, y)
+                x, y = result["x"], result["y"]
+                self.params = {**self.params, "x": round(x, 6), "y": round(y, 6), "z": result["z"],
+                               "tracks": self.params["tracks"] + 1, "track_ok": result["ok"],
+                               "track_seconds": result["seconds"]}
+        finally:
+            self.running = False
+            if tracker is not None:
+                tracker.close()
+        station.log("success", f"Monitor stopped after {time.time() - started:,.0f} s ({buffer.total:,} samples)")
+
+    def _stream(self, station, buffer, x, y, dwell, scanner, started, duration=None):
+        # One run of the backend in monitor mode: until a stop request, or for ``duration`` seconds
+        stop_path = os.path.abspath(STOP_FILE)
+        if os.path.exists(stop_path):
+            os.remove(stop_path)
+        proc = subprocess.Popen(drivers.load(scanner or SCANNER) + monitor_args(x, y, dwell, stop_path),
+                                stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True)
+        deadline = None if duration is None else time.time() + duration
+        ended = threading.Event()
+        threading.Thread(target=self._stop_when_asked, args=(station, proc, stop_path, deadline, ended),
+                         daemon=True).start()
+        shown = time.time()
+        try:
+            for line in proc.stdout:
+                tokens = line.split()
+                if not tokens or line.strip() == MONITOR_END:
+                    continue
+                try:
+                    counts = np.array(tokens[1:], dtype=np.float32)  # behind the firmware's "0" token
+                except ValueError:
+                    continue
+                # Samples were taken dwell apart, the last one just before the line arrived
+                now = time.time()
+                buffer.extend(now - dwell / 1000 * np.arange(len(counts) - 1, -1, -1), counts)
+                if now - shown >= STATUS_INTERVAL:
+                    shown = now
+                    station.message(f"{counts.mean() * 1000 / dwell:,.0f} counts/s, "
+                                    f"{buffer.total:,} samples in {now - started:,.0f} s")
+            _, err = proc.communicate()
+        finally:
+            if proc.poll() is None:
+                proc.kill()
+            if os.path.exists(stop_path):
+                os.remove(stop_path)
+        if not ended.is_set():
+            raise RuntimeError(f"Monitor ended unexpectedly: {err.strip() or f'exit code {proc.returncode}'}")
+
+    def _stop_when_asked(self, station, proc, stop_path, deadline, ended):
+        while proc.poll() is None and not station.stop_requested() and (deadline is None or time.time() < deadline):
+            time.sleep(0.1)
+        if proc.poll() is not None:
+            return
+        # The backend clears the firmware flag when the stop file appears; terminate only if it hangs
+        ended.set()
+        open(stop_path, "w").close()
+        try:
+            proc.wait(STOP_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            proc.terminate()
+
+    def snapshot(self, max_points=MAX_POINTS, recent=0.5):
+        """The held samples for plotting, or None before the first monitor run.
+
+        ``t`` (seconds relative to now) and ``rate`` (counts/s) are
+        block-averaged to at most ``max_points``; ``current`` (mean of the
+        last ``recent`` s), ``mean`` and ``max`` come from every sample.
+        """
+        buffer, params = self._buffer, self.params
+        if buffer is None or not len(buffer):
+            return None
+        times, values = buffer.ordered()
+        rate = values * np.float32(1000 / params["dwell"])
+        last = max(1, int(recent * 1000 / params["dwell"]))
+        return {"t": decimate(times, max_points) - time.time(), "rate": decimate(rate, max_points),
+                "current": float(rate[-last:].mean()), "mean": float(rate.mean()), "max": float(rate.max()),
+                "samples": buffer.total, **params}
+
+MONITOR = CountMonitor()
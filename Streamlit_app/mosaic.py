@@ -0,0 +1,140 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+from scipy import ndimage
+
+TILE_SIZE = 256
+MAX_MOSAIC_PIXELS = 50_000_000  # 400 MB of float32 canvases; finer mosaics are stitched at a coarser pitch
+
+# --- Function to place scans on a common voltage grid and blend the overlaps ---
+def stitch(scans, max_pixels=MAX_MOSAIC_PIXELS):
+    """Stitch ``[(meta, data), ...]`` into one mosaic.
+
+    The grid uses the finest pixel pitch among the scans and the sweep
+    direction of the first scan, so the mosaic looks like its tiles. Each
+    scan is resampled (bilinear) into its footprint and blended with
+    weights that fall off towards its edges, hiding the seams.
+    When that grid would exceed ``max_pixels`` (a small zoom next to a
+    wide overview) the pitch is coarsened to fit, and ``grid["coarsened"]``
+    says by how much. Returns (mosaic, grid) where ``grid`` maps pixels to volts.
+    Raises ValueError for a scan with a zero-width window or fewer than two
+    pixels a side, which has no pitch to place it by.
+    """
+    for meta, data in scans:
+        if meta["xe"] == meta["xs"] or meta["ye"] == meta["ys"] or min(data.shape) < 2:
+            raise ValueError(f"{meta.get('filename', 'A scan')} covers no area (X {meta['xs']}..{meta['xe']} V, "
+                             f"Y {meta['ys']}..{meta['ye']} V, {data.shape[1]}x{data.shape[0]} px)")
+    first = scans[0][0]
+    sx = 1.0 if first["xe"] >= first["xs"] else -1.0
+    sy = 1.0 if first["ye"] >= first["ys"] else -1.0
+    finest = min(min(abs(m["xe"] - m["xs"]), abs(m["ye"] - m["ys"])) / (d.shape[0] - 1) for m, d in scans)
+    # Grid origin is the first pixel along each sweep direction
+    x0 = min(min(m["xs"] * sx, m["xe"] * sx) for m, _ in scans) * sx
+    y0 = min(min(m["ys"] * sy, m["ye"] * sy) for m, _ in scans) * sy
+    span_x = max(max(m["xs"] * sx, m["xe"] * sx) - x0 * sx for m, _ in scans)
+    span_y = max(max(m["ys"] * sy, m["ye"] * sy) - y0 * sy for m, _ in scans)
+    pitch = finest
+    while (int(round(span_x / pitch)) + 1) * (int(round(span_y / pitch)) + 1) > max_pixels:
+        pitch = max(pitch * 1.01, np.sqrt(span_x * span_y / max_pixels))
+    width, height = int(round(span_x / pitch)) + 1, int(round(span_y / pitch)) + 1
+    grid = {"x0": x0, "y0": y0, "dx": sx * pitch, "dy": sy * pitch, "width": width, "height": height,
+            "coarsened": pitch / finest}
+
+    total = np.zeros((height, width), dtype=np.float32)
+    weight = np.zeros((height, width), dtype=np.float32)
+    for meta, data in scans:
+        ny, nx = data.shape
+        # Footprint of this scan in mosaic pixels
+        cols = sorted(((meta["xs"] - x0) / grid["dx"], (meta["xe"] - x0) / grid["dx"]))
+        rows = sorted(((meta["ys"] - y0) / grid["dy"], (meta["ye"] - y0) / grid["dy"]))
+        c0, c1 = int(np.ceil(cols[0] - 1e-6)), int(np.floor(cols[1] + 1e-6))
+        r0, r1 = int(np.ceil(rows[0] - 1e-6)), int(np.floor(rows[1] + 1e-6))
+        rr, cc = np.mgrid[r0:r1 + 1, c0:c1 + 1].astype(float)
+        # Mosaic pixel -> volts -> fractional index into this scan
+        vx, vy = x0 + cc * grid["dx"], y0 + rr * grid["dy"]
+        src_c = (vx - meta["xs"]) / (meta["xe"] - meta["xs"]) * (nx - 1)
+        src_r = (vy - meta["ys"]) / (meta["ye"] - meta["ys"]) * (ny - 1)
+        data = data.astype(np.float32)
+        # A scan much finer than the grid is box-averaged first, so coarse sampling does not alias
+        shrink = int(pitch / (min(abs(meta["xe"] - meta["xs"]), abs(meta["ye"] - meta["ys"])) / (ny - 1)))
+        if shrink > 1:
+            data = ndimage.uniform_filter(data, shrink, mode="nearest")
+        values = ndimage.map_coordinates(data, [src_r, src_c], order=1, mode="nearest")
+        feather = np.minimum(np.minimum(src_r, ny - 1 - src_r), np.minimum(src_c, nx - 1 - src_c)) + 1.0
+        w = np.clip(feather, 1e-3, None).astype(np.float32)
+        total[r0:r1 + 1, c0:c1 + 1] += w * values
+        weight[r0:r1 + 1, c0:c1 + 1] += w
+    mosaic = np.where(weight > 0, total / np.maximum(weight, 1e-12), np.nan).astype(np.float32)
+    return mosaic, grid
+
+# --- Function to write the mosaic as a multi-resolution tile pyramid ---
+def write_pyramid(mosaic, grid, out_dir, tile=TILE_SIZE):
+    """Write ``out_dir/<level>/<row>_<col>.npy`` tiles plus ``pyramid.json``.
+
+    Level 0 is full resolution; each next level halves it (2x2 mean,
+    ignoring empty pixels) until the whole mosaic fits in one tile.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    level, image, shapes = 0, mosaic, []
+    while True:
+        shapes.append(image.shape)
+        level_dir = os.path.join(out_dir, str(level))
+        os.makedirs(level_dir, exist_ok=True)
+        for r in range(0, image.shape[0], tile):
+            for c in range(0, image.shape[1], tile):
+                np.save(os.path.join(level_dir, f"{r // tile}_{c // tile}.npy"), image[r:r + tile, c:c + tile])
+        if max(image.shape) <= tile:
+            break
+        image = _halve(image)
+        level += 1
+    finite = mosaic[np.isfinite(mosaic)]
+    info = {**grid, "tile": tile, "levels": len(shapes), "shapes": shapes,
+            "vmin": float(finite.min()) if finite.size else 0.0, "vmax": float(finite.max()) if finite.size else 1.0}
+    with open(os.path.join(out_dir, "pyramid.json"), "w") as f:
+        json.dump(info, f, indent=2)
+    return info
+
+def _halve(image):
+    h, w = (image.shape[0] + 1) // 2 * 2, (image.shape[1] + 1) // 2 * 2
+    padded = np.full((h, w), np.nan, dtype=np.float32)
+    padded[:image.shape[0], :image.shape[1]] = image
+    blocks = padded.reshape(h // 2, 2, w // 2, 2)
+    with np.errstate(invalid="ignore"):
+        count = np.isfinite(blocks).sum(axis=(1, 3))
+        summed = np.nansum(blocks, axis=(1, 3))
+        return np.where(count > 0, summed / np.maximum(count, 1), np.nan).astype(np.float32)
+
+def load_pyramid(out_dir):
+    with open(os.path.join(out_dir, "pyramid.json")) as f:
+        return json.load(f)
+
+@lru_cache(maxsize=512)
+def _tile(out_dir, level, r, c):
+    return np.load(os.path.join(out_dir, str(level), f"{r}_{c}.npy"))
+
+# --- Function to read a view window, loading only the tiles it touches ---
+def read_view(out_dir, info, level, r0, r1, c0, c1):
+    """Pixels [r0:r1, c0:c1] of ``level`` assembled from the tiles in view."""
+    tile = info["tile"]
+    h, w = info["shapes"][level]
+    r0, r1, c0, c1 = max(r0, 0), min(r1, h), max(c0, 0), min(c1, w)
+    view = np.full((max(r1 - r0, 0), max(c1 - c0, 0)), np.nan, dtype=np.float32)
+    for tr in range(r0 // tile, (r1 - 1) // tile + 1):
+        for tc in range(c0 // tile, (c1 - 1) // tile + 1):
+            t = _tile(out_dir, level, tr, tc)
+            tr0, tc0 = tr * tile, tc * tile
+            rs, re = max(r0, tr0), min(r1, tr0 + t.shape[0])
+            cs, ce = max(c0, tc0), min(c1, tc0 + t.shape[1])
+            view[rs - r0:re - r0, cs - c0:ce - c0] = t[rs - tr0:re - tr0, cs - tc0:ce - tc0]
+    return view, (r0, r1, c0, c1)
+
+def view_axes(info, level, bounds):
+    # Volts at the centre of each pixel of a (possibly downsampled) view
+    r0, r1, c0, c1 = bounds
+    scale = 2 ** level
+    cols = (np.arange(c0, c1) + 0.5) * scale - 0.5
+    rows = (np.arange(r0, r1) + 0.5) * scale - 0.5
+    return {"x": info["x0"] + cols * info["dx"], "y": info["y0"] + rows * info["dy"],
+            "xlabel": "X (V)", "ylabel": "Y (V)"}
@@ -0,0 +1,117 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy import ndimage
+
+# All steps work on a single image (H, W) or a whole stack (..., H, W) at once:
+# filters act on the last two axes only and per-image statistics are reduced
+# over those axes with keepdims, so no Python loop over images is needed.
+
+def _image_sigma(a, sigma):
+    return (0,) * (a.ndim - 2) + (sigma, sigma)
+
+# --- Preprocessing steps ---
+def subtract_background(a, percentile=10.0):
+    bg = np.percentile(a, percentile, axis=(-2, -1), keepdims=True)
+    return np.clip(a - bg, 0, None)
+
+def gaussian_smooth(a, sigma=1.0):
+    return ndimage.gaussian_filter(a, _image_sigma(a, sigma))
+
+def remove_hot_pixels(a, threshold=5.0):
+    # Replace pixels that stick out of their 3x3 median by more than
+    # threshold x the Poisson noise of that median
+    size = (1,) * (a.ndim - 2) + (3, 3)
+    med = ndimage.median_filter(a, size=size)
+    hot = (a - med) > threshold * np.sqrt(np.maximum(med, 1.0))
+    return np.where(hot, med, a)
+
+def normalize(a, mode="max"):
+    if mode == "max":
+        peak = a.max(axis=(-2, -1), keepdims=True)
+        return a / np.where(peak == 0, 1, peak)
+    if mode == "minmax":
+        lo = a.min(axis=(-2, -1), keepdims=True)
+        span = a.max(axis=(-2, -1), keepdims=True) - lo
+        return (a - lo) / np.where(span == 0, 1, span)
+    if mode == "zscore":
+        std = a.std(axis=(-2, -1), keepdims=True)
+        return (a - a.mean(axis=(-2, -1), keepdims=True)) / np.where(std == 0, 1, std)
+    raise ValueError(f"Unknown normalization: {mode}")
+
+def bin_pixels(a, factor=2):
+    # Sum factor x factor blocks; edge rows/columns that don't fill a block are dropped
+    factor = int(factor)
+    h, w = a.shape[-2] // factor, a.shape[-1] // factor
+    a = a[..., :h * factor, :w * factor]
+    return a.reshape(a.shape[:-2] + (h, factor, w, factor)).sum(axis=(-3, -1))
+
+def bin_axis(v, factor=2):
+    # Voltage at the centre of each binned block
+    factor = int(factor)
+    n = len(v) // factor
+    return np.asarray(v)[:n * factor].reshape(n, factor).mean(axis=1)
+
+STEPS = {
+    "Hot-pixel removal": remove_hot_pixels,
+    "Background subtraction": subtract_background,
+    "Gaussian smoothing": gaussian_smooth,
+    "Binning": bin_pixels,
+    "Normalization": normalize,
+}
+
+# --- Memoized pipeline, shared by every session's script thread ---
+_cache = OrderedDict()
+_cache_bytes = 0
+_cache_lock = threading.Lock()
+CACHE_LIMIT_BYTES = 512 * 1024 ** 2
+
+def fingerprint(a):
+    h = hashlib.blake2b(digest_size=16)
+    h.update(str((a.shape, a.dtype.str)).encode())
+    h.update(np.ascontiguousarray(a).data)
+    return h.hexdigest()
+
+def _remember(key, value):
+    global _cache_bytes
+    value.flags.writeable = False  # cached results are shared between reruns
+    with _cache_lock:
+        # Another session may have stored the same step meanwhile; count its bytes once
+        old = _cache.pop(key, None)
+        _cache_bytes += value.nbytes - (0 if old is None else old.nbytes)
+        _cache[key] = value
+        while _cache_bytes > CACHE_LIMIT_BYTES and len(_cache) > 1:
+            _, old = _cache.popitem(last=False)
+            _cache_bytes -= old.nbytes
+
+def run_pipeline(a, steps, input_key=None):
+    """Apply ``steps`` = ``[(name, params), ...]`` to ``a``.
+
+    Every intermediate is cached under (input fingerprint, steps so far), so
+    changing a late step reuses everything before it.
+    """
+    key = (input_key or fingerprint(a),)
+    out = a.astype(float, copy=False)
+    start = 0
+    # Resume from the longest prefix that is already cached
+    with _cache_lock:
+        for i in range(len(steps), 0, -1):
+            prefix = key + tuple((name, tuple(sorted(params.items()))) for name, params in steps[:i])
+            if prefix in _cache:
+                _cache.move_to_end(prefix)
+                out, key, start = _cache[prefix], prefix, i
+                break
+    for name, params in steps[start:]:
+        key = key + ((name, tuple(sorted(params.items()))),)
+        out = STEPS[name](out, **params)
+        _remember(key, out)
+    return out
+
+def pipeline_axes(axes, steps):
+    # Only binning changes the pixel grid
+    for name, params in steps:
+        if name == "Binning":
+            axes = {**axes, "x": bin_axis(axes["x"], **params), "y": bin_axis(axes["y"], **params)}
+    return axes
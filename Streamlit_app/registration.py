@@ -0,0 +1,79 @@
+import threading
+
+import numpy as np
+
+from processing import fingerprint
+
+# --- Phase correlation against one cached reference spectrum (shared by all sessions) ---
+_reference = {}
+_reference_lock = threading.Lock()
+
+def reference_spectrum(ref, key=None):
+    # The conjugate FFT of the reference is reused for every scan registered to it. The
+    # pixels are part of the key, so a reference file overwritten in place is not served stale
+    if key is not None:
+        key = (key, fingerprint(np.ascontiguousarray(ref)))
+        with _reference_lock:
+            if key in _reference:
+                return _reference[key]
+    spec = np.conj(np.fft.fft2(ref - ref.mean()))
+    if key is not None:
+        with _reference_lock:
+            _reference.clear()
+            _reference[key] = spec
+    return spec
+
+def estimate_shifts(stack, ref_spec, upsample=20, whitening=0.25):
+    """Shift (dy, dx) in pixels of every image in ``stack`` relative to the reference.
+
+    ``stack`` is (N, H, W); all N cross-power spectra, inverse FFTs and peak
+    searches run as single array operations. ``whitening=1`` is classic
+    phase correlation; photon-count scans are noisy enough that partially
+    whitening the spectrum locks on more reliably.
+    """
+    stack = np.asarray(stack, dtype=float)
+    n, h, w = stack.shape
+    spec = np.fft.fft2(stack - stack.mean(axis=(1, 2), keepdims=True))
+    cross = spec * ref_spec
+    cross /= np.maximum(np.abs(cross), 1e-12) ** whitening
+    corr = np.fft.ifft2(cross).real
+
+    flat = corr.reshape(n, -1).argmax(axis=1)
+    py, px = np.unravel_index(flat, (h, w))
+    # Peaks past the midpoint are negative shifts
+    coarse = np.stack([np.where(py > h // 2, py - h, py), np.where(px > w // 2, px - w, px)], axis=1).astype(float)
+    return _refine(cross, coarse, upsample)
+
+def _refine(cross, coarse, upsample):
+    # Evaluate the correlation on an upsampled grid of +/-0.75 px around each
+    # coarse peak with a matrix-multiply DFT (Guizar-Sicairos et al. 2008),
+    # instead of zero-padding the whole FFT.
+    n, h, w = cross.shape
+    r = int(np.ceil(upsample * 1.5))
+    offsets = (np.arange(r) - r // 2) / upsample
+    y = coarse[:, 0, None] + offsets
+    x = coarse[:, 1, None] + offsets
+    ky = np.exp(2j * np.pi * y[:, :, None] * np.fft.fftfreq(h)[None, None, :])
+    kx = np.exp(2j * np.pi * x[:, :, None] * np.fft.fftfreq(w)[None, None, :])
+    fine = ((ky @ cross) @ kx.transpose(0, 2, 1)).real
+    iy, ix = np.unravel_index(fine.reshape(n, -1).argmax(axis=1), (r, r))
+    return coarse + np.stack([offsets[iy], offsets[ix]], axis=1)
+
+# --- Function to undo the drift (Fourier shift, batched) ---
+def apply_shifts(stack, shifts):
+    stack = np.asarray(stack, dtype=float)
+    n, h, w = stack.shape
+    fy = np.fft.fftfreq(h)[None, :, None]
+    fx = np.fft.fftfreq(w)[None, None, :]
+    dy, dx = -shifts[:, 0, None, None], -shifts[:, 1, None, None]
+    phase = np.exp(-2j * np.pi * (fy * dy + fx * dx))
+    return np.fft.ifft2(np.fft.fft2(stack) * phase).real
+
+# --- Function to register a whole set of scans in one go ---
+def register(stack, reference_index=0, key=None, whitening=0.25):
+    """Return (shifts, aligned stack, drift-corrected average)."""
+    stack = np.asarray(stack, dtype=float)
+    ref_spec = reference_spectrum(stack[reference_index], key)
+    shifts = estimate_shifts(stack, ref_spec, whitening=whitening)
+    aligned = apply_shifts(stack, shifts)
+    return shifts, aligned, aligned.mean(axis=0)
@@ -0,0 +1,204 @@
+import base64
+import io
+import threading
+import weakref
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+import plotly.colors
+import plotly.express as px
+import plotly.graph_objects as go
+from PIL import Image
+
+from processing import fingerprint, bin_pixels, bin_axis
+
+FIGURE_CACHE_SIZE = 16
+PERCENTILES = (1, 5, 50, 95, 99)
+LUT_SIZE = 4096
+HOVER_SIZE = 200  # side of the coarse value grid behind the image's hover readback
+IMAGE_FORMATS = {"PNG": ("png", {"compress_level": 1}), "WebP": ("webp", {"lossless": True, "method": 0})}
+
+# --- Content keys, hashed once per array object ---
+_keys = {}
+
+def array_key(a):
+    """Fingerprint of ``a``, computed once for as long as the array object lives.
+
+    Session arrays and cached pipeline results are the same objects from one
+    rerun to the next, so their pixels are hashed only the first time.
+    """
+    entry = _keys.get(id(a))
+    if entry is not None and entry[0]() is a:
+        return entry[1]
+    key = fingerprint(a)
+    _keys[id(a)] = (weakref.ref(a, lambda _, i=id(a): _keys.pop(i, None)), key)
+    return key
+
+# --- Function to summarize an array once per content ---
+# The stats and figure LRUs are shared by every session's script thread
+_stats = OrderedDict()
+_cache_lock = threading.Lock()
+
+def array_stats(a, key=None):
+    """Min, max, mean and ``PERCENTILES`` of the finite pixels of ``a``."""
+    key = key or array_key(a)
+    with _cache_lock:
+        if key in _stats:
+            _stats.move_to_end(key)
+            return _stats[key]
+    finite = a[np.isfinite(a)] if np.issubdtype(a.dtype, np.floating) else a.ravel()
+    if finite.size:
+        pct = np.percentile(finite, PERCENTILES)
+        stats = {"min": float(finite.min()), "max": float(finite.max()), "mean": float(finite.mean()),
+                 **{f"p{p}": float(v) for p, v in zip(PERCENTILES, pct)}}
+    else:
+        stats = {"min": 0.0, "max": 0.0, "mean": 0.0, **{f"p{p}": 0.0 for p in PERCENTILES}}
+    with _cache_lock:
+        _stats[key] = stats
+        while len(_stats) > 256:
+            _stats.popitem(last=False)
+    return stats
+
+# --- Figure cache: an unchanged view is built only once ---
+_figures = OrderedDict()
+
+def cached_figure(key, build):
+    """Return the figure for ``key``, calling ``build()`` only on a miss.
+
+    ``key`` must hold everything the figure depends on (data key,
+    orientation, vmin/vmax, colormap, size, overlays). Callers must not
+    modify the returned figure; put overlays in ``build`` and in the key.
+    """
+    with _cache_lock:
+        if key in _figures:
+            _figures.move_to_end(key)
+            return _figures[key]
+    fig = build()  # outside the lock: another session may build the same figure meanwhile, which is harmless
+    with _cache_lock:
+        _figures[key] = fig
+        while len(_figures) > FIGURE_CACHE_SIZE:
+            _figures.popitem(last=False)
+    return fig
+
+# --- Server-side colormapping: lookup tables instead of per-pixel colorscale math ---
+@lru_cache(maxsize=64)
+def colormap_lut(cmap, n=LUT_SIZE):
+    """(n, 3) uint8 RGB table sampled evenly along a Plotly colorscale."""
+    stops = plotly.colors.get_colorscale(cmap)
+    pos = np.array([p for p, _ in stops], dtype=float)
+    rgb = np.array([plotly.colors.hex_to_rgb(c) if c.startswith("#") else plotly.colors.unlabel_rgb(c)
+                    for _, c in stops], dtype=float)
+    t = np.linspace(0.0, 1.0, n)
+    table = np.stack([np.interp(t, pos, rgb[:, i]) for i in range(3)], axis=1)
+    lut = np.round(table).astype(np.uint8)
+    lut.flags.writeable = False
+    return lut
+
+def colorize(a, vmin, vmax, cmap):
+    """Map ``a`` to (H, W, 3) uint8 with values clipped to [vmin, vmax].
+
+    Integer counts go through a table with one entry per count value, so
+    the whole image is a single gather; other data is quantized onto the
+    ``LUT_SIZE``-entry table. NaN (unscanned) pixels come out black.
+    """
+    lut = colormap_lut(cmap)
+    n = len(lut)
+    scale = (n - 1) / max(float(vmax) - float(vmin), np.finfo(np.float32).tiny)
+    if a.dtype.kind == "u" and a.dtype.itemsize <= 2:
+        values = np.arange(int(a.max()) + 1 if a.size else 1)
+        table = lut[np.clip((values - vmin) * scale + 0.5, 0, n - 1).astype(np.intp)]
+        return table[a]
+    idx = np.clip((a - vmin) * scale + 0.5, 0, n - 1)
+    rgb = lut[np.nan_to_num(idx, nan=0).astype(np.intp)]
+    if np.issubdtype(a.dtype, np.floating):
+        rgb[np.isnan(a)] = 0
+    return rgb
+
+# --- Function to shrink data to the displayed resolution ---
+def display_grid(a, axes, size):
+    """Block-average ``a`` so neither side exceeds ``size`` pixels.
+
+    Returns (data, x, y, factor); ``x``/``y`` are the pixel centres (volts
+    when ``axes`` are given, else indices). With factor 1 the data is the
+    original array, so readback shows the exact counts.
+    """
+    x = np.asarray(axes["x"]) if axes is not None else np.arange(a.shape[1])
+    y = np.asarray(axes["y"]) if axes is not None else np.arange(a.shape[0])
+    factor = int(np.ceil(max(a.shape) / size))
+    if factor <= 1:
+        return a, x, y, 1
+    return (bin_pixels(a.astype(np.float32), factor) / factor ** 2, bin_axis(x, factor), bin_axis(y, factor),
+            factor)
+
+def encode_image(rgb, fmt="PNG"):
+    """Compress an (H, W, 3) uint8 image to a ``data:`` URI for a Plotly image trace."""
+    name, options = IMAGE_FORMATS[fmt]
+    buf = io.BytesIO()
+    Image.fromarray(np.ascontiguousarray(rgb)).save(buf, format=name, **options)
+    return f"data:image/{name};base64," + base64.b64encode(buf.getvalue()).decode()
+
+# --- Function to create an interactive heatmap using Plotly Express ---
+def plot_heatmap_interactive(data_array, vmin=None, vmax=None, cmap="hot", axes=None, aspect="equal", size=800):
+    coords = {} if axes is None else {"x": axes["x"], "y": axes["y"]}
+    fig = px.imshow(
+        data_array,
+        color_continuous_scale=cmap,
+        zmin=vmin,
+        zmax=vmax,
+        aspect=aspect,
+        **coords
+    )
+    if axes is None:
+        fig.update_xaxes(title_text="X Index")
+        fig.update_yaxes(title_text="Y Index")
+    else:
+        # Keep row 0 on top and column 0 on the left, whichever way the galvos swept
+        fig.update_xaxes(title_text=axes["xlabel"], autorange="reversed" if axes["x"][0] > axes["x"][-1] else True)
+        fig.update_yaxes(title_text=axes["ylabel"], autorange="reversed" if axes["y"][0] < axes["y"][-1] else True)
+    fig.update_layout(autosize=True, width=size, height=size)
+    return fig
+
+# --- Function to draw a heatmap as a server-colored image (LUT + PNG/WebP) ---
+def plot_heatmap_image(data_array, vmin, vmax, cmap="hot", axes=None, size=800, fmt="PNG", hover=False):
+    """Same view as plot_heatmap_interactive, but the browser only gets an
+    8-bit image at display resolution. With ``hover`` an invisible heatmap
+    of block means on a grid of at most ``HOVER_SIZE`` pixels per side
+    provides the count readback, so it stays small whatever the scan size."""
+    data, x, y, factor = display_grid(data_array, axes, size)
+    rgb, ix, iy = colorize(data, vmin, vmax, cmap), x, y
+    # Image traces need increasing coordinates; the axis ranges below restore the scan's orientation
+    if len(ix) > 1 and ix[0] > ix[-1]:
+        rgb, ix = rgb[:, ::-1], ix[::-1]
+    if len(iy) > 1 and iy[0] > iy[-1]:
+        rgb, iy = rgb[::-1], iy[::-1]
+    dx = (ix[-1] - ix[0]) / (len(ix) - 1) if len(ix) > 1 else 1.0
+    dy = (iy[-1] - iy[0]) / (len(iy) - 1) if len(iy) > 1 else 1.0
+    fig = go.Figure(go.Image(source=encode_image(rgb, fmt), x0=ix[0], dx=dx, y0=iy[0], dy=dy, hoverinfo="skip"))
+    # Colorbar only
+    fig.add_scatter(x=[None], y=[None], mode="markers", hoverinfo="skip", showlegend=False,
+                    marker=dict(color=[vmin], colorscale=cmap, cmin=vmin, cmax=vmax, showscale=True))
+    if hover:
+        values, hx, hy, factor = display_grid(data_array, axes, HOVER_SIZE)
+        label = "Counts" if factor == 1 else f"Mean counts ({factor}x{factor} block)"
+        fig.add_heatmap(z=values, x=hx, y=hy, opacity=0, showscale=False,
+                        hovertemplate=f"X %{{x}}<br>Y %{{y}}<br>{label} %{{z}}<extra></extra>")
+    if axes is None:
+        fig.update_xaxes(title_text="X Index")
+        fig.update_yaxes(title_text="Y Index", autorange="reversed")
+    else:
+        fig.update_xaxes(title_text=axes["xlabel"], autorange="reversed" if axes["x"][0] > axes["x"][-1] else True)
+        fig.update_yaxes(title_text=axes["ylabel"], autorange="reversed" if axes["y"][0] < axes["y"][-1] else True)
+    fig.update_yaxes(scaleanchor="x")
+    fig.update_layout(autosize=True, width=size, height=size)
+    return fig
+
+# --- Function to plot the count-rate monitor's rolling trace ---
+def plot_count_rate(t, rate, history, height=300):
+    fig = go.Figure(go.Scattergl(x=t, y=rate, mode="lines", line=dict(width=1),
+                                 hovertemplate="%{x:.1f} s<br>%{y:,.0f} counts/s<extra></extra>"))
+    fig.update_xaxes(title_text="Time (s)", range=[-history, 0])
+    fig.update_yaxes(title_text="Counts/s", rangemode="tozero")
+    # uirevision keeps a zoom on the y axis through the updates
+    fig.update_layout(height=height, margin=dict(l=10, r=10, t=10, b=10), uirevision="count_rate")
+    return fig
@@ -0,0 +1,283 @@
+"""Scan and Z-stack acquisition without Streamlit.
+
+The Scan page and this module run the same ``acquisition_work``, so a
+scripted run saves the same files and catalog rows as a click on "Scan".
+
+    python runner.py job.json            # run every scan in the job file
+    python runner.py job.json --dry-run  # list the scans and the estimated time
+
+A job file is JSON. Top-level keys are defaults for every entry of
+``"scans"`` (or describe a single scan when there is no ``"scans"``)::
+
+    {"output_dir": "data", "prefix": "night", "step": 200, "dw": 2.0,
+     "scans": [{"xs": 1, "ys": 1, "xe": -1, "ye": -1},
+               {"xs": 0.5, "ys": 0.5, "xe": -0.5, "ye": -0.5,
+                "z": {"start": 0, "stop": 1, "inc": 0.1}}]}
+
+Other keys: ``serials`` (list of LabJack serials), ``adaptive``
+(``{"coarse_factor": 4, "sensitivity": 3.0}``), ``stage_serial``,
+``scanner`` ("scanwitharg" or "simulator"), ``order`` ("raster" or
+"progressive", which covers the whole field coarsely first), ``target``
+and ``resume``. With ``target`` (counts) every pixel integrates until it
+has that many counts or ``dw`` ms have passed; the scan is saved as
+counts/s with the dwell spent per pixel in ``<scan>_dwell.txt``.
+
+Every scan keeps a checkpoint of its completed rows in
+``<output_dir>/.checkpoints`` until the whole run is saved. Running the
+same job file again with ``--resume`` (or ``"resume": true``) skips the
+Z slices already saved and continues the interrupted one from its last
+row on disk:
+
+    python runner.py job.json --resume
+
+Scans need scanwitharg.exe built from this tree's src/scanwitharg.c (and
+the matching firmware script); an older build rejects options such as
+``-stop`` and the scan fails with a message saying so.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+from functools import partial
+
+import numpy as np
+
+import drivers
+from acquisition import count_rate, estimate_seconds, is_adaptive_dwell, make_job, run_scan, run_tiled, split_dwell
+from adaptive import run_adaptive_scan
+from checkpoint import Checkpoint, checkpoint_path, remove_checkpoints, run_checkpointed
+from scan_io import ROW_ORDERS, append_catalog, as_counts, save_scan
+from station import Station
+
+STAGE_SERIAL = "97251223"
+DEFAULTS = {"output_dir": "data", "prefix": "scan", "xs": 1.0, "ys": 1.0, "xe": -1.0, "ye": -1.0,
+            "step": 100, "dw": 1.0, "z": None, "serials": [], "adaptive": None, "stage_serial": STAGE_SERIAL,
+            "scanner": None, "order": "raster", "target": None, "resume": False}
+
+def connect_stage(serial_no: str):
+    """Open and enable the Z stage, leaving its position and zero as they are."""
+    k = drivers.load("kinesis")
+    k.DeviceManagerCLI.BuildDeviceList()
+    device = k.KCubeInertialMotor.CreateKCubeInertialMotor(serial_no)
+    device.Connect(serial_no)
+    time.sleep(0.25)
+    if not device.IsSettingsInitialized():
+        device.WaitForSettingsInitialized(10000)
+    device.StartPolling(250)
+    time.sleep(0.25)
+    device.EnableDevice()
+    time.sleep(0.25)
+    cfg = device.GetInertialMotorConfiguration(serial_no)
+    settings = k.ThorlabsInertialMotorSettings.GetSettings(cfg)
+    chan = k.InertialMotorStatus.MotorChannels.Channel1
+    settings.Drive.Channel(chan).StepRate = 500
+    settings.Drive.Channel(chan).StepAcceleration = 100000
+    device.SetSettings(settings, True, True)
+    return device, chan
+
+def init_stage(serial_no: str, log=print):
+    # Z-stacks count from here: the current position becomes zero, then the stage moves to 100
+    device, chan = connect_stage(serial_no)
+    device.SetPositionAs(chan, 0)
+    log(f"Moving stage to Z = {100}")
+    device.MoveTo(chan, int(100), 60000)
+    log("Stage move complete.")
+    return device, chan
+
+def z_positions(start, stop, inc):
+    # Same slices as the Scan page's Start/Increment/Stop Z inputs
+    return np.arange(start, stop + inc, inc)
+
+# --- Acquisition, run by a station's worker thread: no st.* calls in here ---
+def acquisition_work(station, jobs, output_dir, serials, adaptive=None, stage_serial=None, scanner=None,
+                     resume=False):
+    # A stop request ends the current scan after its row; the checkpoint keeps what was done
+    scan = partial(run_scan, scanner=scanner, stop=station.stop_requested)
+    device = None
+    if stage_serial is not None:
+        device, chan = init_stage(stage_serial, log=station.message)
+        time.sleep(1)
+    failed = False
+    try:
+        for job in jobs:
+            if station.stop_requested():
+                # Stopped between slices: the run is incomplete, so the saved slices stay marked for a resume
+                failed = True
+                station.log("error", f"Stopped before Z={job['z']}")
+                break
+            z = job["z"]
+            # Rows (and finished slices) are checkpointed as they arrive, so a crash costs minutes
+            ckpt = Checkpoint(checkpoint_path(output_dir, job), job, resume)
+            if ckpt.saved and os.path.exists(ckpt.saved):
+                station.log("success", f"Z={z} already saved to {ckpt.saved}")
+                continue
+            if device is not None:
+                station.message(f"Moving stage to Z = {z}")
+                device.MoveTo(chan, int(z), 60000)
+
+            def show_progress(cur, exp):
+                station.progress(cur / exp, f"Z={z} {cur}/{exp} lines")
+
+            def show_status(msg, frac):
+                station.progress(frac, f"Z={z} {msg}")
+
+            def show_rows(first, rows, job=job):
+                # Adaptive-dwell rows are (count, dwell) pairs; the live image shows their rate
+                station.publish_rows(job, first, count_rate(rows) if is_adaptive_dwell(job) else rows)
+
+            # Scan, load and autosave
+            try:
+                channels = None
+                serial = serials[0] if serials else None
+                if len(serials) > 1 and device is None:
+                    data = run_tiled(job, serials, on_tile=lambda n, total, sn: show_status(
+                        f"tile {n}/{total} done (device {sn})", n / total), run=scan)
+                elif adaptive:
+                    data, measured = run_adaptive_scan(job, partial(scan, serial=serial), *adaptive,
+                                                       on_status=show_status)
+                    channels = {"mask": measured.astype(np.uint8)}
+                else:
+                    data = run_checkpointed(ckpt, on_progress=show_progress, on_status=show_status,
+                                            on_rows=show_rows, run=scan, serial=serial,
+                                            stop=station.stop_requested)
+                    if is_adaptive_dwell(job):
+                        # Pixels had different dwells, so the scan is saved as a rate and the dwell beside it
+                        data, channels = count_rate(data), {"dwell": split_dwell(data)[1]}
+                station.progress(1.0, f"Z={z} completed.")
+                save_path = save_scan(data, job, output_dir, channels)
+                append_catalog(save_path, job, ",".join(serials) if len(serials) > 1 and device is None else serial)
+                ckpt.mark_saved(save_path)
+                station.log("success", f"Data autosaved to {save_path}")
+                station.publish_frame(as_counts(data), job, save_path)
+            except Exception as e:
+                failed = True
+                if station.stop_requested():
+                    station.log("error", f"Stopped at Z={z}: {e}")
+                    # The partial scan becomes the current frame (not saved), so a region can still be picked
+                    preview = station.live_preview()
+                    if preview is not None and preview[0] is job:
+                        station.publish_frame(as_counts(preview[1]), job)
+                else:
+                    station.log("error", f"Error during scan or autosave at Z={z}: {e}")
+        # Keep the checkpoints of an incomplete run for a resume
+        if not failed:
+            remove_checkpoints(output_dir, jobs)
+    finally:
+        if device is not None:
+            device.StopPolling(); device.Disconnect()
+
+# --- Job files ---
+def scan_spec(entry, defaults=None):
+    """One complete scan spec: ``entry`` over ``defaults`` over ``DEFAULTS``."""
+    merged = {**DEFAULTS, **(defaults or {}), **entry}
+    unknown = set(merged) - set(DEFAULTS)
+    if unknown:
+        raise ValueError(f"Unknown job file keys: {', '.join(sorted(unknown))}")
+    if merged["order"] not in ROW_ORDERS:
+        raise ValueError(f"Unknown row order {merged['order']!r}; use one of {', '.join(ROW_ORDERS)}")
+    if merged["target"] and (merged["adaptive"] or len(merged["serials"]) > 1):
+        raise ValueError("target (adaptive dwell) cannot be combined with adaptive sampling or several serials")
+    return merged
+
+def load_job_file(path):
+    """Read a job file into a list of complete scan specs (defaults filled in)."""
+    with open(path) as f:
+        spec = json.load(f)
+    # No "scans" key describes a single scan; an explicit empty list means nothing to run
+    entries = spec.pop("scans") if "scans" in spec else [{}]
+    return [scan_spec(entry, spec) for entry in entries]
+
+def plan(scan):
+    """The acquisition jobs of one spec: one per Z slice, or a single 2D job."""
+    zs = [None] if scan["z"] is None else z_positions(scan["z"]["start"], scan["z"]["stop"], scan["z"]["inc"])
+    # Floats, so filenames match the Scan page's ("xs-1.0", not "xs-1")
+    xs, ys, xe, ye, dw = (float(scan[k]) for k in ("xs", "ys", "xe", "ye", "dw"))
+    return [make_job(xs, ys, xe, ye, scan["step"], dw, scan["prefix"], z, scan["order"], scan["target"])
+            for z in zs]
+
+# --- Python API ---
+def start(scan, station, owner="runner"):
+    """Start acquiring one spec on ``station`` without waiting; False if the scanner is busy."""
+    jobs = plan(scan)
+    adaptive = scan["adaptive"]
+    work = partial(acquisition_work, jobs=jobs, output_dir=scan["output_dir"], serials=list(scan["serials"]),
+                   adaptive=(adaptive.get("coarse_factor", 4), adaptive.get("sensitivity", 3.0)) if adaptive else None,
+                   stage_serial=scan["stage_serial"] if scan["z"] is not None else None, scanner=scan["scanner"],
+                   resume=scan["resume"])
+    label = f"{jobs[0]['step']} px, X {jobs[0]['xs']}..{jobs[0]['xe']} V, Y {jobs[0]['ys']}..{jobs[0]['ye']} V" + (
+        f", {len(jobs)} slices" if len(jobs) > 1 else "")
+    return station.start(owner, label, work)
+
+def run(scan, station=None, on_update=None):
+    """Acquire one spec and block until it is done.
+
+    Takes the same hardware lock as the app, so it refuses to start while
+    the Scan page (or another run) is using the scanner. ``on_update``
+    gets each new station snapshot. Returns (saved paths, error messages).
+    """
+    station = station or Station()
+    if not start(scan, station):
+        raise RuntimeError("The scanner is busy with another scan.")
+    snap = station.snapshot()
+    while True:
+        if on_update:
+            on_update(snap)
+        if not snap["running"]:
+            break
+        snap = station.wait(snap["version"], timeout=1.0)
+    return snap["saved"], [msg for level, msg in snap["log"] if level == "error"]
+
+def run_job_file(path, on_update=None, resume=False):
+    paths, errors = [], []
+    for scan in load_job_file(path):
+        p, e = run({**scan, "resume": scan["resume"] or resume}, on_update=on_update)
+        paths += p
+        errors += e
+    return paths, errors
+
+# --- CLI: plain line-by-line output, suitable for cron logs ---
+def _printer():
+    seen = {"message": None, "log": 0, "run": None}
+
+    def show(snap):
+        if snap["started"] != seen["run"]:
+            seen.update(run=snap["started"], log=0)
+        if snap["message"] != seen["message"]:
+            seen["message"] = snap["message"]
+            print(f"{time.strftime('%H:%M:%S')} {snap['message']}", flush=True)
+        for level, msg in snap["log"][seen["log"]:]:
+            print(f"{time.strftime('%H:%M:%S')} {level.upper()}: {msg}", flush=True)
+        seen["log"] = len(snap["log"])
+    return show
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run scans from a JSON job file without Streamlit.")
+    parser.add_argument("job_file")
+    parser.add_argument("--dry-run", action="store_true", help="list the scans without running them")
+    parser.add_argument("--resume", action="store_true", help="continue interrupted scans from their checkpoints")
+    args = parser.parse_args(argv)
+    scans = load_job_file(args.job_file)
+    if args.dry_run:
+        total = 0.0
+        for scan in scans:
+            for job in plan(scan):
+                seconds = estimate_seconds(job["step"], job["dw"])
+                total += seconds
+                print(f"{job['prefix']}: X {job['xs']}..{job['xe']} V, Y {job['ys']}..{job['ye']} V, "
+                      f"{job['step']} px, dwell {job['dw']}" + ("" if job["z"] is None else f", Z={job['z']}")
+                      + (f", target {job['target']} counts (at most" if is_adaptive_dwell(job) else " (~")
+                      + f" {seconds:.0f} s)")
+        print(f"Estimated total: {total / 60:.1f} min"
+              + (" at most" if any(scan["target"] for scan in scans) else ""))
+        return 0
+    try:
+        paths, errors = run_job_file(args.job_file, on_update=_printer(), resume=args.resume)
+    except RuntimeError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        return 2
+    print(f"Saved {len(paths)} scan(s)" + (f", {len(errors)} error(s)" if errors else ""))
+    return 1 if errors else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,338 @@
+import csv
+import os
+import re
+import threading
+from datetime import datetime, time, timedelta
+
+import numpy as np
+
+import codec
+
+END_MARKER = "2D Voltage Scan Completed."
+MONITOR_END = "Monitor Stopped."
+DUMMY_TOKENS = ["0.000000", ".000000"]
+VOLTAGE_LIMIT = 5.0
+# Saved scans: "txt" (np.savetxt text) or "qsz" (compressed, see codec.py)
+SCAN_FORMAT = os.environ.get("QSCOPE_SCAN_FORMAT", "txt")
+SCAN_EXTENSIONS = (".txt", codec.EXTENSION)
+# Row orders: top to bottom, or coarse-to-fine (the whole field early, then refined)
+RASTER, PROGRESSIVE = "raster", "progressive"
+ROW_ORDERS = (RASTER, PROGRESSIVE)
+
+class IncompleteScan(ValueError):
+    """The firmware's output ended before the expected rows (a stop, timeout or USB hiccup)."""
+
+# --- Function to hold photon counts in the smallest integer type that fits ---
+def as_counts(data):
+    """Counts as the smallest unsigned int dtype; anything non-integral as float32."""
+    data = np.asarray(data)
+    if data.size and np.issubdtype(data.dtype, np.floating):
+        if data.min() < 0 or not np.all(np.mod(data, 1) == 0):
+            return data.astype(np.float32)
+    elif data.size == 0 or not np.issubdtype(data.dtype, np.integer) or data.min() < 0:
+        return data
+    return data.astype(np.min_scalar_type(int(data.max())))
+
+# --- Row order of the firmware's scan ---
+def row_order(step, order=RASTER):
+    """Row indices in the order the firmware scans them.
+
+    ``progressive`` takes every ``stride``-th row for the largest power of
+    two below ``step``, then the rows halfway between those, and so on
+    (bit-reversed line order): after a few percent of the rows the whole
+    field is covered coarsely. The Lua script builds the same sequence.
+    """
+    if order != PROGRESSIVE:
+        return np.arange(step)
+    stride = 1
+    while stride * 2 < step:
+        stride *= 2
+    passes = [np.arange(0, step, stride)]
+    while stride > 1:
+        stride //= 2
+        passes.append(np.arange(stride, step, 2 * stride))
+    return np.concatenate(passes)
+
+def to_raster(rows, index):
+    """Scatter rows acquired in ``index`` order into an image, top to bottom."""
+    image = np.empty_like(rows)
+    image[index] = rows
+    return image
+
+def fill_rows(image, acquired):
+    """Preview of a partial scan: each missing row repeats the nearest acquired row above it."""
+    if not acquired.any():
+        return image
+    nearest = np.maximum.accumulate(np.where(acquired, np.arange(len(acquired)), -1))
+    nearest[nearest < 0] = np.argmax(acquired)  # rows above the first acquired one
+    return image[nearest]
+
+# --- Function to load scan data from file ---
+def load_data_in_2x50_chunks(filename, step, rows=None, order=None, width=None):
+    # ``rows``: how many scan rows the file holds (fewer than ``step`` for a resumed scan),
+    # ``width``: values per row (2 * step with adaptive dwell: count, dwell pairs).
+    # Rows are returned in acquisition order; progressive lines start with their row index
+    rows = step if rows is None else rows
+    width = width or step
+    tagged = order == PROGRESSIVE
+    with open(filename, 'r') as f:
+        lines = [line.strip() for line in f if line.strip() and line.strip() != END_MARKER]
+
+    # Lines hold up to 25 pixels and never span rows (the firmware ends each row on
+    # a shorter line when step is not a multiple of 25), so rows are consecutive values
+    values, line_rows, line_starts = [], [], []
+    for line in lines:
+        tokens = line.split()
+        if tagged:
+            line_rows.append(int(float(tokens[0])))
+            line_starts.append(len(values))
+            tokens = tokens[1:]
+        elif tokens and tokens[0] in DUMMY_TOKENS:
+            tokens = tokens[1:]
+        values.extend(tokens)
+
+    if not values:
+        raise IncompleteScan("No valid data lines found in file.")
+    if len(values) < rows * width:
+        raise IncompleteScan(f"Expected at least {rows * width} values ({rows} rows of {width}), but got {len(values)}.")
+    if tagged:
+        # The row index of the line each row starts on must follow the host's row order
+        starts = np.searchsorted(line_starts, np.arange(rows) * width)
+        if not np.array_equal(np.asarray(line_rows)[starts], row_order(step, order)[step - rows:]):
+            raise ValueError("Rows arrived in a different order than the progressive row order.")
+
+    data_array = np.array(values[:rows * width], dtype=float).reshape(rows, width)
+    return as_counts(data_array)
+
+# --- Function to parse file metadata from filename ---
+def parse_filename_2d(filename):
+    pattern = (r"^(.*?)_xs-([-+]?[0-9]*\.?[0-9]+)_ys-([-+]?[0-9]*\.?[0-9]+)_xe-([-+]?[0-9]*\.?[0-9]+)_"
+               r"ye-([-+]?[0-9]*\.?[0-9]+)_step-([0-9]+)_dw-([-+]?[0-9]*\.?[0-9]+)_"
+               r"([0-9]{8}_[0-9]{6})\.(?:txt|qsz)$")
+    match = re.match(pattern, filename)
+    if match:
+        try:
+            timestamp = datetime.strptime(match.group(8), "%Y%m%d_%H%M%S")
+        except Exception:
+            timestamp = None
+        return {
+            "prefix": match.group(1),
+            "xs": float(match.group(2)),
+            "ys": float(match.group(3)),
+            "xe": float(match.group(4)),
+            "ye": float(match.group(5)),
+            "step": int(match.group(6)),
+            "dw": float(match.group(7)),
+            "timestamp": timestamp,
+            "filename": filename
+        }
+    else:
+        return None
+
+def parse_filename_3d(fname):
+    # Remove extension
+    ext = ".txt"
+    if fname.endswith(SCAN_EXTENSIONS):
+        fname, ext = fname[:-4], fname[-4:]
+    # Match pattern (adjust as needed for your real pattern)
+    pattern = (r"^(?P<prefix>scan)"
+               r"_xs-(?P<xs>-?\d+\.?\d*)"
+               r"_ys-(?P<ys>-?\d+\.?\d*)"
+               r"_xe-(?P<xe>-?\d+\.?\d*)"
+               r"_ye-(?P<ye>-?\d+\.?\d*)"
+               r"_step-(?P<step>\d+)"
+               r"_dw-(?P<dwell>-?\d+\.?\d*)"
+               r"_z-(?P<z>-?\d+\.?\d*)"
+               r"_(?P<timestamp>\d{8}_\d{6})$")
+    m = re.match(pattern, fname)
+    if m:
+        meta = m.groupdict()
+        # Convert to correct types
+        meta['xs'] = float(meta['xs'])
+        meta['ys'] = float(meta['ys'])
+        meta['xe'] = float(meta['xe'])
+        meta['ye'] = float(meta['ye'])
+        meta['step'] = int(meta['step'])
+        meta['dwell'] = float(meta['dwell'])
+        meta['z'] = float(meta['z'])
+        meta['timestamp'] = datetime.strptime(meta['timestamp'], "%Y%m%d_%H%M%S")
+        meta['filename'] = fname + ext
+        return meta
+    else:
+        return None
+
+# --- Function to list the parsed scan files of a folder ---
+def parse_scan_name(name):
+    """Metadata of a scan filename (3D parser for ``_z-`` names), or None for other files."""
+    if not name.endswith(SCAN_EXTENSIONS):
+        return None
+    return parse_filename_3d(name) if "_z-" in name else parse_filename_2d(name)
+
+def shadowed(name, names):
+    # A scan migrated with its text kept is listed once, as the compressed file
+    return name.endswith(".txt") and name[:-4] + codec.EXTENSION in names
+
+def list_scans(folder, three_d=False):
+    """Metadata of every scan file in ``folder``: ``_z-`` files in 3D mode, the others in 2D mode."""
+    listing = os.listdir(folder)
+    names = set(listing)
+    metas = []
+    for f in listing:
+        if ("_z-" in f) == three_d and not shadowed(f, names):
+            meta = parse_scan_name(f)
+            if meta:
+                metas.append(meta)
+    return metas
+
+# --- Function to apply the Analysis page filters to a DataFrame of scans ---
+def filter_scans(df, prefixes, x_range, y_range, date_range=None):
+    mask = df["prefix"].isin(prefixes) & df["xs"].between(*x_range) & df["ys"].between(*y_range)
+    if date_range is not None and len(date_range) == 2:
+        # Whole days, compared as timestamps so no per-row date objects are made
+        start = datetime.combine(date_range[0], time.min)
+        end = datetime.combine(date_range[1], time.min) + timedelta(days=1)
+        mask &= (df["timestamp"] >= start) & (df["timestamp"] < end)
+    return df[mask]
+
+# --- Function to build the autosave filename for a scan job ---
+def scan_filename(job, timestamp=None, fmt="txt"):
+    if timestamp is None:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    z_tag = f"_z-{job['z']}" if job.get("z") is not None else ""
+    return (f"{job['prefix']}_xs-{job['xs']}_ys-{job['ys']}_xe-{job['xe']}_ye-{job['ye']}"
+            f"_step-{job['step']}_dw-{job['dw']}{z_tag}_{timestamp}.{fmt}")
+
+# --- Function to autosave a scan array next to the other scans ---
+def save_scan(data, job, output_dir, channels=None, fmt=None):
+    save_dir = output_dir if os.path.isabs(output_dir) else os.path.join(os.getcwd(), output_dir)
+    os.makedirs(save_dir, exist_ok=True)
+    fmt = fmt or SCAN_FORMAT
+    save_path = os.path.join(save_dir, scan_filename(job, fmt=fmt))
+    if fmt == "qsz":
+        codec.write(save_path, as_counts(data))
+    else:
+        np.savetxt(save_path, data, fmt="%.6f")
+    # Extra per-pixel channels go next to the scan as <name>_<channel>.txt, which
+    # the filename parsers deliberately don't pick up as scans.
+    for name, values in (channels or {}).items():
+        np.savetxt(channel_path(save_path, name), values, fmt="%g")
+    return save_path
+
+def channel_path(scan_path, name):
+    return f"{scan_path[:-4]}_{name}.txt"
+
+def spots_path(scan_path):
+    return f"{scan_path[:-4]}_spots.csv"
+
+# --- Catalog of every saved scan and the device that took it ---
+CATALOG_NAME = "catalog.csv"
+CATALOG_FIELDS = ["filename", "device", "prefix", "xs", "ys", "xe", "ye", "step", "dw", "z", "saved"]
+_catalog_lock = threading.Lock()
+
+def append_catalog(save_path, job, device=None):
+    path = os.path.join(os.path.dirname(save_path), CATALOG_NAME)
+    row = {k: job.get(k) for k in CATALOG_FIELDS}
+    row.update(filename=os.path.basename(save_path), device=device or "any",
+               saved=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
+    # Device workers save concurrently, so serialize the appends
+    with _catalog_lock:
+        new = not os.path.exists(path)
+        with open(path, "a", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CATALOG_FIELDS)
+            if new:
+                writer.writeheader()
+            writer.writerow(row)
+
+def read_catalog(folder):
+    path = os.path.join(folder, CATALOG_NAME)
+    if not os.path.exists(path):
+        return []
+    with open(path, newline="") as f:
+        return list(csv.DictReader(f))
+
+def rename_in_catalog(folder, renames):
+    """Point catalog rows at new filenames (``{old: new}``), e.g. after a migration."""
+    path = os.path.join(folder, CATALOG_NAME)
+    with _catalog_lock:
+        rows = read_catalog(folder)
+        if not any(row["filename"] in renames for row in rows):
+            return
+        for row in rows:
+            row["filename"] = renames.get(row["filename"], row["filename"])
+        with open(path + ".tmp", "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CATALOG_FIELDS)
+            writer.writeheader()
+            writer.writerows(rows)
+        os.replace(path + ".tmp", path)
+
+# --- Functions to map pixel indices to galvo voltages ---
+def scan_axes(xs, ys, xe, ye, nx, ny=None):
+    """Voltage of every column (x) and row (y), as driven by the firmware.
+
+    The Lua script steps from start to end in ``steps - 1`` increments and
+    clamps to the +/-5 V output range, so the axes do the same.
+    """
+    ny = nx if ny is None else ny
+    x = np.clip(np.linspace(xs, xe, nx), -VOLTAGE_LIMIT, VOLTAGE_LIMIT)
+    y = np.clip(np.linspace(ys, ye, ny), -VOLTAGE_LIMIT, VOLTAGE_LIMIT)
+    return x, y
+
+def axes_from_meta(meta, shape):
+    x, y = scan_axes(meta["xs"], meta["ys"], meta["xe"], meta["ye"], shape[1], shape[0])
+    return {"x": x, "y": y, "xlabel": "X (V)", "ylabel": "Y (V)"}
+
+def transform_axes(axes, op):
+    # Keep voltage coordinates attached to the pixels through flips/rotations
+    x, y = axes["x"], axes["y"]
+    if op == "fliplr":
+        return {**axes, "x": x[::-1]}
+    if op == "flipud":
+        return {**axes, "y": y[::-1]}
+    if op == "rot_ccw":
+        return {"x": y, "y": x[::-1], "xlabel": axes["ylabel"], "ylabel": axes["xlabel"]}
+    if op == "rot_cw":
+        return {"x": y[::-1], "y": x, "xlabel": axes["ylabel"], "ylabel": axes["xlabel"]}
+    raise ValueError(f"Unknown orientation op: {op}")
+
+# --- Orientation kept as a (rotations, mirrored) pair instead of transformed copies ---
+NO_ORIENTATION = (0, False)
+
+def compose_orientation(state, op):
+    # Canonical form: mirror left-right first, then rotate k x 90 degrees CCW
+    k, mirrored = state
+    if op == "fliplr":
+        return (-k % 4, not mirrored)
+    if op == "flipud":
+        return ((2 - k) % 4, not mirrored)
+    if op == "rot_ccw":
+        return ((k + 1) % 4, mirrored)
+    if op == "rot_cw":
+        return ((k - 1) % 4, mirrored)
+    raise ValueError(f"Unknown orientation op: {op}")
+
+def orient(data, state):
+    # np.fliplr/np.rot90 return views, so no pixel data is copied
+    k, mirrored = state
+    return np.rot90(np.fliplr(data) if mirrored else data, k)
+
+def orient_axes(axes, state):
+    k, mirrored = state
+    if mirrored:
+        axes = transform_axes(axes, "fliplr")
+    for _ in range(k):
+        axes = transform_axes(axes, "rot_ccw")
+    return axes
+
+def roi_from_box(box_x, box_y, axes, meta):
+    """Turn a box selection (in displayed axis units) into a scan window.
+
+    Start/end keep the direction of the original scan ``meta`` so the
+    rescanned image comes out with the same orientation.
+    """
+    if axes["xlabel"].startswith("Y"):
+        box_x, box_y = box_y, box_x
+    x_lo, x_hi = sorted(float(v) for v in box_x)
+    y_lo, y_hi = sorted(float(v) for v in box_y)
+    xs, xe = (x_lo, x_hi) if meta["xs"] <= meta["xe"] else (x_hi, x_lo)
+    ys, ye = (y_lo, y_hi) if meta["ys"] <= meta["ye"] else (y_hi, y_lo)
+    return {"xs": round(xs, 4), "ys": round(ys, 4), "xe": round(xe, 4), "ye": round(ye, 4)}
@@ -0,0 +1,208 @@
+"""Stand-in for scanwitharg.exe + the LabJack firmware.
+
+Takes the same arguments as scanwitharg.exe and writes the same
+``lua_output.txt`` stream (lines of 25 counts behind a "0" token, then
+the end marker), with photon counts drawn from a fixed synthetic sample:
+emitters at fixed voltages on a Poisson background. The same voltages
+always show the same emitters, so region rescans, tiles and Z slices of
+the simulated sample line up like real ones.
+
+    python simulator.py -xs 1 -ys 1 -xe -1 -ye -1 -st 100 -dw 1 [-y0 0] [-po] [-tc 0] [-o lua_output.txt] [--speed 0]
+    python simulator.py -mon -xs 0.2 -ys 0.1 -dw 10 -o - [-stop monitor.stop]
+
+With ``-tc`` (target counts) each pixel stops at that many counts or at
+``dw`` ms, and is written as a (count, dwell ms) pair. With ``-mon`` it
+counts at (xs, ys) like the firmware's monitor mode: lines of samples
+every ``dw`` ms until the stop file appears.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+from scan_io import END_MARKER, MONITOR_END, PROGRESSIVE, RASTER, VOLTAGE_LIMIT, row_order
+
+LINE_LENGTH = 25
+BACKGROUND_RATE = 8.0     # counts per ms of dwell
+EMITTER_RATE = 40.0       # peak counts per ms of dwell
+EMITTER_SIGMA = 0.02      # volts
+EMITTER_DENSITY = 20.0    # emitters per square volt
+
+# --- The synthetic sample: emitter positions fixed in voltage space ---
+def sample_emitters(seed=0):
+    rng = np.random.default_rng(seed)
+    n = int(EMITTER_DENSITY * (2 * VOLTAGE_LIMIT) ** 2)
+    return rng.uniform(-VOLTAGE_LIMIT, VOLTAGE_LIMIT, size=(n, 2)), rng.uniform(0.3, 1.0, size=n)
+
+def expected_counts(x, y, dw, z=None, seed=0):
+    """Mean counts per pixel on the grid ``x`` (columns) by ``y`` (rows), in volts.
+
+    Each emitter is only evaluated on the pixels within 4 sigma of it, so
+    the cost grows with the emitters in view, not with the scan size
+    times the emitter count. ``z`` defocuses the emitters.
+    """
+    pos, brightness = sample_emitters(seed)
+    sigma = EMITTER_SIGMA * (1.0 + (0.0 if z is None else abs(float(z))))
+    rate = np.full((len(y), len(x)), BACKGROUND_RATE, dtype=np.float64)
+    xmin, xmax, ymin, ymax = min(x[0], x[-1]), max(x[0], x[-1]), min(y[0], y[-1]), max(y[0], y[-1])
+    reach = 4 * sigma
+    inside = ((pos[:, 0] > xmin - reach) & (pos[:, 0] < xmax + reach) &
+              (pos[:, 1] > ymin - reach) & (pos[:, 1] < ymax + reach))
+    xs_sorted, ys_sorted = x[0] <= x[-1], y[0] <= y[-1]
+    for (ex, ey), b in zip(pos[inside], brightness[inside]):
+        c0, c1 = _window(x, ex - reach, ex + reach, xs_sorted)
+        r0, r1 = _window(y, ey - reach, ey + reach, ys_sorted)
+        if c1 > c0 and r1 > r0:
+            gx = np.exp(-(x[c0:c1] - ex) ** 2 / (2 * sigma ** 2))
+            gy = np.exp(-(y[r0:r1] - ey) ** 2 / (2 * sigma ** 2))
+            rate[r0:r1, c0:c1] += EMITTER_RATE * b / (1.0 + (0.0 if z is None else float(z) ** 2)) * np.outer(gy, gx)
+    return rate * dw
+
+def _window(axis, lo, hi, ascending):
+    # Index range of the axis values within [lo, hi]
+    if ascending:
+        return np.searchsorted(axis, lo), np.searchsorted(axis, hi, side="right")
+    rev = axis[::-1]
+    n = len(axis)
+    return n - np.searchsorted(rev, hi, side="right"), n - np.searchsorted(rev, lo)
+
+def synthetic_scan(job, seed=0, noise_seed=None):
+    """A (step, step) array of integer counts for ``job`` (an acquisition job dict)."""
+    x = np.clip(np.linspace(job["xs"], job["xe"], job["step"]), -VOLTAGE_LIMIT, VOLTAGE_LIMIT)
+    y = np.clip(np.linspace(job["ys"], job["ye"], job["step"]), -VOLTAGE_LIMIT, VOLTAGE_LIMIT)
+    rate = expected_counts(x, y, job["dw"], job.get("z"), seed)
+    return np.random.default_rng(noise_seed).poisson(rate).astype(np.uint32)
+
+def adaptive_scan(job, target, seed=0, noise_seed=None):
+    """(step, 2 * step) interleaved (count, dwell ms) pixels of ``job`` with ``dw`` as the maximum dwell.
+
+    The wait for ``target`` photons is Gamma distributed; a pixel that
+    runs out of time reports the (fewer) counts of its full ``dw``.
+    """
+    x = np.clip(np.linspace(job["xs"], job["xe"], job["step"]), -VOLTAGE_LIMIT, VOLTAGE_LIMIT)
+    y = np.clip(np.linspace(job["ys"], job["ye"], job["step"]), -VOLTAGE_LIMIT, VOLTAGE_LIMIT)
+    per_ms = expected_counts(x, y, 1.0, job.get("z"), seed)
+    rng = np.random.default_rng(noise_seed)
+    wait = rng.gamma(target, 1.0 / per_ms)
+    capped = wait >= job["dw"]
+    dwell = np.where(capped, job["dw"], wait)
+    counts = np.where(capped, np.minimum(rng.poisson(per_ms * job["dw"]), target - 1), target)
+    pairs = np.empty((job["step"], 2 * job["step"]))
+    pairs[:, 0::2], pairs[:, 1::2] = counts, dwell
+    return pairs
+
+# --- The firmware's text stream ---
+def lua_lines(image, line_length=LINE_LENGTH, rows=None, tagged=False):
+    """Yield the firmware's output lines for ``image``, row by row, then the end marker.
+
+    Each row is ``line_length`` values per line, the last line of a row
+    shorter when the width is not a multiple of it. ``rows`` picks the
+    rows and their order; ``tagged`` lines start with the row index.
+    """
+    image = np.asarray(image)
+    for y in range(len(image)) if rows is None else rows:
+        row = image[y].tolist()
+        tag = "%.6f" % y if tagged else "0.000000"
+        for c in range(0, len(row), line_length):
+            chunk = row[c:c + line_length]
+            yield (tag + " %.6f" * len(chunk)) % tuple(chunk)
+    yield END_MARKER
+
+def write_lua_output(path, image, line_seconds=0.0, rows=None, tagged=False, stop_path=None,
+                     line_length=LINE_LENGTH):
+    # Lines are flushed one by one so progress polling sees them arrive. ``line_seconds`` is
+    # the same for every line, or an array of seconds per image row spread over its lines
+    if np.ndim(line_seconds):
+        per_row = -(-np.shape(image)[1] // line_length)
+        pace = iter(np.repeat(np.asarray(line_seconds)[rows if rows is not None else slice(None)] / per_row,
+                              per_row).tolist())
+    else:
+        pace = None
+    with open(path, "w") as f:
+        for line in lua_lines(image, line_length, rows=rows, tagged=tagged):
+            if stop_path and os.path.exists(stop_path) and line != END_MARKER:
+                os.remove(stop_path)
+                f.write(END_MARKER + "\n")
+                break
+            f.write(line + "\n")
+            seconds = line_seconds if pace is None else next(pace, 0.0)
+            if seconds:
+                f.flush()
+                time.sleep(seconds)
+
+# --- The firmware's monitor mode: counts at one spot until told to stop ---
+def monitor_lines(x, y, dw, seed=0, noise_seed=None):
+    """Yield monitor-mode lines forever, about 100 ms of ``dw`` ms samples each (at most 25)."""
+    rate = expected_counts(np.array([x]), np.array([y]), dw, seed=seed)[0, 0]
+    per_line = max(1, min(LINE_LENGTH, int(100 // dw)))
+    fmt = "0" + " %d" * per_line
+    rng = np.random.default_rng(noise_seed)
+    while True:
+        yield fmt % tuple(rng.poisson(rate, per_line).tolist()), per_line * dw / 1000
+
+def run_monitor(args):
+    out = sys.stdout if args.o == "-" else open(args.o, "w")
+    speed = args.speed or 1.0  # an open-ended stream always runs at (a multiple of) the real pace
+    if os.path.exists(args.stop):
+        os.remove(args.stop)  # left over from an earlier run
+    try:
+        for line, seconds in monitor_lines(args.xs, args.ys, args.dw, args.seed):
+            if os.path.exists(args.stop):
+                os.remove(args.stop)
+                break
+            out.write(line + "\n")
+            out.flush()
+            time.sleep(seconds / speed)
+        out.write(MONITOR_END + "\n")
+        out.flush()
+    except BrokenPipeError:
+        pass  # the reader went away, which also stops the firmware
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulated scanwitharg.exe")
+    for flag in ["-xs", "-ys", "-dw"]:
+        parser.add_argument(flag, type=float, required=True)
+    for flag in ["-xe", "-ye"]:
+        parser.add_argument(flag, type=float)
+    parser.add_argument("-st", type=int)
+    parser.add_argument("-y0", type=int, default=0, help="first row to scan (resuming)")
+    parser.add_argument("-sn", default="LJM_idANY")
+    parser.add_argument("-o", default="lua_output.txt")
+    parser.add_argument("--speed", type=float, default=float(os.environ.get("QSCOPE_SIMULATOR_SPEED", 0)),
+                        help="1 runs at the real firmware's pace, 10 ten times faster, 0 as fast as possible")
+    parser.add_argument("-po", action="store_true", help="progressive (coarse-to-fine) row order")
+    parser.add_argument("-tc", type=float, default=0.0, help="target counts per pixel; -dw is then the maximum")
+    parser.add_argument("-mon", action="store_true", help="monitor the count rate at (xs, ys)")
+    parser.add_argument("-stop", help="the scan (monitor) ends when this file appears")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    if args.mon:
+        args.stop = args.stop or "monitor.stop"
+        return run_monitor(args)
+    if None in (args.xe, args.ye, args.st):
+        parser.error("-xe, -ye and -st are required for a scan")
+    if args.st < 2:
+        print("Error: 'steps' must be at least 2.", file=sys.stderr)
+        return 1
+    job = {"xs": args.xs, "ys": args.ys, "xe": args.xe, "ye": args.ye, "step": args.st, "dw": args.dw}
+    rows = row_order(args.st, PROGRESSIVE if args.po else RASTER)[args.y0:]
+    if args.tc > 0:
+        image = adaptive_scan(job, args.tc, seed=args.seed)
+        # Each row takes the dwell its pixels actually spent, with the same overhead as below
+        row_seconds = image[:, 1::2].sum(axis=1) / 1000 * 1.65 / args.speed if args.speed else 0.0
+        write_lua_output(args.o, image, row_seconds, rows, args.po, args.stop, 2 * LINE_LENGTH)
+        return 0
+    image = synthetic_scan(job, seed=args.seed)
+    # Same per-pixel overhead as acquisition.estimate_seconds
+    line_seconds = min(LINE_LENGTH, args.st) * args.dw / 1000 * 1.65 / args.speed if args.speed else 0.0
+    write_lua_output(args.o, image, line_seconds, rows, args.po, args.stop)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -15,7 +15,8 @@
 #include <LabJackM.h>
 #include "LJM_Utilities.h"
 
-void ReadLuaInfo(int handle);
+void ReadLuaInfo(int handle, const char *outputPath, const char *stopPath);
+void ReadMonitor(int handle, const char *outputPath, const char *stopPath);
 
 int main(int argc, char *argv[])
 {
@@ -25,7 +26,14 @@ int main(int argc, char *argv[])
     double x_end = -0.5;
     double y_end = -0.5;
     int steps = 50;
+    int first_row = 0;                        // Resume: rows before this one are already saved
     double dwell = 2.0;
+    const char *identifier = "LJM_idANY";     // Device serial number, IP or name
+    const char *outputPath = "lua_output.txt";
+    int progressive = 0;                      // Row order: 0 top to bottom, 1 coarse-to-fine
+    double target = 0.0;                      // Adaptive dwell: counts per pixel, dwell is then the maximum
+    bool monitor = false;                     // Count at (x_start, y_start) until the stop file appears
+    const char *stopPath = NULL;              // A scan ends early (a monitor ends) when this file appears
 
     // Parse command line arguments
     for (int i = 1; i < argc; i++) {
@@ -44,9 +52,30 @@ int main(int argc, char *argv[])
         else if (strcmp(argv[i], "-st") == 0 && i + 1 < argc) {
             steps = atoi(argv[++i]);
         }
+        else if (strcmp(argv[i], "-y0") == 0 && i + 1 < argc) {
+            first_row = atoi(argv[++i]);
+        }
         else if (strcmp(argv[i], "-dw") == 0 && i + 1 < argc) {
             dwell = atof(argv[++i]);
         }
+        else if (strcmp(argv[i], "-sn") == 0 && i + 1 < argc) {
+            identifier = argv[++i];
+        }
+        else if (strcmp(argv[i], "-o") == 0 && i + 1 < argc) {
+            outputPath = argv[++i];
+        }
+        else if (strcmp(argv[i], "-tc") == 0 && i + 1 < argc) {
+            target = atof(argv[++i]);
+        }
+        else if (strcmp(argv[i], "-po") == 0) {
+            progressive = 1;
+        }
+        else if (strcmp(argv[i], "-mon") == 0) {
+            monitor = true;
+        }
+        else if (strcmp(argv[i], "-stop") == 0 && i + 1 < argc) {
+            stopPath = argv[++i];
+        }
         else {
             fprintf(stderr, "Unknown option or missing argument: %s\n", argv[i]);
             return 1;
@@ -58,7 +87,7 @@ int main(int argc, char *argv[])
     int errorAddress;
     int handle;
     
-    handle = OpenOrDie(LJM_dtT7, LJM_ctANY, "LJM_idANY");
+    handle = OpenOrDie(LJM_dtT7, LJM_ctANY, identifier);
     // LJM_eWriteAddress(handle,61998,1,1279918080);
     // Optionally, read initial debug bytes (if any) as in your original code
     numBytes = 0;
@@ -79,6 +108,17 @@ int main(int argc, char *argv[])
         free(aBytes);
     }
 
+    if (monitor) {
+        // Monitor mode: park at the start voltages and stream counts until told to stop
+        LJM_eWriteName(handle, "USER_RAM0_F32", x_start);  // X voltage
+        LJM_eWriteName(handle, "USER_RAM1_F32", y_start);  // Y voltage
+        LJM_eWriteName(handle, "USER_RAM4_F32", dwell);    // Sample period (ms)
+        LJM_eWriteName(handle, "USER_RAM2_U16", 2);        // Set Flag to 2 to run the monitor
+        ReadMonitor(handle, outputPath, stopPath != NULL ? stopPath : "monitor.stop");
+        CloseOrDie(handle);
+        return LJME_NOERROR;
+    }
+
     // Write scan parameters to registers
     LJM_eWriteName(handle, "USER_RAM0_F32", x_start);  // X start voltage
     LJM_eWriteName(handle, "USER_RAM1_F32", y_start);  // Y start voltage
@@ -86,14 +126,17 @@ int main(int argc, char *argv[])
     LJM_eWriteName(handle, "USER_RAM3_F32", y_end);    // Y end voltage
     LJM_eWriteName(handle, "USER_RAM0_U16", steps);    // Number of steps
     LJM_eWriteName(handle, "USER_RAM4_F32", dwell);    // Dwell time (ms)
+    LJM_eWriteName(handle, "USER_RAM1_U16", first_row); // First row to scan
+    LJM_eWriteName(handle, "USER_RAM3_U16", progressive); // Row order
+    LJM_eWriteName(handle, "USER_RAM5_F32", target);   // Target counts (0 = fixed dwell)
     LJM_eWriteName(handle, "USER_RAM2_U16", 1);        // Set Flag to 1 to run the scan
 
-    ReadLuaInfo(handle);
+    ReadLuaInfo(handle, outputPath, stopPath);
     CloseOrDie(handle);
     return LJME_NOERROR;
 }
 
-void ReadLuaInfo(int handle)
+void ReadLuaInfo(int handle, const char *outputPath, const char *stopPath)
 {
     int byteIter, err;
     double numBytes;
@@ -101,7 +144,7 @@ void ReadLuaInfo(int handle)
     int errorAddress;
 
     // Open file for writing
-    FILE *fp = fopen("lua_output.txt", "w");
+    FILE *fp = fopen(outputPath, "w");
     if (fp == NULL) {
         perror("Failed to open file");
         return;
@@ -109,8 +152,20 @@ void ReadLuaInfo(int handle)
 
     // Record the time when the last data was received.
     time_t lastDataTime = time(NULL);
+    bool stopping = false;
 
     while (true) {
+        // Early stop: the firmware finishes its current row, then prints the end marker
+        if (stopPath != NULL && !stopping) {
+            FILE *stop = fopen(stopPath, "r");
+            if (stop != NULL) {
+                fclose(stop);
+                remove(stopPath);
+                LJM_eWriteName(handle, "USER_RAM2_U16", 0);
+                stopping = true;
+            }
+        }
+
         // Optional: add a short sleep to reduce CPU usage (e.g., 100 milliseconds)
         // struct timespec req = {0, 100 * 1000000};  // 100 milliseconds
         // nanosleep(&req, NULL);
@@ -160,3 +215,79 @@ void ReadLuaInfo(int handle)
     }
     fclose(fp);  // Close the file
 }
+
+// Monitor output is open-ended, so it is streamed ("-o -" for stdout) rather than
+// collected: the host stops it by creating stopPath or by closing the pipe.
+void ReadMonitor(int handle, const char *outputPath, const char *stopPath)
+{
+    int err;
+    double numBytes;
+    char *aBytes;
+    int errorAddress;
+    bool stopping = false;
+    const char *searchString = "Monitor Stopped.";
+
+    FILE *fp = strcmp(outputPath, "-") == 0 ? stdout : fopen(outputPath, "w");
+    if (fp == NULL) {
+        perror("Failed to open file");
+        LJM_eWriteName(handle, "USER_RAM2_U16", 0);
+        return;
+    }
+    remove(stopPath);
+    time_t lastDataTime = time(NULL);
+
+    while (true) {
+        if (!stopping) {
+            FILE *stop = fopen(stopPath, "r");
+            if (stop != NULL) {
+                fclose(stop);
+                remove(stopPath);
+                LJM_eWriteName(handle, "USER_RAM2_U16", 0);  // The firmware finishes its line and parks at 0 V
+                stopping = true;
+            }
+        }
+
+        numBytes = 0;
+        err = LJM_eReadName(handle, "LUA_DEBUG_NUM_BYTES", &numBytes);
+        ErrorCheck(err, "LJM_eReadName(%d, LUA_DEBUG_NUM_BYTES, ...)", handle);
+
+        if ((int)numBytes == 0) {
+            if (difftime(time(NULL), lastDataTime) > 10.0) {
+                LJM_eWriteName(handle, "USER_RAM2_U16", 0);
+                fprintf(stderr, "Timeout: No data received for 10 seconds. Exiting.\n");
+                break;
+            }
+            MillisecondSleep(10);
+            continue;
+        }
+        lastDataTime = time(NULL);
+
+        aBytes = malloc(sizeof(char) * ((int)numBytes + 1));
+        errorAddress = INITIAL_ERR_ADDRESS;
+        err = LJM_eReadNameByteArray(
+            handle,
+            "LUA_DEBUG_DATA",
+            numBytes,
+            aBytes,
+            &errorAddress
+        );
+        if (err == LJME_NOERROR) {
+            aBytes[(int)numBytes] = '\0';
+            fwrite(aBytes, 1, (int)numBytes, fp);
+            // A reader that went away counts as a stop request
+            if (fflush(fp) != 0 && !stopping) {
+                LJM_eWriteName(handle, "USER_RAM2_U16", 0);
+                stopping = true;
+            }
+            if (strstr(aBytes, searchString) != NULL) {
+                free(aBytes);
+                break;
+            }
+        }
+        free(aBytes);
+        ErrorCheck(err, "LJM_eReadNameByteArray(%d, LUA_DEBUG_DATA, ...", handle);
+    }
+    if (fp != stdout) {
+        fclose(fp);
+    }
+}
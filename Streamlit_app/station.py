@@ -0,0 +1,184 @@
+import os
+import threading
+import time
+
+import numpy as np
+
+from scan_io import fill_rows, row_order
+
+# Next to the code, so the app, runner.py and the API server share one lock whatever their working directory
+LOCK_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".acquisition.lock")
+LOG_LENGTH = 50
+
+# --- OS-level lock on the hardware, released by the OS if the process dies ---
+def lock_hardware(path=LOCK_FILE):
+    """Open and exclusively lock ``path``; return the open file, or None if
+    another process (e.g. a second Streamlit server) holds it."""
+    f = open(path, "a+")
+    try:
+        f.seek(0)
+        if os.name == "nt":
+            import msvcrt
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        f.close()
+        return None
+    return f
+
+def unlock_hardware(f):
+    try:
+        if os.name == "nt":
+            import msvcrt
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    finally:
+        f.close()
+
+# --- The single owner of the scanner, shared by every browser session ---
+class Station:
+    """Process-wide acquisition state.
+
+    Streamlit runs every browser session as a thread of one process, so one
+    module-level ``Station`` is seen by all of them. ``start`` takes the
+    hardware lock and runs the acquisition in a worker thread; the worker
+    publishes progress, log lines and finished frames here. Sessions only
+    read ``snapshot()``/``latest_frame()`` (or block in ``wait``), so any
+    number of viewers cost a dictionary copy per poll.
+    """
+
+    def __init__(self, lock_path=LOCK_FILE):
+        self.lock_path = lock_path
+        self._cond = threading.Condition()
+        self._busy = threading.Lock()
+        self._stop = threading.Event()
+        self._version = 0
+        self._frame = None
+        self._live = None
+        self._state = {"running": False, "owner": None, "label": "", "fraction": 0.0,
+                       "message": "", "log": [], "saved": [], "started": None, "finished": None}
+
+    # --- Driving the hardware (one session at a time) ---
+    def start(self, owner, label, work):
+        """Run ``work(station)`` in a worker thread as ``owner``.
+
+        Returns False without doing anything when a scan is already running
+        in this or another process.
+        """
+        if not self._busy.acquire(blocking=False):
+            return False
+        handle = lock_hardware(self.lock_path)
+        if handle is None:
+            self._busy.release()
+            return False
+        self._stop.clear()
+        self._update(running=True, owner=owner, label=label, fraction=0.0, message="Starting...",
+                     log=[], saved=[], started=time.time(), finished=None)
+        threading.Thread(target=self._run, args=(work, handle), daemon=True).start()
+        return True
+
+    def _run(self, work, handle):
+        try:
+            work(self)
+        except Exception as e:
+            self.log("error", f"Acquisition failed: {e}")
+        finally:
+            unlock_hardware(handle)
+            self._update(running=False, finished=time.time())
+            self._busy.release()
+
+    def request_stop(self):
+        """Ask the running work to finish; open-ended work (monitor mode) polls ``stop_requested``."""
+        self._stop.set()
+
+    # --- Called by the worker ---
+    def stop_requested(self):
+        return self._stop.is_set()
+
+    def progress(self, fraction, message=""):
+        self._update(fraction=min(max(fraction, 0.0), 1.0), message=message)
+
+    def message(self, message):
+        self._update(message=message)
+
+    def log(self, level, message):
+        with self._cond:
+            self._state["log"] = (self._state["log"] + [(level, message)])[-LOG_LENGTH:]
+            self._version += 1
+            self._cond.notify_all()
+
+    def publish_rows(self, meta, first, rows):
+        """Add newly completed rows of the scan in progress; a new ``meta``
+        (job dict) starts a new live image. ``first`` counts in acquisition
+        order (``scan_io.row_order``), and the rows are scattered into place."""
+        with self._cond:
+            live = self._live
+            if live is None or live["meta"] is not meta:
+                step = meta["step"]
+                live = {"seq": (live["seq"] + 1) if live else 1, "meta": meta, "rows": 0,
+                        "order": row_order(step, meta.get("order")), "acquired": np.zeros(step, dtype=bool),
+                        "image": np.zeros((step, step), dtype=np.float32)}
+                self._live = live
+            index = live["order"][first:first + len(rows)]
+            live["image"][index] = rows
+            live["acquired"][index] = True
+            live["rows"] = max(live["rows"], first + len(rows))
+            self._version += 1
+            self._cond.notify_all()
+
+    def live_rows(self, seq, start):
+        """(seq, meta, first row, rows) of the live image from row ``start``
+        on (in acquisition order), or from row 0 when ``seq`` is no longer
+        the live scan."""
+        with self._cond:
+            live = self._live
+            if live is None:
+                return None
+            first = start if live["seq"] == seq else 0
+            return live["seq"], live["meta"], first, live["image"][live["order"][first:live["rows"]]]
+
+    def live_preview(self):
+        """(meta, image, rows acquired) of the scan in progress, its missing
+        rows filled from the acquired ones; None before the first row."""
+        with self._cond:
+            live = self._live
+            if live is None or not live["rows"]:
+                return None
+            return live["meta"], fill_rows(live["image"], live["acquired"]), live["rows"]
+
+    def publish_frame(self, data, meta, path=None):
+        data.flags.writeable = False  # every session shares this array
+        with self._cond:
+            self._version += 1
+            self._frame = {"version": self._version, "data": data, "meta": meta, "path": path}
+            if path is not None:
+                self._state = {**self._state, "saved": self._state["saved"] + [path]}
+            self._cond.notify_all()
+
+    def _update(self, **changes):
+        with self._cond:
+            self._state = {**self._state, **changes}
+            self._version += 1
+            self._cond.notify_all()
+
+    # --- Read side, for any number of sessions ---
+    def snapshot(self):
+        with self._cond:
+            return {**self._state, "version": self._version,
+                    "frame_version": self._frame["version"] if self._frame else 0,
+                    "live_seq": self._live["seq"] if self._live else 0,
+                    "live_rows": self._live["rows"] if self._live else 0}
+
+    def latest_frame(self):
+        with self._cond:
+            return self._frame
+
+    def wait(self, version, timeout=None):
+        """Block until anything newer than ``version`` is published; return the snapshot."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._version > version, timeout)
+        return self.snapshot()
+
+STATION = Station()
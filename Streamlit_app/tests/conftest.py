@@ -0,0 +1,5 @@
+# The app's modules sit next to this folder, not in a package
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,26 @@
+import os
+
+import pytest
+
+from api_server import data_path
+
+@pytest.fixture
+def root(tmp_path):
+    (tmp_path / "data" / "run1").mkdir(parents=True)
+    return tmp_path / "data"
+
+def test_folders_resolve_under_the_root(root):
+    assert data_path(str(root), "run1") == os.path.realpath(root / "run1")
+    assert data_path(str(root), str(root / "run1")) == os.path.realpath(root / "run1")
+    assert data_path(str(root), ".") == os.path.realpath(root)
+
+@pytest.mark.parametrize("path", ["..", "../data2", "run1/../../etc", "/etc"])
+def test_folders_outside_the_root_are_refused(root, path):
+    with pytest.raises(ValueError, match="outside the data folder"):
+        data_path(str(root), path)
+
+def test_a_link_out_of_the_root_is_refused(root, tmp_path):
+    (tmp_path / "elsewhere").mkdir()
+    os.symlink(tmp_path / "elsewhere", root / "link")
+    with pytest.raises(ValueError):
+        data_path(str(root), "link")
@@ -0,0 +1,78 @@
+import os
+
+import numpy as np
+import pytest
+
+from acquisition import make_job
+from checkpoint import Checkpoint, checkpoint_path, peek_checkpoint, resume_point, run_checkpointed
+from runner import acquisition_work
+from station import Station
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # run_scan writes lua_output.txt to the working directory; the simulator runs flat out
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.delenv("QSCOPE_SIMULATOR_SPEED", raising=False)
+    return tmp_path
+
+def z_jobs(n=3, step=25):
+    return [make_job(0.2, 0.2, -0.2, -0.2, step, 1.0, "stack", float(z)) for z in range(n)]
+
+def test_stop_between_slices_keeps_the_saved_slices(workdir):
+    station = Station(str(workdir / "lock"))
+    jobs, out = z_jobs(), str(workdir / "data")
+    publish = station.publish_frame
+
+    def stop_after_first(data, meta, path=None):
+        publish(data, meta, path)
+        station.request_stop()
+
+    station.publish_frame = stop_after_first
+    acquisition_work(station, jobs, out, [], scanner="simulator")
+    assert resume_point(out, jobs) == (1, 0)
+
+    # The resume skips the saved slice and acquires the rest
+    station = Station(str(workdir / "lock"))
+    acquisition_work(station, jobs, out, [], scanner="simulator", resume=True)
+    saved = sorted(f for f in os.listdir(out) if f.startswith("stack_"))
+    assert len(saved) == 3
+    assert any("already saved" in message for _, message in station.snapshot()["log"])
+    # A complete run leaves no checkpoints behind
+    assert not any(os.path.exists(checkpoint_path(out, job)) for job in jobs)
+
+def test_checkpoint_resumes_after_the_last_full_row(workdir):
+    job = z_jobs(1, step=4)[0]
+    path = checkpoint_path(str(workdir), job)
+    ckpt = Checkpoint(path, job)
+    ckpt.append(0, np.arange(8.0).reshape(2, 4))
+    ckpt.close()
+    with open(path, "a") as f:
+        f.write("2 1 2")  # a row cut short by a crash
+    assert peek_checkpoint(path, job) == (2, None)
+    again = Checkpoint(path, job)
+    assert again.rows == 2 and np.array_equal(again.image[:2], np.arange(8.0).reshape(2, 4))
+
+def test_mismatched_rows_are_an_error(workdir):
+    job = z_jobs(1, step=4)[0]
+    ckpt = Checkpoint(checkpoint_path(str(workdir), job), job)
+
+    def run(job, on_rows=None, first_row=0, **kwargs):
+        on_rows(first_row + 1, np.zeros((1, 4)))  # skips a row
+
+    with pytest.raises(ValueError, match="Checkpoint"):
+        run_checkpointed(ckpt, run=run)
+
+def test_short_output_is_retried_from_the_checkpoint(workdir):
+    from scan_io import IncompleteScan
+    job = z_jobs(1, step=4)[0]
+    ckpt = Checkpoint(checkpoint_path(str(workdir), job), job)
+    calls = []
+
+    def run(job, on_rows=None, first_row=0, **kwargs):
+        calls.append(first_row)
+        on_rows(first_row, np.ones((2, 4)))
+        if first_row + 2 < 4:
+            raise IncompleteScan("output ended early")
+
+    assert run_checkpointed(ckpt, run=run).shape == (4, 4)
+    assert calls == [0, 2]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+
+import codec
+from batch import load_scan_file
+
+rng = np.random.default_rng(0)
+
+SCANS = {
+    "u1": rng.poisson(3, (70, 50)).astype(np.uint8),
+    "u2": rng.poisson(400, (70, 50)).astype(np.uint16),
+    "u4": rng.integers(0, 2 ** 32, (70, 50), dtype=np.uint32),
+    "f4": rng.normal(size=(70, 50)).astype(np.float32),
+    "f8": rng.normal(size=(70, 50)),
+    # Bright and smooth, so the row-difference filter wins
+    "ramp": (np.arange(70)[:, None] * 1000 + np.arange(50)).astype(np.uint32),
+}
+
+@pytest.mark.parametrize("name", SCANS)
+def test_arrays_round_trip(name, tmp_path):
+    data = SCANS[name]
+    assert np.array_equal(codec.decode(codec.encode(data)), data)
+    path = str(tmp_path / f"scan{codec.EXTENSION}")
+    codec.write(path, data)
+    back = load_scan_file(path)
+    assert back.dtype == data.dtype and np.array_equal(back, data)
+
+def test_row_differences_are_used_when_smaller():
+    assert codec.encode_chunk(SCANS["ramp"][:32])[0] == codec.ROW_DELTA
+    assert len(codec.encode(SCANS["ramp"])) < SCANS["ramp"].nbytes // 4
+
+@pytest.mark.parametrize("start, stop", [(0, 1), (31, 33), (32, 64), (5, 70), (69, None), (40, 40)])
+def test_rows_are_read_across_chunk_boundaries(start, stop, tmp_path):
+    data = SCANS["u2"]
+    path = str(tmp_path / f"scan{codec.EXTENSION}")
+    codec.write(path, data)
+    f = codec.QszFile(path)
+    assert np.array_equal(f.rows(start, stop), data[start:stop])
+    assert np.array_equal(f.tile(10, 45, 7, 20), data[10:45, 7:20])
+
+def test_big_endian_and_empty_scans():
+    data = SCANS["u2"].astype(">u2")
+    assert np.array_equal(codec.decode(codec.encode(data)), data)
+    assert codec.decode(codec.encode(np.empty((0, 5), np.uint16))).shape == (0, 5)
+
+def test_unsupported_and_foreign_data_are_refused():
+    with pytest.raises(ValueError, match="Cannot store"):
+        codec.encode(np.zeros((2, 2), np.int16))
+    with pytest.raises(ValueError, match="Not a compressed scan"):
+        codec.decode(b"\0" * codec.HEADER.size, "x.qsz")
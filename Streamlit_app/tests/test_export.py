@@ -0,0 +1,59 @@
+import json
+from datetime import datetime
+from xml.etree import ElementTree
+
+import numpy as np
+import pytest
+from PIL import Image, ImageSequence
+
+from export import ome_xml, submit_export, tiff_dtype, write_tiff
+
+def read_pages(path):
+    with Image.open(path) as im:
+        return [(np.array(page), page.tag_v2.get(270)) for page in ImageSequence.Iterator(im)]
+
+@pytest.mark.parametrize("data, expected", [
+    (np.array([[0, 65535]]), np.uint16),
+    (np.array([[0, 65536]]), np.int32),
+    (np.array([[-1, 3]]), np.int32),
+    (np.array([[0.0, 2.0]]), np.uint16),  # whole-number floats are counts
+    (np.array([[0.5, 2.0]]), np.float32),
+])
+def test_smallest_lossless_type(data, expected):
+    assert tiff_dtype(data) == np.dtype(expected)
+
+@pytest.mark.parametrize("dtype", ["auto", "uint16", "int32", "float32"])
+def test_pages_round_trip_with_their_metadata(dtype, tmp_path):
+    rng = np.random.default_rng(1)
+    pages = [rng.poisson(200, (20, 30)).astype(np.uint32) for _ in range(3)]
+    metas = [{"z": float(i), "timestamp": datetime(2025, 1, 1, 12, 0, i)} for i in range(3)]
+    path, count = write_tiff(str(tmp_path / "out" / "stack.tiff"), iter(pages), metas=metas, dtype=dtype)
+    assert count == 3
+    read = read_pages(path)
+    for (arr, description), page, meta in zip(read, pages, metas):
+        assert np.array_equal(arr, page) and arr.dtype == tiff_dtype(page, dtype)
+        assert json.loads(description) == {"z": meta["z"], "timestamp": meta["timestamp"].isoformat()}
+
+def test_values_that_do_not_fit_are_refused(tmp_path):
+    with pytest.raises(ValueError, match="don't fit"):
+        write_tiff(str(tmp_path / "x.tiff"), [np.array([[70000]])], dtype="uint16")
+
+def test_ome_stack_describes_every_page_on_the_first(tmp_path):
+    pages = [np.full((8, 6), i, dtype=np.float32) + 0.5 for i in range(4)]
+    path, _ = write_tiff(str(tmp_path / "s.ome.tiff"), pages, dtype="float32", ome=('a "stack"', (8, 6), 4))
+    read = read_pages(path)
+    assert len(read) == 4 and read[0][1] == ome_xml('a "stack"', (8, 6), 4, np.float32)
+    ns = {"ome": "http://www.openmicroscopy.org/Schemas/OME/2016-06"}
+    image = ElementTree.fromstring(read[0][1]).find("ome:Image", ns)
+    assert image.get("Name") == 'a "stack"' and image.find("ome:Pixels", ns).get("Type") == "float"
+    assert all(np.array_equal(arr, page) for (arr, _), page in zip(read, pages))
+
+def test_background_export_loads_pages_in_the_worker(tmp_path):
+    calls = []
+
+    def pages():
+        calls.append(True)
+        return (np.eye(4, dtype=np.uint16) * i for i in range(2))
+
+    path, count = submit_export(str(tmp_path / "bg.tiff"), pages).result(timeout=10)
+    assert calls and count == 2 and len(read_pages(path)) == 2
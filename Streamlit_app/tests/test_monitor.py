@@ -0,0 +1,38 @@
+import numpy as np
+import pytest
+
+from monitor import RingBuffer, decimate
+
+def fill(buffer, start, n):
+    t = np.arange(start, start + n, dtype=np.float64)
+    buffer.extend(t, t.astype(np.float32))
+
+def test_buffer_keeps_everything_until_full():
+    buffer = RingBuffer(10)
+    fill(buffer, 0, 4)
+    fill(buffer, 4, 3)
+    times, values = buffer.ordered()
+    assert len(buffer) == 7 and np.array_equal(times, np.arange(7)) and np.array_equal(values, np.arange(7))
+
+@pytest.mark.parametrize("batches", [[7, 7], [3, 3, 3, 3, 3], [10, 1], [9, 25], [25]])
+def test_buffer_wraps_to_the_newest_samples(batches):
+    buffer = RingBuffer(10)
+    start = 0
+    for n in batches:
+        fill(buffer, start, n)
+        start += n
+    times, values = buffer.ordered()
+    assert len(buffer) == 10 and buffer.total == start
+    assert np.array_equal(times, np.arange(start - 10, start)) and np.array_equal(values, times)
+
+def test_ordered_returns_copies():
+    buffer = RingBuffer(4)
+    fill(buffer, 0, 6)
+    times, _ = buffer.ordered()
+    times[:] = -1
+    assert np.array_equal(buffer.ordered()[0], [2, 3, 4, 5])
+
+def test_decimate_keeps_the_newest_blocks():
+    assert np.array_equal(decimate(np.arange(10.0), 20), np.arange(10.0))
+    # Blocks of 4; the oldest 2 samples do not fill one and are dropped
+    assert np.array_equal(decimate(np.arange(10.0), 3), [3.5, 7.5])
@@ -0,0 +1,31 @@
+import numpy as np
+import pytest
+
+from mosaic import load_pyramid, read_view, stitch, write_pyramid
+
+def scan(xs, xe, ys, ye, data):
+    return {"xs": xs, "xe": xe, "ys": ys, "ye": ye, "filename": f"scan_{xs}_{ys}.txt"}, data
+
+def test_side_by_side_scans_fill_the_mosaic():
+    left = scan(-1.0, 0.0, 0.0, 1.0, np.full((11, 11), 1.0))
+    right = scan(0.0, 1.0, 0.0, 1.0, np.full((11, 11), 3.0))
+    mosaic, grid = stitch([left, right])
+    assert (grid["height"], grid["width"]) == (11, 21)
+    assert np.all(np.isfinite(mosaic))
+    assert mosaic[5, 0] == pytest.approx(1.0) and mosaic[5, -1] == pytest.approx(3.0)
+
+@pytest.mark.parametrize("xs, xe, ys, ye, shape", [(0.5, 0.5, -1.0, 1.0, (10, 10)),
+                                                   (-1.0, 1.0, 0.2, 0.2, (10, 10)),
+                                                   (-1.0, 1.0, -1.0, 1.0, (1, 1))])
+def test_scan_without_area_is_rejected(xs, xe, ys, ye, shape):
+    good = scan(-1.0, 1.0, -1.0, 1.0, np.ones((10, 10)))
+    with pytest.raises(ValueError, match="covers no area"):
+        stitch([good, scan(xs, xe, ys, ye, np.ones(shape))])
+
+def test_pyramid_views_match_the_mosaic(tmp_path):
+    mosaic = np.arange(300 * 520, dtype=np.float32).reshape(300, 520)
+    grid = {"x0": 0.0, "y0": 0.0, "dx": 0.01, "dy": 0.01, "width": 520, "height": 300, "coarsened": 1.0}
+    info = write_pyramid(mosaic, grid, str(tmp_path), tile=128)
+    assert load_pyramid(str(tmp_path))["levels"] == info["levels"] == 4
+    view, bounds = read_view(str(tmp_path), info, 0, 100, 260, 120, 400)
+    assert bounds == (100, 260, 120, 400) and np.array_equal(view, mosaic[100:260, 120:400])
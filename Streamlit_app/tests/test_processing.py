@@ -0,0 +1,43 @@
+import threading
+
+import numpy as np
+
+import processing
+from processing import bin_pixels, run_pipeline
+
+STEPS = [("Hot-pixel removal", {}), ("Gaussian smoothing", {"sigma": 1.0})]
+
+def test_cached_pipeline_matches_a_fresh_run():
+    a = np.random.default_rng(0).poisson(5, (64, 64))
+    first = run_pipeline(a, STEPS)
+    processing._cache.clear()
+    assert np.array_equal(run_pipeline(a, STEPS), first)
+    # The second call resumes from the cached result and returns the same object
+    assert run_pipeline(a, STEPS) is run_pipeline(a, STEPS)
+
+def test_binning_sums_blocks():
+    a = np.arange(16.0).reshape(4, 4)
+    assert np.array_equal(bin_pixels(a, 2), [[10, 18], [42, 50]])
+
+def test_cache_bytes_stay_consistent_under_concurrent_sessions(monkeypatch):
+    monkeypatch.setattr(processing, "CACHE_LIMIT_BYTES", 40 * 32 * 32 * 8)
+    processing._cache.clear()
+    monkeypatch.setattr(processing, "_cache_bytes", 0)
+    images = [np.random.default_rng(i).poisson(5, (32, 32)) for i in range(20)]
+    errors = []
+
+    def session(offset):
+        try:
+            for n in range(200):
+                run_pipeline(images[(n + offset) % len(images)], STEPS[:1 + n % 2])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(i,)) for i in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert processing._cache_bytes == sum(v.nbytes for v in processing._cache.values())
+    assert processing._cache_bytes <= processing.CACHE_LIMIT_BYTES
@@ -0,0 +1,26 @@
+import numpy as np
+import pytest
+
+from registration import reference_spectrum, register
+
+def blobs(shape=(64, 64), shift=(0.0, 0.0), seed=0):
+    rng = np.random.default_rng(seed)
+    yy, xx = np.mgrid[:shape[0], :shape[1]]
+    image = np.zeros(shape)
+    for y, x in rng.uniform(10, 54, size=(12, 2)):
+        image += np.exp(-((yy - y - shift[0]) ** 2 + (xx - x - shift[1]) ** 2) / 8.0)
+    return image
+
+@pytest.mark.parametrize("shift", [(0.0, 0.0), (3.0, -2.0), (-4.5, 1.25)])
+def test_recovers_known_shifts(shift):
+    stack = np.stack([blobs(), blobs(shift=shift)])
+    shifts, aligned, _ = register(stack, whitening=1.0)
+    assert np.allclose(shifts[0], 0.0, atol=0.1)
+    assert np.allclose(shifts[1], shift, atol=0.1)
+    assert np.abs(aligned[1] - aligned[0]).max() < 0.1
+
+def test_overwritten_reference_is_not_served_stale():
+    first, second = blobs(seed=1), blobs(seed=2)
+    spec = reference_spectrum(first, key=("ref.txt", (64, 64)))
+    assert reference_spectrum(first, key=("ref.txt", (64, 64))) is spec
+    assert not np.allclose(reference_spectrum(second, key=("ref.txt", (64, 64))), spec)
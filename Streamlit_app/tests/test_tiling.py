@@ -0,0 +1,68 @@
+import threading
+import time
+
+import numpy as np
+import pytest
+
+from acquisition import make_job, run_tiled, split_tiles
+
+def coverage(job, tiles):
+    covered = np.zeros((job["step"], job["step"]), dtype=int)
+    for r0, c0, tile in tiles:
+        covered[r0:r0 + tile["step"], c0:c0 + tile["step"]] += 1
+    return covered
+
+@pytest.mark.parametrize("step", [25, 50, 100, 126, 127, 150, 200, 1000])
+@pytest.mark.parametrize("devices", [1, 2, 3, 4, 5, 9])
+def test_tiles_cover_every_pixel_once(step, devices):
+    job = make_job(1.0, 1.0, -1.0, -1.0, step, 1.0)
+    tiles = split_tiles(job, devices)
+    assert np.all(coverage(job, tiles) == 1)
+    assert all(tile["step"] >= 25 or len(tiles) == 1 for _, _, tile in tiles)
+
+def test_uneven_step_is_split_on_a_divisor():
+    tiles = split_tiles(make_job(1.0, 1.0, -1.0, -1.0, 126, 1.0), 2)
+    assert len(tiles) == 4 and {t["step"] for _, _, t in tiles} == {63}
+
+def test_prime_step_stays_one_tile():
+    job = make_job(1.0, 1.0, -1.0, -1.0, 127, 1.0)
+    assert [(r0, c0, t["step"]) for r0, c0, t in split_tiles(job, 4)] == [(0, 0, 127)]
+
+def test_tile_voltages_come_from_the_parent_grid():
+    job = make_job(1.0, 1.0, -1.0, -1.0, 100, 1.0)
+    x = np.linspace(1.0, -1.0, 100)
+    for r0, c0, tile in split_tiles(job, 4):
+        assert tile["xs"] == round(float(x[c0]), 6) and tile["xe"] == round(float(x[c0 + tile["step"] - 1]), 6)
+
+def test_merged_tiles_match_a_whole_scan():
+    job = make_job(1.0, 1.0, -1.0, -1.0, 100, 1.0)
+    full = np.arange(100 * 100, dtype=np.uint32).reshape(100, 100)
+
+    def run(tile, serial=None):
+        c0 = int(round((1.0 - tile["xs"]) / 2 * 99))
+        r0 = int(round((1.0 - tile["ys"]) / 2 * 99))
+        return full[r0:r0 + tile["step"], c0:c0 + tile["step"]]
+
+    assert np.array_equal(run_tiled(job, ["a", "b"], run=run), full)
+
+def test_failed_tile_stops_the_other_devices():
+    job = make_job(1.0, 1.0, -1.0, -1.0, 100, 1.0)
+    started, lock = [], threading.Lock()
+
+    def run(tile, serial=None):
+        with lock:
+            started.append(serial)
+        time.sleep(0.05)
+        if serial == "bad":
+            raise OSError("device unplugged")
+        return np.zeros((tile["step"], tile["step"]), dtype=np.uint32)
+
+    before = threading.active_count()
+    with pytest.raises(RuntimeError, match="device bad"):
+        run_tiled(job, ["good", "bad"], run=run)
+    count = len(started)
+    time.sleep(0.2)
+    # No tile starts after the error, the failed device takes no more, and no worker is left running
+    assert len(started) == count
+    assert started.count("bad") == 1
+    assert threading.active_count() == before
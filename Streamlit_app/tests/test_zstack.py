@@ -0,0 +1,45 @@
+import os
+from datetime import datetime
+
+import numpy as np
+
+import zstack
+from scan_io import parse_filename_3d
+from zstack import group_stacks, open_volume
+
+def name(z, when, xs=0.5, step=4):
+    return f"scan_xs-{xs}_ys-0.5_xe--0.5_ye--0.5_step-{step}_dw-1.0_z-{z}_{when:%Y%m%d_%H%M%S}.txt"
+
+def metas(*names):
+    return [parse_filename_3d(n) for n in names]
+
+def test_slices_of_one_window_form_a_stack_sorted_by_z():
+    t = datetime(2025, 1, 1, 12, 0, 0)
+    stacks = group_stacks(metas(name(2.0, t.replace(second=2)), name(0.0, t), name(1.0, t.replace(second=1))))
+    assert [[m["z"] for m in s] for s in stacks] == [[0.0, 1.0, 2.0]]
+
+def test_different_windows_are_different_stacks():
+    t = datetime(2025, 1, 1, 12, 0, 0)
+    stacks = group_stacks(metas(name(0.0, t), name(0.0, t, xs=0.6), name(0.0, t, step=8)))
+    assert len(stacks) == 3
+
+def test_a_repeated_z_starts_a_new_stack():
+    t = datetime(2025, 1, 1, 12, 0, 0)
+    run = [name(z, t.replace(minute=m, second=int(z))) for m in (0, 5) for z in (0.0, 1.0)]
+    stacks = group_stacks(metas(*reversed(run)))
+    assert [[m["filename"] for m in s] for s in stacks] == [run[:2], run[2:]]
+
+def test_volume_is_converted_once_and_rebuilt_when_a_slice_changes(tmp_path, monkeypatch):
+    monkeypatch.setattr(zstack, "CACHE_DIR", str(tmp_path / "cache"))
+    t = datetime(2025, 1, 1, 12, 0, 0)
+    stack = group_stacks(metas(*(name(float(z), t.replace(second=z)) for z in range(3))))[0]
+    for z, meta in enumerate(stack):
+        np.savetxt(tmp_path / meta["filename"], np.full((4, 4), z), fmt="%d")
+    vol = open_volume(str(tmp_path), stack)
+    assert vol.shape == (3, 4, 4) and np.array_equal(vol[:, 0, 0], [0, 1, 2])
+    assert len(os.listdir(tmp_path / "cache")) == 1
+
+    changed = tmp_path / stack[1]["filename"]
+    np.savetxt(changed, np.full((4, 4), 7), fmt="%d")
+    os.utime(changed, (os.path.getmtime(changed) + 10,) * 2)
+    assert open_volume(str(tmp_path), stack)[1, 0, 0] == 7
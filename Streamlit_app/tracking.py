@@ -0,0 +1,95 @@
+"""Emitter tracking: re-centre on a drifting emitter with small local scans.
+
+A parked emitter drifts off the spot within minutes. Instead of a
+full-field rescan, ``track_position`` scans a small window (7x7 pixels by
+default) around the last position and fits a 2D Gaussian to it with the
+batched fitter from localization.py; at 1 ms dwell that is under 0.1 s of
+scanning. ``Tracker.refocus`` scans the same window at three stage heights,
+fits all three at once and moves the Kinesis stage to the brightest.
+"""
+import time
+
+import numpy as np
+
+from acquisition import make_job, run_scan
+from localization import fit_gaussians
+from runner import connect_stage
+
+TRACK_SIZE = 7      # pixels per side of the local scan
+TRACK_SPAN = 0.1    # volts across the local scan
+MIN_SNR = 3.0       # fitted amplitude over the background's shot noise; weaker fits are not followed
+STAGE_TIMEOUT = 60000
+
+def local_job(x, y, span=TRACK_SPAN, size=TRACK_SIZE, dw=1.0):
+    half = span / 2
+    return make_job(round(x - half, 6), round(y - half, 6), round(x + half, 6), round(y + half, 6), size, dw,
+                    prefix="track")
+
+def fit_peaks(images, job):
+    """Gaussian fits of (K, size, size) local scans of ``job``'s window, as
+    arrays of K: ``x``/``y``/``sigma`` in volts, ``amplitude``, ``background``
+    and ``ok`` (the peak is inside the window and above the noise)."""
+    p, _ = fit_gaussians(np.asarray(images, dtype=float))
+    step, half = job["step"], job["step"] // 2
+    dx = (job["xe"] - job["xs"]) / (step - 1)
+    dy = (job["ye"] - job["ys"]) / (step - 1)
+    ok = ((np.abs(p[:, 1]) <= half) & (np.abs(p[:, 2]) <= half) &
+          (p[:, 0] > MIN_SNR * np.sqrt(np.abs(p[:, 4]) + 1)))
+    return {"x": job["xs"] + dx * (half + p[:, 1]), "y": job["ys"] + dy * (half + p[:, 2]),
+            "amplitude": p[:, 0], "sigma": abs(dx) * p[:, 3], "background": p[:, 4], "ok": ok}
+
+def track_position(x, y, span=TRACK_SPAN, size=TRACK_SIZE, dw=1.0, run=run_scan):
+    """Scan around (x, y) and return the fitted emitter position (the old one when the fit fails)."""
+    job = local_job(x, y, span, size, dw)
+    fit = fit_peaks(run(job)[None], job)
+    ok = bool(fit["ok"][0])
+    return {"x": float(fit["x"][0]) if ok else x, "y": float(fit["y"][0]) if ok else y,
+            "amplitude": float(fit["amplitude"][0]), "ok": ok}
+
+class Tracker:
+    """Re-centres (and optionally refocuses) between measurement blocks.
+
+    ``interval`` is the block length in seconds. With ``stage_serial`` and
+    ``dz`` (stage steps) the Z stage is opened with ``runner.connect_stage``
+    and refocused around its current height after each lateral correction.
+    """
+
+    def __init__(self, span=TRACK_SPAN, size=TRACK_SIZE, dw=1.0, interval=30.0, stage_serial=None, dz=None,
+                 run=run_scan, log=print):
+        self.span, self.size, self.dw, self.interval, self.dz, self.run = span, size, dw, interval, dz, run
+        self.device = self.z = None
+        if stage_serial is not None and dz:
+            self.device, self.chan = connect_stage(stage_serial)
+            self.z = self.device.GetPosition(self.chan)
+            log(f"Z stage connected at Z = {self.z}")
+
+    def update(self, x, y):
+        """One tracking step from (x, y): the new position, fit quality and scan time."""
+        t = time.perf_counter()
+        result = track_position(x, y, self.span, self.size, self.dw, self.run)
+        if self.device is not None and result["ok"]:
+            self.refocus(result["x"], result["y"])
+        return {**result, "z": self.z, "seconds": time.perf_counter() - t}
+
+    def refocus(self, x, y):
+        z, dz = self.z, self.dz
+        job = local_job(x, y, self.span, self.size, self.dw)
+        images = []
+        for h in (z - dz, z, z + dz):
+            self.device.MoveTo(self.chan, int(h), STAGE_TIMEOUT)
+            images.append(self.run(job))
+        fit = fit_peaks(np.stack(images), job)
+        a = np.where(fit["ok"], fit["amplitude"], 0.0)
+        if a.max() > 0:
+            # Vertex of the parabola through the three amplitudes, kept within the bracket
+            curvature = a[0] - 2 * a[1] + a[2]
+            shift = 0.5 * (a[0] - a[2]) / curvature if curvature < 0 else float(np.argmax(a) - 1)
+            z = int(round(z + dz * np.clip(shift, -1.0, 1.0)))
+        self.device.MoveTo(self.chan, int(z), STAGE_TIMEOUT)
+        self.z = z
+        return z
+
+    def close(self):
+        if self.device is not None:
+            self.device.StopPolling(); self.device.Disconnect()
+            self.device = None
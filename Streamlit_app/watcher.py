@@ -0,0 +1,140 @@
+"""Live index of the scan files in a folder.
+
+``watch(folder)`` returns the index of ``folder``, shared by every browser
+session. With the optional ``watchdog`` package the OS reports each file
+that is created, changed, moved or deleted; without it ``poll()`` stats
+the folder itself and only lists it again when its modification time
+moved (a file was added, removed or renamed). Either way only the names
+that changed are parsed, and an unchanged folder costs at most one stat.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from types import SimpleNamespace
+
+import drivers
+from scan_io import SCAN_EXTENSIONS, parse_scan_name, shadowed
+
+MAX_WATCHED = 8      # folders watched at once; the least recently used one is dropped
+SETTLE_NS = 2 * 10 ** 9  # list a folder again while its mtime is this recent (coarse mtime clocks)
+
+def _load_watchdog():
+    from watchdog.events import FileSystemEventHandler
+    from watchdog.observers import Observer
+    return SimpleNamespace(Observer=Observer, FileSystemEventHandler=FileSystemEventHandler)
+
+drivers.register("watchdog", _load_watchdog)
+
+class ScanIndex:
+    def __init__(self, folder):
+        self.folder = folder
+        self.version = 0
+        self._lock = threading.Lock()
+        self._metas = {}       # filename -> parsed metadata, None for files that are not scans
+        self._pending = set()  # names reported by watchdog, not applied yet
+        self._mtime = None
+        self._cache = {}
+        self._observer = self._start_observer()
+
+    def _start_observer(self):
+        try:
+            wd = drivers.load("watchdog")
+        except drivers.DriverUnavailable:
+            return None
+        index = self
+
+        class Handler(wd.FileSystemEventHandler):
+            def on_any_event(self, event):
+                if event.is_directory or event.event_type not in ("created", "deleted", "moved", "modified", "closed"):
+                    return
+                names = {os.path.basename(p) for p in (event.src_path, getattr(event, "dest_path", "")) if p}
+                names = {n for n in names if n.endswith(SCAN_EXTENSIONS)}
+                if names:
+                    with index._lock:
+                        index._pending |= names
+
+        observer = wd.Observer()
+        try:
+            observer.schedule(Handler(), self.folder, recursive=False)
+            observer.daemon = True
+            observer.start()
+        except OSError:
+            return None
+        return observer
+
+    @property
+    def live(self):
+        """True when the OS reports changes (watchdog), False when the folder is polled."""
+        return self._observer is not None and self._observer.is_alive()
+
+    def _parse(self, names):
+        # Parse just these names; non-scan files are remembered as None so they are not parsed again
+        changed = False
+        for name in names:
+            if os.path.isfile(os.path.join(self.folder, name)):
+                meta = self._metas[name] = parse_scan_name(name)
+                changed |= meta is not None  # rewritten in place counts too, so views reload it
+            else:
+                changed |= self._metas.pop(name, None) is not None
+        return changed
+
+    def _rescan(self, force):
+        # Polling: list the folder again only when its mtime moved
+        try:
+            mtime = os.stat(self.folder).st_mtime_ns
+        except OSError:
+            mtime = None
+        if mtime is not None and mtime == self._mtime and not force:
+            return False
+        # A name created within the mtime clock's resolution could be missed, so a
+        # recently changed folder is listed again on the next poll
+        self._mtime = mtime if mtime is not None and time.time_ns() - mtime > SETTLE_NS else None
+        try:
+            listing = {e.name for e in os.scandir(self.folder) if e.name.endswith(SCAN_EXTENSIONS)}
+        except OSError:
+            listing = set()
+        removed = [self._metas.pop(name) for name in [n for n in self._metas if n not in listing]]
+        changed = any(meta is not None for meta in removed)
+        return self._parse(listing if force else listing - self._metas.keys()) or changed
+
+    def poll(self, force=False):
+        """Apply what changed since the last call. Returns ``version``, which
+        goes up whenever the listed scans (or their contents) changed."""
+        with self._lock:
+            if self.live and self._mtime is not None and not force:
+                names, self._pending = self._pending, set()
+                changed = self._parse(names)
+            else:
+                self._pending.clear()
+                changed = self._rescan(force)
+            if changed:
+                self.version += 1
+                self._cache.clear()
+            return self.version
+
+    def scans(self, three_d=False):
+        """Same as ``scan_io.list_scans(folder, three_d)``, from the index."""
+        with self._lock:
+            if three_d not in self._cache:
+                names = self._metas.keys()
+                self._cache[three_d] = [meta for name, meta in self._metas.items() if meta is not None
+                                        and ("_z-" in name) == three_d and not shadowed(name, names)]
+            return self._cache[three_d]
+
+    def close(self):
+        if self._observer is not None:
+            self._observer.stop()
+
+# --- One index per folder for the whole process ---
+_indexes = OrderedDict()
+_indexes_lock = threading.Lock()
+
+def watch(folder):
+    key = os.path.abspath(folder)
+    with _indexes_lock:
+        index = _indexes.pop(key, None) or ScanIndex(key)
+        _indexes[key] = index
+        while len(_indexes) > MAX_WATCHED:
+            _indexes.popitem(last=False)[1].close()
+    return index
@@ -0,0 +1,122 @@
+import hashlib
+import os
+
+import numpy as np
+
+from batch import load_scan_file
+
+# Converted volumes go to the user's cache folder, not next to the data, and the least
+# recently opened are evicted once they take more than MAX_CACHE_BYTES
+CACHE_DIR = os.environ.get("QSCOPE_CACHE_DIR") or os.path.join(
+    os.environ.get("LOCALAPPDATA") or os.path.join(os.path.expanduser("~"), ".cache"), "qscope", "zstack")
+MAX_CACHE_BYTES = 4 * 2 ** 30
+STACK_KEYS = ["prefix", "xs", "ys", "xe", "ye", "step", "dwell"]
+
+# --- Function to group `_z-` files into stacks ---
+def group_stacks(metas):
+    """Group parsed 3D filenames into stacks, each a list of metas sorted by z.
+
+    Files with the same scan window belong together; a repeated z value
+    (in time order) starts a new stack, so re-runs of the same 3D scan
+    stay separate.
+    """
+    groups = {}
+    for meta in sorted(metas, key=lambda m: m["timestamp"]):
+        runs = groups.setdefault(tuple(meta[k] for k in STACK_KEYS), [[]])
+        if any(m["z"] == meta["z"] for m in runs[-1]):
+            runs.append([])
+        runs[-1].append(meta)
+    return [sorted(run, key=lambda m: m["z"]) for runs in groups.values() for run in runs]
+
+def stack_label(stack):
+    first = stack[0]
+    return (f"{first['prefix']} X {first['xs']}..{first['xe']} Y {first['ys']}..{first['ye']} "
+            f"step {first['step']}, {len(stack)} slices, {first['timestamp']:%Y-%m-%d %H:%M}")
+
+def _stack_key(folder, stack):
+    h = hashlib.blake2b(digest_size=12)
+    h.update(os.path.abspath(folder).encode())  # one cache serves every data folder
+    for meta in stack:
+        path = os.path.join(folder, meta["filename"])
+        h.update(f"{meta['filename']}:{os.path.getmtime(path)}".encode())
+    return h.hexdigest()
+
+# --- Function to open a stack as a memory-mapped (Z, Y, X) volume ---
+def open_volume(folder, stack):
+    """Return a read-only memmap of the stack, converting the text slices once.
+
+    The .npy volume lives in ``CACHE_DIR`` and is rebuilt only when a
+    slice file changes, one slice at a time so the whole volume is never
+    held in memory.
+    """
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    path = os.path.join(CACHE_DIR, _stack_key(folder, stack) + ".npy")
+    if os.path.exists(path):
+        os.utime(path)  # the mtime orders eviction
+    else:
+        first = load_scan_file(os.path.join(folder, stack[0]["filename"]))
+        tmp = path + ".tmp"
+        vol = np.lib.format.open_memmap(tmp, mode="w+", dtype=np.float32, shape=(len(stack),) + first.shape)
+        vol[0] = first
+        for i, meta in enumerate(stack[1:], start=1):
+            vol[i] = load_scan_file(os.path.join(folder, meta["filename"]))
+        vol.flush()
+        del vol
+        os.replace(tmp, path)
+        evict_cache(keep=path)
+    return np.load(path, mmap_mode="r")
+
+def evict_cache(max_bytes=None, keep=None):
+    """Delete the least recently opened volumes (and their projections) until the cache fits
+    ``max_bytes`` (default ``MAX_CACHE_BYTES``)."""
+    max_bytes = MAX_CACHE_BYTES if max_bytes is None else max_bytes
+    try:
+        entries = [e for e in os.scandir(CACHE_DIR) if e.name.endswith(".npy")]
+    except OSError:
+        return
+    sizes = {}
+    for e in entries:
+        mip = e.path[:-4] + "_mip.npz"
+        sizes[e.path] = e.stat().st_size + (os.path.getsize(mip) if os.path.exists(mip) else 0)
+    total = sum(sizes.values())
+    for e in sorted(entries, key=lambda e: e.stat().st_mtime):
+        if total <= max_bytes:
+            break
+        if e.path == keep:
+            continue
+        try:
+            os.remove(e.path)
+            if os.path.exists(e.path[:-4] + "_mip.npz"):
+                os.remove(e.path[:-4] + "_mip.npz")
+        except OSError:
+            continue  # still mapped by another session (Windows)
+        total -= sizes[e.path]
+
+# --- Orthogonal slices: each reads only the plane it needs from the memmap ---
+def xy_slice(vol, z):
+    return np.asarray(vol[z])
+
+def xz_slice(vol, y):
+    return np.asarray(vol[:, y, :])
+
+def yz_slice(vol, x):
+    return np.asarray(vol[:, :, x])
+
+# --- Maximum-intensity projections, computed once per volume and cached ---
+def projections(vol):
+    path = vol.filename[:-4] + "_mip.npz"
+    if os.path.exists(path):
+        with np.load(path) as f:
+            return {k: f[k] for k in f.files}
+    # Stream slice by slice so only one plane is in memory at a time
+    xy = np.full(vol.shape[1:], -np.inf, dtype=np.float32)
+    xz = np.empty((vol.shape[0], vol.shape[2]), dtype=np.float32)
+    yz = np.empty((vol.shape[0], vol.shape[1]), dtype=np.float32)
+    for z in range(vol.shape[0]):
+        plane = np.asarray(vol[z])
+        np.maximum(xy, plane, out=xy)
+        xz[z] = plane.max(axis=0)
+        yz[z] = plane.max(axis=1)
+    mips = {"xy": xy, "xz": xz, "yz": yz}
+    np.savez(path, **mips)
+    return mips